@@ -20,11 +20,70 @@ class Config:
     SESSION_USE_SIGNER = True  # 为session id进行签名
     SESSION_REDIS = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT)  # 保存session数据的redis配置
     PERMANENT_SESSION_LIFETIME = 86400  # session数据的有效期秒
+    SESSION_KEY_PREFIX = "session:"  # session数据在redis中的键前缀
+    # 登录后额外签发无状态的签名令牌，login_required校验令牌即可，不再访问redis
+    # 令牌在有效期内无法从服务端吊销，退出登录只删除客户端的cookie
+    SESSION_STATELESS_AUTH = False
+    SESSION_AUTH_COOKIE_NAME = "auth_token"
+
+    # 不带版本号的静态文件(如favicon.ico)的浏览器缓存时间，单位：秒
+    STATIC_FILE_MAX_AGE = 86400
+    # 构建后带内容哈希的js/css的浏览器缓存时间，单位：秒
+    DIST_FILE_MAX_AGE = 31536000
+    # 存在构建清单(python manage.py assets build)时使用合并压缩后的静态资源
+    ASSETS_USE_MANIFEST = True
+
+    # 密码加密算法与迭代次数，修改后旧密码在用户下次登录时自动按新算法重新加密
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:50000"
+    # 密码加密/校验进程池的大小，0表示在请求线程中直接计算
+    PASSWORD_POOL_PROCESSES = 0
+    # 进程池中最多排队的任务数，超出时直接返回服务器繁忙
+    PASSWORD_POOL_MAX_PENDING = 64
+    # 等待进程池计算结果的超时时间，单位：秒
+    PASSWORD_POOL_TIMEOUT = 5
+    # 是否对登录、发送短信验证码等接口限流，性能测试登录吞吐量时临时关闭
+    RATE_LIMIT_ENABLED = True
+
+    # 图片验证码渲染进程池的大小，0表示在请求线程中直接渲染
+    CAPTCHA_POOL_PROCESSES = 0
+
+    # 下单后超过多少小时房东仍未接单，订单自动取消，释放预订的日期，单位：小时
+    ORDER_WAIT_ACCEPT_HOURS = 24
+    # 订单定时任务(python manage.py orders scheduler)的执行间隔，单位：秒
+    ORDER_SCHEDULER_INTERVAL = 300
+    # 定时任务每批修改的订单数
+    ORDER_SCHEDULER_BATCH_SIZE = 1000
+    # 订单定时任务从mysql重建房屋统计的间隔，发布房屋时的增量更新不包含删除房屋与修改价格，单位：秒，0表示不重建
+    HOUSE_STATS_REBUILD_INTERVAL = 3600
+    # 房东待接单收件箱长轮询的最长等待时间，单位：秒，需要小于前端代理的超时时间
+    # 等待期间请求一直占用一个worker，同步worker时在线的房东数不能超过worker数，
+    # 否则设为0，不等待立即返回，由前端定时轮询
+    LANDLORD_INBOX_POLL_TIMEOUT = 25
+
+    # 抽样记录热点请求的比例，缓存预热(python manage.py cache warm)时优先请求记录的地址
+    CACHE_HOT_URLS_SAMPLE_RATE = 0.01
+    # 最多记录的热点请求地址数
+    CACHE_HOT_URLS_MAX = 1000
+    # 热点请求地址的备份文件，redis被清空后预热时从这里读取
+    CACHE_HOT_URLS_FILE = "logs/hot_urls"
+    # 缓存键访问频率的抽样比例，与每个进程把计数合并到redis的间隔，单位：秒
+    HOT_KEYS_SAMPLE_RATE = 0.1
+    HOT_KEYS_FLUSH_INTERVAL = 10
+    # 可以查看热点缓存键等管理接口的用户编号
+    ADMIN_USER_IDS = ()
+    # 缓存预热的并发请求数，不要超过mysql能承受的并发查询数
+    CACHE_WARM_CONCURRENCY = 8
+    # 缓存预热时请求详情的房屋数，按完成订单数从高到低
+    CACHE_WARM_TOP_HOUSES = 100
+    # 房屋详情缓存使用紧凑编码(去掉图片域名前缀，较大时压缩)，关闭后写入普通json，两种格式都可以读取
+    HOUSE_DETAIL_CACHE_COMPACT = True
 
 
 class DevelopmentConfig(Config):
     """开发模式的配置参数"""
     DEBUG = True
+    # 开发时直接使用源文件，修改js/css后不需要重新构建
+    ASSETS_USE_MANIFEST = False
 
 
 class ProductionConfig(Config):
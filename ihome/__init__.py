@@ -8,6 +8,7 @@ from flask_wtf import CSRFProtect
 from flask_session import Session
 from config import config, Config
 from utils.commons import RegexConverter
+from utils.session import LazyRedisSessionInterface
 from logging.handlers import RotatingFileHandler
 
 # 创建数据库对象
@@ -46,6 +47,11 @@ def create_app(config_name):
 
     # 使用flask-session扩展，用redis保存app的session数据
     Session(app)
+    # 替换为按需加载、修改后才写回的session接口，不使用session的请求不访问redis
+    app.session_interface = LazyRedisSessionInterface(
+        app.config["SESSION_REDIS"], app.config["SESSION_KEY_PREFIX"],
+        app.config["SESSION_USE_SIGNER"], app.config.get("SESSION_PERMANENT", True),
+        app.config["SESSION_AUTH_COOKIE_NAME"] if app.config.get("SESSION_STATELESS_AUTH") else None)
 
     # 为app添加api蓝图应用
     from .api_1_0 import api as api_1_0_blueprint
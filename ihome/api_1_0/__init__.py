@@ -1,10 +1,11 @@
 # -*- coding:utf-8 -*-
 
-from flask import Blueprint
+from flask import Blueprint, request
+from ihome.utils import hot_urls
 
 api = Blueprint('api', __name__)
 
-from . import register,passport,house,orders
+from . import register,passport,house,orders,admin
 
 
 @api.after_request
@@ -13,6 +14,9 @@ def after_request(response):
     # 如果响应报文response的Content-Type是以text开头，则将其改为默认的json类型
     if response.headers.get("Content-Type").startswith("text"):
         response.headers["Content-Type"] = "application/json"
+    # 抽样记录会被缓存的接口的请求地址，用于缓存预热
+    if request.method == "GET" and response.status_code == 200 and request.endpoint in hot_urls.CACHED_ENDPOINTS:
+        hot_urls.maybe_record(request.full_path.rstrip("?"))
     return response
 
 
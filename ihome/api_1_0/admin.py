@@ -0,0 +1,28 @@
+# -*- coding:utf-8 -*-
+
+from flask import g, jsonify, request, current_app
+from ihome.utils.commons import login_required
+from ihome.utils.response_code import RET
+from ihome.utils import hot_keys
+from . import api
+
+
+@api.route("/admin/hot_keys", methods=["GET"])
+@login_required
+def get_hot_keys():
+    """当前与上一个时间窗口中估计访问次数最多的缓存键，只有配置的管理员可以查看"""
+    if int(g.user_id) not in current_app.config["ADMIN_USER_IDS"]:
+        return jsonify(errno=RET.ROLEERR, errmsg="没有权限")
+    try:
+        count = int(request.args.get("k", 20))
+        assert 0 < count <= 1000
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
+    try:
+        ranked = hot_keys.top(count)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR, errmsg="查询热点缓存键失败")
+    keys = [{"key": key, "accesses": accesses} for key, accesses in ranked]
+    return jsonify(errno=RET.OK, errmsg="OK", data={"keys": keys})
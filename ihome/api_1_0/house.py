@@ -11,9 +11,11 @@ from ihome.models import Area,House,Facility,HouseImage,User,Order
 # 导入自定义的状态码
 from ihome.utils.response_code import RET
 # 导入登陆验证装饰器
-from ihome.utils.commons import login_required
+from ihome.utils.commons import login_required,get_login_user
 # 导入七牛云
 from ihome.utils.image_storage import storage
+# 导入房屋列表缓存,房屋占用日期的过滤
+from ihome.utils import list_cache,availability,search,locations,ranking,house_stats,hot_keys,house_cache
 # 导入json模块
 import json
 # 导入datetime模块,对日期进行格式转换
@@ -129,6 +131,16 @@ def save_house_info():
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DATAERR,errmsg='价格转换错误')
+    # 房屋位置是可选的,经度和纬度需要同时填写
+    longitude = house_data.get('longitude')
+    latitude = house_data.get('latitude')
+    if longitude is not None or latitude is not None:
+        try:
+            longitude,latitude = float(longitude),float(latitude)
+            assert locations.valid_location(longitude,latitude)
+        except Exception as e:
+            current_app.logger.error(e)
+            return jsonify(errno=RET.PARAMERR,errmsg='房屋位置错误')
     # 构造模型类对象,准备存储房屋数据
     house = House()
     house.user_id = user_id
@@ -144,17 +156,24 @@ def save_house_info():
     house.deposit = deposit
     house.min_days = min_days
     house.max_days = max_days
+    house.longitude = longitude
+    house.latitude = latitude
     # 尝试获取配套设施信息
     facility = house_data.get('facility')
     # 如果存在配套设施,需要对配套设施的编号进行过滤,确认配套设施存在
     if facility:
         try:
             facilities = Facility.query.filter(Facility.id.in_(facility)).all()
-            # 保存配套设施
-            house.facilities = facilities
         except Exception as e:
             current_app.logger.error(e)
             return jsonify(errno=RET.DBERR,errmsg='查询配套设施失败')
+        # 保存配套设施,同时保存设施位图,用于房屋详情与按设施搜索
+        try:
+            house.facility_mask = search.facility_mask([item.id for item in facilities])
+        except ValueError as e:
+            current_app.logger.error(e)
+            return jsonify(errno=RET.PARAMERR,errmsg='配套设施错误')
+        house.facilities = facilities
     # 提交数据到数据库中
     try:
         db.session.add(house)
@@ -163,6 +182,24 @@ def save_house_info():
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='保存房屋数据失败')
+    # 通知各进程的搜索索引加入新房屋
+    search.houses_changed([house.id])
+    # 带日期的房屋列表使用的排好序的房屋编号需要重新读取
+    try:
+        availability.discard_house_ids(area_id)
+    except Exception as e:
+        current_app.logger.error(e)
+    # 更新区域的房屋数量与价格统计
+    try:
+        house_stats.add_house(area_id,price)
+    except Exception as e:
+        current_app.logger.error(e)
+    # 写入房屋位置,用于附近房屋查询
+    if longitude is not None:
+        try:
+            locations.add_locations([(house.id,longitude,latitude)])
+        except Exception as e:
+            current_app.logger.error(e)
     # 返回结果house.id
     return jsonify(errno=RET.OK,errmsg='OK',data={'house_id':house.id})
 
@@ -220,10 +257,12 @@ def save_house_image(house_id):
     # 把房屋图片数据存入数据库会话对象中
     db.session.add(house_image)
     # 判断房屋主图片是否设置
-    if not house.index_image_url:
+    first_image = not house.index_image_url
+    if first_image:
         house.index_image_url = image_name
         # 把房屋图片数据存入数据库会话对象中
         db.session.add(house)
+    order_count = house.order_count
     # 提交数据到数据库中
     try:
         db.session.commit()
@@ -231,6 +270,12 @@ def save_house_image(house_id):
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='保存房屋图片失败')
+    # 设置了主图片的房屋才能在首页展示,加入首页排行
+    if first_image:
+        try:
+            ranking.add_house(house_id,order_count)
+        except Exception as e:
+            current_app.logger.error(e)
     # 拼接图片绝对路径
     image_url = constants.QINIU_DOMIN_PREFIX + image_name
     # 返回结果
@@ -274,7 +319,8 @@ def get_user_houses():
 @api.route('/houses/index',methods=['GET'])
 def get_houses_index():
     """
-    获取房屋首页幻灯片信息:缓存-----磁盘-----缓存
+    获取房屋首页幻灯片信息:排行-----缓存-----磁盘-----缓存
+    0/首页排行已建立时,从redis的有序集合中读取成交量最高的房屋,不需要查询mysql
     1/尝试从redis缓存中获取幻灯片数据
     2/校验结果,如果有数据,记录访问的时间,返回结果
     3/查询mysql数据库
@@ -287,6 +333,14 @@ def get_houses_index():
 
     :return:
     """
+    # 从首页排行中读取房屋信息,排行还没有建立时返回None
+    try:
+        houses_list = ranking.top_houses(constants.HOME_PAGE_MAX_HOUSES)
+    except Exception as e:
+        current_app.logger.error(e)
+        houses_list = None
+    if houses_list is not None:
+        return '{"errno":0,"errmsg":"OK","data":%s}' % json.dumps(houses_list)
     # 尝试从redis中获取房屋信息
     try:
         ret = redis_store.get('home_page_data')
@@ -299,8 +353,9 @@ def get_houses_index():
         return '{"errno":0,"errmsg":"OK","data":%s}' % ret
     # 查询mysql数据库
     try:
-        # 查询房屋表,默认按照成交量从高到低排序查询,返回五条数据
-        houses = House.query.order_by(House.order_count.desc()).limit(constants.HOME_PAGE_MAX_HOUSES)
+        # 查询设置了主图片的房屋,默认按照成交量从高到低排序查询,返回五条数据
+        houses = House.query.filter(House.index_image_url != '')\
+            .order_by(House.order_count.desc()).limit(constants.HOME_PAGE_MAX_HOUSES)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='获取房屋数据失败')
@@ -345,11 +400,14 @@ def get_house_detail(house_id):
     :return:
     """
     # 尝试获取用户身份,如果用户未登陆默认-1
-    user_id = session.get('user_id','-1')
+    user_id = get_login_user()[0]
+    if user_id is None:
+        user_id = '-1'
     # 校验house_id存在
     if not house_id:
         return jsonify(errno=RET.PARAMERR,errmsg='参数缺失')
-    # 根据house_id,尝试从redis获取房屋详情数据
+    # 根据house_id,尝试从redis获取房屋详情数据,抽样记录访问频率
+    hot_keys.record('house_info_%s' % house_id)
     try:
         ret = redis_store.get('house_info_%s' % house_id)
     except Exception as e:
@@ -358,6 +416,13 @@ def get_house_detail(house_id):
     # 判断结果,如果有数据,留下访问redis数据库的记录
     if ret:
         current_app.logger.info('hit house detail info redis')
+        try:
+            ret = house_cache.decode(ret)
+        except Exception as e:
+            # 无法解码的缓存按未命中处理，查询mysql后覆盖
+            current_app.logger.error(e)
+            ret = None
+    if ret:
         return '{"errno":0,"errmsg":"OK","data":{"user_id":%s,"house":%s}}' %(user_id,ret)
     # 查询mysql数据库,确认房屋的存在
     try:
@@ -376,9 +441,11 @@ def get_house_detail(house_id):
         return jsonify(errno=RET.DBERR,errmsg='获取房屋详情数据失败')
     # 序列化数据,转成json
     house_json = json.dumps(house_data)
-    # 把房屋详情数据存入到redis缓存中
+    # 把房屋详情数据存入到redis缓存中,有效期按访问频率调整
     try:
-        redis_store.setex('house_info_%s' % house_id,constants.HOUSE_DETAIL_REDIS_EXPIRE_SECOND,house_json)
+        redis_store.setex('house_info_%s' % house_id,
+                          hot_keys.adaptive_ttl('house_info_%s' % house_id,constants.HOUSE_DETAIL_REDIS_EXPIRE_SECOND),
+                          house_cache.encode_json(house_json))
     except Exception as e:
         current_app.logger.error(e)
     # 构造响应报文
@@ -400,7 +467,7 @@ def get_houses_list():
     4/对页数进行格式化转换,page = int(page)
     5/尝试从redis数据库中,获取房屋列表信息
     6/构造键:因为不同的页数和不同日期或区域,对应的是不同的房屋,需要使用hash数据类型
-    redis_key = 'houses_%s_%s_%s_%s' %(area_id,start_date_str,end_date_str,sort_key)
+    redis_key = list_cache.normalize_query(area_id,start_date,end_date,sort_key)
     7/判断获取结果,如果有数据,记录访问的的时间,直接返回
     8/查询mysql数据库
     9/定义容器,存储查询的过滤条件
@@ -418,12 +485,8 @@ def get_houses_list():
     14/对响应数据进行序列化,转成json,存入到缓存中
     resp_json = json.dumps(resp)
     15/判断用户请求的页数小于等于分页后的总页数
-    16/多条数据写入到redis数据库中,需要使用事务
-    pip = redis_store.pipeline()
-    pip.multi() 开启事务
-    pip.hset(redis_key,page,resp_json) # 存储数据
-    pip.expire(redis_key,过期时间) # 设置过期时间
-    pip.execute() # 执行事务
+    16/写入redis缓存,带日期的查询多次出现后才缓存,缓存键超出上限时淘汰最久未访问的
+    list_cache.set_page(redis_key,page,resp_json,是否带日期,出现次数)
     17/返回结果
     :return:
     """
@@ -450,16 +513,24 @@ def get_houses_list():
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.PARAMERR,errmsg='日期参数错误')
-    # 对页数进行格式化
+    # 对页数与区域编号进行格式化
     try:
         page = int(page)
+        assert page >= 1
+        if area_id:
+            area_id = int(area_id)
     except Exception as e:
         current_app.logger.error(e)
-        return jsonify(errno=RET.PARAMERR,errmsg='页数参数错误')
+        return jsonify(errno=RET.PARAMERR,errmsg='页数或区域参数错误')
+    # 未知的排序条件按默认的new处理
+    if sort_key not in list_cache.SORT_KEYS:
+        sort_key = 'new'
     # 尝试从redis中获取缓存的房屋列表信息,一个键对应多条数据的存储,需要使用hash数据类型
+    # 缓存键由规范化后的参数构造,同一查询的不同写法对应同一个键
+    redis_key = list_cache.normalize_query(area_id,start_date,end_date,sort_key)
+    hits = None
     try:
-        redis_key = 'houses_%s_%s_%s_%s' % (area_id,start_date_str,end_date_str,sort_key)
-        ret = redis_store.hget(redis_key,page)
+        ret,hits = list_cache.get_page(redis_key,page)
     except Exception as e:
         current_app.logger.error(e)
         ret = None
@@ -467,60 +538,85 @@ def get_houses_list():
     if ret:
         current_app.logger.info('hit houses list info redis')
         return ret
+    # 日期范围不太长且占用集合已建立时,使用占用集合过滤日期
+    use_availability = False
+    if start_date and end_date and (end_date - start_date).days < constants.HOUSE_LIST_FILTER_MAX_NIGHTS:
+        try:
+            use_availability = availability.is_ready()
+        except Exception as e:
+            current_app.logger.error(e)
+    # 不带日期时,房屋数量从统计中读取,分页不需要COUNT(*)
+    total_count = None
+    if not start_date and not end_date:
+        try:
+            if house_stats.is_ready():
+                total_count = house_stats.house_count(area_id)
+        except Exception as e:
+            current_app.logger.error(e)
     # 查询mysql数据库
     try:
-        # 存储查询的过滤条件
-        params_filter = []
-        # 判断区域信息存在
-        if area_id:
-            """
-            a=[1,2,3]
-            b=1
-            a.append(a==b)
-            a=[1,2,3,false]
-            b=[1,2,3]
-            a=[1,2,3,true]
-            """
-            params_filter.append(House.area_id == area_id) # 返回的是对象
-        # 对日期进行判断,如果用户选择了开始日期和结束日期
-        if start_date and end_date:
-            # 查询日期有冲突的订单信息
-            conflict_orders = Order.query.filter(Order.begin_date<=end_date,Order.end_date>=start_date).all()
-            # 遍历有冲突的订单,获取的是有冲突的房屋
-            conflict_houses_id = [order.house_id for order in conflict_orders]
-            # 判断有冲突的房屋如果存在
-            if conflict_houses_id:
-                # 对有冲突的房屋进行取反,获取不冲突的房屋
-                params_filter.append(House.id.notin_(conflict_houses_id))
-        # 如果用户只选择了开始日期
-        elif start_date:
-            # 查询有冲突的订单
-            conflict_orders = Order.query.filter(Order.end_date>=start_date).all()
-            # 获取有冲突的房屋
-            conflict_houses_id = [order.house_id for order in conflict_orders]
-            if conflict_houses_id:
-                params_filter.append(House.id.notin_(conflict_houses_id))
-        # 如果用户只选择了结束日期
-        elif end_date:
-            conflict_orders = Order.query.filter(Order.begin_date<=end_date).all()
-            conflict_houses_id = [order.house_id for order in conflict_orders]
-            if conflict_houses_id:
-                params_filter.append(House.id.notin_(conflict_houses_id))
-        # 判断排序条件,booking/price-inc/price-des/new
-        if 'booking' == sort_key:
-            houses = House.query.filter(*params_filter).order_by(House.order_count.desc())
-        elif 'price-inc' == sort_key:
-            houses = House.query.filter(*params_filter).order_by(House.price.asc())
-        elif 'price-des' == sort_key:
-            houses = House.query.filter(*params_filter).order_by(House.price.desc())
-        # 如果用户未选择排序条件,默认按照房屋发布时间进行排序
+        # 同时选择了开始和结束日期时,在缓存的排好序的房屋编号中跳过被占用的房屋,不需要查询订单
+        if use_availability:
+            page_ids,total_page = availability.available_page(area_id,sort_key,start_date,end_date,page,
+                                                               constants.HOUSE_LIST_PAGE_CAPACITY)
+            houses = dict((house.id,house) for house in House.query.filter(House.id.in_(page_ids))) \
+                if page_ids else {}
+            houses_list = [houses[house_id] for house_id in page_ids if house_id in houses]
         else:
-            houses = House.query.filter(*params_filter).order_by(House.create_time.desc())
-        # 对排序后的房屋数据进行分页,page表示页数/每页条目数/False分页发生异常不报错
-        houses_page = houses.paginate(page,constants.HOUSE_LIST_PAGE_CAPACITY,False)
-        # 获取分页后的房屋数据,以及分页后的总页数
-        houses_list = houses_page.items # 分页后的房屋数据
-        total_page = houses_page.pages # 分页后的总页数
+            # 存储查询的过滤条件
+            params_filter = []
+            # 判断区域信息存在
+            if area_id:
+                """
+                a=[1,2,3]
+                b=1
+                a.append(a==b)
+                a=[1,2,3,false]
+                b=[1,2,3]
+                a=[1,2,3,true]
+                """
+                params_filter.append(House.area_id == area_id) # 返回的是对象
+            # 对日期进行判断,查询日期有冲突的订单占用的房屋,已取消和已拒单的订单不占用日期
+            conflict_filter = []
+            # 如果用户选择了开始日期和结束日期
+            if start_date and end_date:
+                conflict_filter = [Order.begin_date<=end_date,Order.end_date>=start_date]
+            # 如果用户只选择了开始日期
+            elif start_date:
+                conflict_filter = [Order.end_date>=start_date]
+            # 如果用户只选择了结束日期
+            elif end_date:
+                conflict_filter = [Order.begin_date<=end_date]
+            if conflict_filter:
+                # 只查询房屋编号,可以直接使用索引,不需要读取订单记录
+                conflict_houses = db.session.query(Order.house_id).distinct()\
+                    .filter(Order.status.in_(constants.ORDER_BLOCKING_STATUSES),*conflict_filter).all()
+                conflict_houses_id = [house_id for house_id, in conflict_houses]
+                # 判断有冲突的房屋如果存在
+                if conflict_houses_id:
+                    # 对有冲突的房屋进行取反,获取不冲突的房屋
+                    params_filter.append(House.id.notin_(conflict_houses_id))
+            # 判断排序条件,booking/price-inc/price-des/new
+            if 'booking' == sort_key:
+                houses = House.query.filter(*params_filter).order_by(House.order_count.desc())
+            elif 'price-inc' == sort_key:
+                houses = House.query.filter(*params_filter).order_by(House.price.asc())
+            elif 'price-des' == sort_key:
+                houses = House.query.filter(*params_filter).order_by(House.price.desc())
+            # 如果用户未选择排序条件,默认按照房屋发布时间进行排序
+            else:
+                houses = House.query.filter(*params_filter).order_by(House.create_time.desc())
+            # 已知房屋数量时只查询当前页
+            if total_count is not None:
+                houses_list = houses.limit(constants.HOUSE_LIST_PAGE_CAPACITY)\
+                    .offset((page - 1) * constants.HOUSE_LIST_PAGE_CAPACITY).all()
+                total_page = (total_count + constants.HOUSE_LIST_PAGE_CAPACITY - 1) / constants.HOUSE_LIST_PAGE_CAPACITY
+            else:
+                # 对排序后的房屋数据进行分页,page表示页数/每页条目数/False分页发生异常不报错
+                houses_page = houses.paginate(page,constants.HOUSE_LIST_PAGE_CAPACITY,False)
+                # 获取分页后的房屋数据,以及分页后的总页数
+                houses_list = houses_page.items # 分页后的房屋数据
+                total_page = houses_page.pages # 分页后的总页数
         # 定义容器,遍历分页房屋数据,调用模型类中to_basic_dict()
         houses_dict_list = []
         for house in houses_list:
@@ -533,20 +629,10 @@ def get_houses_list():
     # 序列化数据,准备存入缓存中
     resp_json = json.dumps(resp)
     # 判断用户请求的页数必须小于等于分页后的总页数,即用户请求的页数有数据
+    # 带日期的查询多次出现后才缓存,缓存的查询条件数有上限
     if page <= total_page:
-        # 构造redis_key
-        redis_key = 'houses_%s_%s_%s_%s' % (area_id,start_date_str,end_date_str,sort_key)
-        # 多条数据往redis中存储,为了确保有效期的一致,需要使用事务
-        pip = redis_store.pipeline()
         try:
-            # 开启事务
-            pip.multi()
-            # 存储数据
-            pip.hset(redis_key,page,resp_json)
-            # 设置过期时间
-            pip.expire(redis_key,constants.HOUSE_LIST_REDIS_EXPIRES)
-            # 执行事务
-            pip.execute()
+            list_cache.set_page(redis_key,page,resp_json,bool(start_date or end_date),hits)
         except Exception as e:
             current_app.logger.error(e)
     # 返回结果
@@ -573,3 +659,199 @@ def get_houses_list():
 
 
 
+
+
+@api.route('/houses/search',methods=['GET'])
+def search_houses():
+    """
+    搜索房屋,标题或地址包含关键词,并按价格范围/适住人数/房间数/配套设施过滤
+    1/获取参数,q/min_price/max_price/capacity/rooms/fac,以及与房屋列表相同的aid/sd/ed/sk/p
+    2/对参数进行格式化,价格由元转成分,配套设施转成位图
+    3/查询日期范围内被占用的房屋,需要从结果中排除
+    4/在本进程的搜索索引中查询,得到当前页的房屋编号和总页数
+    5/根据房屋编号查询mysql,按索引给出的顺序返回
+    6/搜索条件组合很多,结果不缓存
+    :return:
+    """
+    query = request.args.get('q','').strip()
+    area_id = request.args.get('aid','')
+    start_date_str = request.args.get('sd','')
+    end_date_str = request.args.get('ed','')
+    sort_key = request.args.get('sk','new')
+    page = request.args.get('p','1')
+    min_price = request.args.get('min_price','')
+    max_price = request.args.get('max_price','')
+    min_capacity = request.args.get('capacity','')
+    min_rooms = request.args.get('rooms','')
+    facility = request.args.get('fac','')
+    if len(query) > constants.HOUSE_SEARCH_MAX_QUERY_LENGTH:
+        return jsonify(errno=RET.PARAMERR,errmsg='关键词过长')
+    # 对日期进行格式化
+    try:
+        start_date,end_date = None,None
+        if start_date_str:
+            start_date = datetime.datetime.strptime(start_date_str,'%Y-%m-%d')
+        if end_date_str:
+            end_date = datetime.datetime.strptime(end_date_str,'%Y-%m-%d')
+        if start_date_str and end_date_str:
+            assert start_date <= end_date
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='日期参数错误')
+    # 对页数/区域/价格/人数/房间数/配套设施进行格式化,价格与发布房屋时相同,由元转成分
+    try:
+        page = int(page)
+        assert page >= 1
+        area_id = int(area_id) if area_id else None
+        min_price = int(float(min_price) * 100) if min_price else None
+        max_price = int(float(max_price) * 100) if max_price else None
+        min_capacity = int(min_capacity) if min_capacity else None
+        min_rooms = int(min_rooms) if min_rooms else None
+        facilities = search.facility_mask([int(facility_id) for facility_id in facility.split(',')]) \
+            if facility else 0
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='搜索参数错误')
+    if sort_key not in list_cache.SORT_KEYS:
+        sort_key = 'new'
+    try:
+        # 查询日期有冲突的订单占用的房屋,占用集合已建立时从redis中读取
+        excluded = set()
+        if start_date and end_date and (end_date - start_date).days < constants.HOUSE_LIST_FILTER_MAX_NIGHTS \
+                and availability.is_ready():
+            excluded = availability.booked_houses(start_date,end_date)
+        elif start_date or end_date:
+            conflict_filter = []
+            if start_date:
+                conflict_filter.append(Order.end_date>=start_date)
+            if end_date:
+                conflict_filter.append(Order.begin_date<=end_date)
+            conflict_houses = db.session.query(Order.house_id).distinct()\
+                .filter(Order.status.in_(constants.ORDER_BLOCKING_STATUSES),*conflict_filter).all()
+            excluded = set(house_id for house_id, in conflict_houses)
+        page_ids,total_page = search.search_houses(query=query,area_id=area_id,min_price=min_price,
+                                                   max_price=max_price,min_capacity=min_capacity,
+                                                   min_rooms=min_rooms,facilities=facilities,excluded=excluded,
+                                                   sort_key=sort_key,page=page)
+        houses = dict((house.id,house) for house in House.query.filter(House.id.in_(page_ids))) \
+            if page_ids else {}
+        houses_dict_list = [houses[house_id].to_basic_dict() for house_id in page_ids if house_id in houses]
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='搜索房屋失败')
+    resp = {"errno":0,"errmsg":"OK","data":{"houses":houses_dict_list,"total_page":total_page,"current_page":page}}
+    return json.dumps(resp)
+
+
+@api.route('/houses/nearby',methods=['GET'])
+def get_nearby_houses():
+    """
+    附近的房屋,按距离或价格排序,使用游标分页
+    1/获取参数,lng/lat/radius(米)/min_price/max_price/sk(distance/price-inc/price-des)/cursor
+    2/对参数进行格式化,价格由元转成分
+    3/从redis的GEO集合中查询半径内最近的房屋编号与距离
+    4/查询mysql,按价格过滤,按排序条件排序,跳过游标之前的房屋
+    5/游标为上一页最后一个房屋的排序值与房屋编号,翻页期间新增的房屋不会导致重复或遗漏
+    6/返回当前页的房屋数据与下一页的游标,没有下一页时游标为空
+    :return:
+    """
+    longitude = request.args.get('lng','')
+    latitude = request.args.get('lat','')
+    radius = request.args.get('radius',constants.HOUSE_NEARBY_DEFAULT_RADIUS)
+    min_price = request.args.get('min_price','')
+    max_price = request.args.get('max_price','')
+    sort_key = request.args.get('sk','distance')
+    cursor = request.args.get('cursor','')
+    try:
+        longitude,latitude = float(longitude),float(latitude)
+        assert locations.valid_location(longitude,latitude)
+        radius = int(radius)
+        assert 0 < radius <= constants.HOUSE_NEARBY_MAX_RADIUS
+        min_price = int(float(min_price) * 100) if min_price else None
+        max_price = int(float(max_price) * 100) if max_price else None
+        assert sort_key in ('distance','price-inc','price-des')
+        # 游标格式为"排序值:房屋编号",距离为浮点数,价格为整数
+        if cursor:
+            cursor_value,cursor_id = cursor.split(':')
+            cursor_value = float(cursor_value) if 'distance' == sort_key else int(cursor_value)
+            cursor = (cursor_value,int(cursor_id))
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
+    try:
+        distances = dict(locations.nearby(longitude,latitude,radius,constants.HOUSE_NEARBY_MAX_RESULTS))
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询房屋位置失败')
+    try:
+        # 只查询编号与价格,按价格过滤
+        params_filter = [House.id.in_(distances.keys())]
+        if min_price is not None:
+            params_filter.append(House.price >= min_price)
+        if max_price is not None:
+            params_filter.append(House.price <= max_price)
+        prices = dict(db.session.query(House.id,House.price).filter(*params_filter).all()) if distances else {}
+        # 排序值:距离,价格,或价格的相反数,相同时按房屋编号
+        if 'price-inc' == sort_key:
+            sort_values = prices
+        elif 'price-des' == sort_key:
+            sort_values = dict((house_id,-price) for house_id,price in prices.items())
+        else:
+            sort_values = dict((house_id,distances[house_id]) for house_id in prices)
+        ordered = sorted((value,house_id) for house_id,value in sort_values.items())
+        if cursor:
+            ordered = [item for item in ordered if item > cursor]
+        page_items = ordered[:constants.HOUSE_NEARBY_PAGE_CAPACITY]
+        page_ids = [house_id for _,house_id in page_items]
+        houses = dict((house.id,house) for house in House.query.filter(House.id.in_(page_ids))) \
+            if page_ids else {}
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询房屋数据失败')
+    houses_dict_list = []
+    for house_id in page_ids:
+        if house_id in houses:
+            house_dict = houses[house_id].to_basic_dict()
+            house_dict['distance'] = int(distances[house_id])
+            houses_dict_list.append(house_dict)
+    next_cursor = ''
+    if len(ordered) > len(page_items):
+        last_value,last_id = page_items[-1]
+        # mysql返回的价格是long,repr会带L后缀
+        last_value = repr(float(last_value)) if 'distance' == sort_key else '%d' % last_value
+        next_cursor = '%s:%d' % (last_value,last_id)
+    resp = {"errno":0,"errmsg":"OK","data":{"houses":houses_dict_list,"next_cursor":next_cursor}}
+    return json.dumps(resp)
+
+
+@api.route('/houses/summary',methods=['GET'])
+def get_houses_summary():
+    """
+    区域或全部房屋的数量/价格范围/价格分布,用于搜索页面的价格滑块
+    1/获取参数,aid,未传时统计全部房屋
+    2/从redis中读取发布房屋时增量更新的统计
+    3/价格由分转成元返回
+    :return:
+    """
+    area_id = request.args.get('aid','')
+    try:
+        area_id = int(area_id) if area_id else None
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='区域参数错误')
+    try:
+        if not house_stats.is_ready():
+            return jsonify(errno=RET.NODATA,errmsg='房屋统计未建立')
+        summary = house_stats.get_summary(area_id)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='获取房屋统计失败')
+    # 价格由分转成元
+    for field in ('min_price','max_price'):
+        if summary[field] is not None:
+            summary[field] = summary[field] / 100.0
+    for item in summary['histogram']:
+        item['from'] = item['from'] / 100.0
+        if item['to'] is not None:
+            item['to'] = item['to'] / 100.0
+    return jsonify(errno=RET.OK,errmsg='OK',data=summary)
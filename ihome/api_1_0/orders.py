@@ -1,11 +1,15 @@
 # coding:utf-8
 
+import json
 import datetime
 
 from flask import request, g, jsonify, current_app
-from ihome import db, redis_store
+from sqlalchemy.orm import contains_eager, joinedload
+from ihome import db, redis_store, constants
 from ihome.utils.commons import login_required
 from ihome.utils.response_code import RET
+from ihome.utils import inbox, order_states, availability, search, ranking
+from ihome.utils.order_states import discard_user_orders_cache
 from ihome.models import House, Order
 from . import api
 
@@ -39,26 +43,31 @@ def save_order():
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.PARAMERR, errmsg="日期格式错误")
-    # 查询房屋是否存在
+    # 查询房屋是否存在，与批量预订相同，锁定房屋到事务结束，避免并发的预订在检查冲突后插入
     try:
-        house = House.query.get(house_id)
+        house = House.query.filter(House.id == house_id).with_for_update().first()
     except Exception as e:
         current_app.logger.error(e)
+        db.session.rollback()
         return jsonify(errno=RET.DBERR, errmsg="获取房屋信息失败")
     if not house:
+        db.session.rollback()
         return jsonify(errno=RET.NODATA, errmsg="房屋不存在")
     # 预订的房屋是否是房东自己的
     if user_id == house.user_id:
+        db.session.rollback()
         return jsonify(errno=RET.ROLEERR, errmsg="不能预订自己的房屋")
     # 确保用户预订的时间内，房屋没有被别人下单
     try:
-        # 查询时间冲突的订单数
-        count = Order.query.filter(Order.house_id == house_id,Order.begin_date <= end_date,
-                                   Order.end_date >= start_date).count()
+        # 查询时间冲突的订单数，已取消和已拒单的订单不占用日期
+        count = Order.query.filter(Order.house_id == house_id, Order.status.in_(constants.ORDER_BLOCKING_STATUSES),
+                                   Order.begin_date <= end_date, Order.end_date >= start_date).count()
     except Exception as e:
         current_app.logger.error(e)
+        db.session.rollback()
         return jsonify(errno=RET.DBERR, errmsg="检查出错，请稍候重试")
     if count > 0:
+        db.session.rollback()
         return jsonify(errno=RET.DATAERR, errmsg="房屋已被预订")
     # 订单总额
     amount = days * house.price
@@ -78,37 +87,215 @@ def save_order():
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR, errmsg="保存订单失败")
+    discard_user_orders_cache(user_id, house.user_id)
+    # 放入房东的待接单收件箱，通知正在等待新订单的房东，并标记房屋占用的日期
+    try:
+        inbox.push_pending_order(house.user_id, order.to_dict())
+        availability.add_bookings([(house.id, start_date, end_date)])
+    except Exception as e:
+        current_app.logger.error(e)
     return jsonify(errno=RET.OK, errmsg="OK", data={"order_id": order.id})
 
 
+@api.route("/orders/batch", methods=["POST"])
+@login_required
+def save_orders():
+    """批量保存订单，一个事务中处理多个房屋或多个时间段的预订，返回每一项的结果"""
+    user_id = g.user_id
+    # 获取参数
+    order_data = request.get_json()
+    bookings = order_data.get("bookings") if isinstance(order_data, dict) else None
+    if not bookings or not isinstance(bookings, list):
+        return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
+    if len(bookings) > constants.ORDER_BATCH_MAX_BOOKINGS:
+        return jsonify(errno=RET.PARAMERR, errmsg="一次最多预订%d项" % constants.ORDER_BATCH_MAX_BOOKINGS)
+
+    # 逐项检查参数与日期格式，results中先填入参数错误的结果
+    results = [None] * len(bookings)
+    items = []
+    for index, booking in enumerate(bookings):
+        try:
+            house_id = int(booking["house_id"])
+            start_date = datetime.datetime.strptime(booking["start_date"], "%Y-%m-%d")
+            end_date = datetime.datetime.strptime(booking["end_date"], "%Y-%m-%d")
+            assert start_date <= end_date
+        except Exception:
+            results[index] = {"errno": RET.PARAMERR, "errmsg": "参数错误"}
+            continue
+        items.append((index, house_id, start_date, end_date))
+
+    orders = []
+    if items:
+        house_ids = set([item[1] for item in items])
+        try:
+            # 一次查询所有房屋，并锁定到事务结束，避免并发的预订在检查冲突后插入
+            houses = dict([(house.id, house) for house in
+                           House.query.filter(House.id.in_(house_ids)).with_for_update().all()])
+            # 一次查询这些房屋在整个预订范围内的占用日期
+            occupied = {}
+            for house_id, begin_date, end_date in db.session.query(Order.house_id, Order.begin_date, Order.end_date)\
+                    .filter(Order.house_id.in_(house_ids), Order.status.in_(constants.ORDER_BLOCKING_STATUSES),
+                            Order.begin_date <= max([item[3] for item in items]),
+                            Order.end_date >= min([item[2] for item in items])):
+                occupied.setdefault(house_id, []).append((begin_date, end_date))
+        except Exception as e:
+            current_app.logger.error(e)
+            db.session.rollback()
+            return jsonify(errno=RET.DBERR, errmsg="检查出错，请稍候重试")
+
+        for index, house_id, start_date, end_date in items:
+            house = houses.get(house_id)
+            if not house:
+                results[index] = {"errno": RET.NODATA, "errmsg": "房屋不存在"}
+                continue
+            # 预订的房屋是否是房东自己的
+            if user_id == house.user_id:
+                results[index] = {"errno": RET.ROLEERR, "errmsg": "不能预订自己的房屋"}
+                continue
+            # 与已有订单或本批中前面的预订冲突
+            if any(begin_date <= end_date and stop_date >= start_date
+                   for begin_date, stop_date in occupied.get(house_id, [])):
+                results[index] = {"errno": RET.DATAERR, "errmsg": "房屋已被预订"}
+                continue
+            occupied.setdefault(house_id, []).append((start_date, end_date))
+            days = (end_date - start_date).days + 1
+            orders.append({"index": index, "house_id": house_id, "begin_date": start_date,
+                           "end_date": end_date, "days": days, "house_price": house.price,
+                           "amount": days * house.price, "landlord_id": house.user_id})
+
+        if orders:
+            try:
+                saved = [Order(house_id=order["house_id"], user_id=user_id, begin_date=order["begin_date"],
+                               end_date=order["end_date"], days=order["days"], house_price=order["house_price"],
+                               amount=order["amount"]) for order in orders]
+                db.session.add_all(saved)
+                # flush后每个订单得到自己的编号，不需要按下单时间查回
+                db.session.flush()
+                # 提交前转换为字典，提交后访问订单属性会重新查询数据库，房屋已在本事务中查询过，不会再查询
+                for order, saved_order in zip(orders, saved):
+                    order["order_dict"] = saved_order.to_dict()
+                db.session.commit()
+            except Exception as e:
+                current_app.logger.error(e)
+                db.session.rollback()
+                return jsonify(errno=RET.DBERR, errmsg="保存订单失败")
+        else:
+            db.session.rollback()
+
+        # 删除订单列表缓存，放入房东的待接单收件箱
+        landlord_ids = set()
+        for order in orders:
+            order_dict = order["order_dict"]
+            results[order["index"]] = {"errno": RET.OK, "errmsg": "OK", "order_id": order_dict["order_id"]}
+            landlord_ids.add(order["landlord_id"])
+            try:
+                inbox.push_pending_order(order["landlord_id"], order_dict)
+            except Exception as e:
+                current_app.logger.error(e)
+        for landlord_id in landlord_ids:
+            discard_user_orders_cache(user_id, landlord_id)
+        # 标记房屋占用的日期
+        try:
+            availability.add_bookings([(order["house_id"], order["begin_date"], order["end_date"])
+                                       for order in orders])
+        except Exception as e:
+            current_app.logger.error(e)
+
+    return jsonify(errno=RET.OK, errmsg="OK", data={"results": results, "saved": len(orders)})
+
+
 @api.route("/user/orders", methods=["GET"])
 @login_required
 def get_user_orders():
-    """查询用户的订单信息"""
+    """查询用户的订单信息，按下单时间倒序，传入cursor或limit时分页，cursor为上一页最后一个订单的编号，
+    都不传时返回全部订单，兼容还没有分页的客户端
+    """
     user_id = g.user_id
     # 用户的身份，用户想要查询作为房客预订别人房子的订单，还是想要作为房东查询别人预订自己房子的订单
     role = request.args.get("role", "")
-    # 查询订单数据
+    if role != "landlord":
+        role = "custom"
+    # 订单状态过滤，不传时查询全部状态
+    status = request.args.get("status", "")
+    if status and status not in Order.status.type.enums:
+        return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
+    cursor = request.args.get("cursor", "")
+    limit = request.args.get("limit", "")
+    paged = bool(cursor or limit)
+    try:
+        cursor = int(cursor) if cursor else None
+        # 每页数量不超过USER_ORDERS_PAGE_CAPACITY
+        limit = min(int(limit), constants.USER_ORDERS_PAGE_CAPACITY) if limit else constants.USER_ORDERS_PAGE_CAPACITY
+        assert limit > 0
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
+    # 第一页的查询最频繁，按用户、身份、状态与每页数量缓存
+    cache_field = "%s_%d" % (status, limit)
+    if paged and not cursor:
+        try:
+            ret = redis_store.hget("user_orders_%s_%s" % (role, user_id), cache_field)
+        except Exception as e:
+            current_app.logger.error(e)
+            ret = None
+        if ret:
+            return '{"errno":"0","errmsg":"OK","data":%s}' % ret
+    # 查询订单数据，订单编号随下单时间递增，按编号倒序即按下单时间倒序
     try:
         if "landlord" == role:
-            # 以房东的身份查询订单
-            # 先查询属于自己的房子有哪些
-            houses = House.query.filter(House.user_id == user_id).all()
-            houses_ids = [house.id for house in houses]
-            # 再查询预订了自己房子的订单
-            orders = Order.query.filter(Order.house_id.in_(houses_ids)).order_by(Order.create_time.desc()).all()
+            # 以房东的身份查询订单，通过房屋表关联查询预订了自己房子的订单
+            query = Order.query.join(House, Order.house_id == House.id).filter(House.user_id == user_id)\
+                .options(contains_eager(Order.house))
         else:
             # 以房客的身份查询订单， 查询自己预订的订单
-            orders = Order.query.filter(Order.user_id == user_id).order_by(Order.create_time.desc()).all()
+            query = Order.query.filter(Order.user_id == user_id).options(joinedload(Order.house))
+        if status:
+            query = query.filter(Order.status == status)
+        if cursor:
+            query = query.filter(Order.id < cursor)
+        query = query.order_by(Order.id.desc())
+        # 分页时多查询一条，判断是否还有下一页
+        orders = query.limit(limit + 1).all() if paged else query.all()
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR, errmsg="查询订单信息失败")
+    next_cursor = None
+    if paged and len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = orders[-1].id
     # 将订单对象转换为字典数据
-    orders_dict_list = []
+    orders_dict_list = [order.to_dict() for order in orders]
+    orders_json = json.dumps({"orders": orders_dict_list, "next_cursor": next_cursor})
+    if paged and not cursor:
+        try:
+            pipe = redis_store.pipeline()
+            pipe.hset("user_orders_%s_%s" % (role, user_id), cache_field, orders_json)
+            pipe.expire("user_orders_%s_%s" % (role, user_id), constants.USER_ORDERS_REDIS_EXPIRES)
+            pipe.execute()
+        except Exception as e:
+            current_app.logger.error(e)
+    return '{"errno":"0","errmsg":"OK","data":%s}' % orders_json
+
+
+@api.route("/user/orders/inbox", methods=["GET"])
+@login_required
+def get_pending_orders():
+    """房东的待接单收件箱，长轮询：返回编号大于since的新订单，没有时等待新订单到达或超时，等待时间为0时立即返回"""
+    user_id = g.user_id
+    try:
+        since = int(request.args.get("since", 0))
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
+    try:
+        orders = inbox.wait_pending_orders(user_id, since, current_app.config["LANDLORD_INBOX_POLL_TIMEOUT"])
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR, errmsg="查询订单信息失败")
+    # 客户端下次请求时带上新的since
     if orders:
-        for order in orders:
-            orders_dict_list.append(order.to_dict())
-    return jsonify(errno=RET.OK, errmsg="OK", data={"orders": orders_dict_list})
+        since = orders[-1]["order_id"]
+    return jsonify(errno=RET.OK, errmsg="OK", data={"orders": orders, "since": since})
 
 
 @api.route("/orders/<int:order_id>/status", methods=["PUT"])
@@ -124,33 +311,39 @@ def accept_reject_order(order_id):
     action = req_data.get("action")
     if action not in ("accept", "reject"):
         return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
-    try:
-        # 根据订单号查询订单，并且要求订单处于等待接单状态
-        order = Order.query.filter(Order.id == order_id, Order.status == "WAIT_ACCEPT").first()
-        house = order.house
-    except Exception as e:
-        current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR, errmsg="无法获取订单数据")
-    # 确保房东只能修改属于自己房子的订单
-    if not order or house.user_id != user_id:
-        return jsonify(errno=RET.REQERR, errmsg="操作无效")
     if action == "accept":
         # 接单，将订单状态设置为等待评论
-        order.status = "WAIT_COMMENT"
-    elif action == "reject":
+        values = {}
+        status = "WAIT_COMMENT"
+    else:
         # 拒单，要求用户传递拒单原因
         reason = req_data.get("reason")
         if not reason:
             return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
-        order.status = "REJECTED"
-        order.comment = reason
+        values = {"comment": reason}
+        status = "REJECTED"
     try:
-        db.session.add(order)
+        # 订单处于等待接单状态，且房东只能修改属于自己房子的订单
+        changed = order_states.transition(
+            order_id, "WAIT_ACCEPT", status,
+            (Order.house_id.in_(db.session.query(House.id).filter(House.user_id == user_id)),), **values)
+        order = db.session.query(Order.user_id, Order.house_id, Order.begin_date, Order.end_date)\
+            .filter(Order.id == order_id).first() if changed else None
         db.session.commit()
     except Exception as e:
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR, errmsg="操作失败")
+    if not changed:
+        return jsonify(errno=RET.REQERR, errmsg="操作无效")
+    discard_user_orders_cache(order.user_id, user_id)
+    try:
+        inbox.remove_pending_order(user_id, order_id)
+        # 拒单后释放房屋占用的日期
+        if status == "REJECTED":
+            availability.remove_bookings([(order.house_id, order.begin_date, order.end_date)])
+    except Exception as e:
+        current_app.logger.error(e)
     return jsonify(errno=RET.OK, errmsg="OK")
 
 
@@ -166,32 +359,31 @@ def save_order_comment(order_id):
     if not comment:
         return jsonify(errno=RET.PARAMERR, errmsg="参数错误")
     try:
-        # 需要确保只能评论自己下的订单，而且订单处于待评价状态才可以
-        order = Order.query.filter(Order.id == order_id, Order.user_id == user_id,
-                                   Order.status == "WAIT_COMMENT").first()
-        house = order.house
-    except Exception as e:
-        current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR, errmsg="无法获取订单数据")
-    if not order:
-        return jsonify(errno=RET.REQERR, errmsg="操作无效")
-    try:
-        # 将订单的状态设置为已完成
-        order.status = "COMPLETE"
-        # 保存订单的评价信息
-        order.comment = comment
-        # 将房屋的完成订单数增加1
-        house.order_count += 1
-        db.session.add(order)
-        db.session.add(house)
+        # 需要确保只能评论自己下的订单，而且订单处于待评价状态才可以，将订单的状态设置为已完成并保存评价信息
+        changed = order_states.transition(order_id, "WAIT_COMMENT", "COMPLETE", (Order.user_id == user_id,),
+                                          comment=comment)
+        if changed:
+            house = House.query.join(Order, Order.house_id == House.id).filter(Order.id == order_id).first()
+            # 将房屋的完成订单数增加1
+            House.query.filter(House.id == house.id)\
+                .update({"order_count": House.order_count + 1}, synchronize_session=False)
         db.session.commit()
     except Exception as e:
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR, errmsg="操作失败")
+    if not changed:
+        return jsonify(errno=RET.REQERR, errmsg="操作无效")
     # 因为房屋详情中有订单的评价信息，为了让最新的评价信息展示在房屋详情中，所以删除redis中关于本订单房屋的详情缓存
     try:
-        redis_store.delete("house_info_%s" % order.house.id)
+        redis_store.delete("house_info_%s" % house.id)
+    except Exception as e:
+        current_app.logger.error(e)
+    discard_user_orders_cache(user_id, house.user_id)
+    # 完成订单数影响搜索结果与首页排行的排序
+    search.houses_changed([house.id])
+    try:
+        ranking.add_order_counts({house.id: 1})
     except Exception as e:
         current_app.logger.error(e)
 
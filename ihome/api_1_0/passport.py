@@ -8,17 +8,22 @@ from ihome.utils.response_code import RET
 # 导入模型类
 from ihome.models import User
 # 导入登陆验证装饰器
-from ihome.utils.commons import login_required
+from ihome.utils.commons import login_required,get_login_user,rate_limit
 # 导入sqlalchemy实例
 from ihome import db,constants
 # 导入七牛云接口
 from ihome.utils.image_storage import storage
+# 导入密码校验与加密,密码进程池繁忙的异常
+from ihome.utils.passwords import PasswordPoolBusy,verify_password,needs_rehash,hash_password
+# 导入手机号对应的用户信息,用户资料缓存
+from ihome.utils import mobiles,profiles
 
 # 导入正则模块
 import re
 
 
 @api.route('/sessions',methods=['POST'])
+@rate_limit('login',constants.LOGIN_RATE_LIMITS)
 def login():
     """
     用户登陆
@@ -28,7 +33,7 @@ def login():
     4/校验参数的完整性
     5/校验手机号格式
     6/判断手机号已注册,以及密码校验
-    user = User.query.filter_by(mobile=mobile).first()
+    user = mobiles.get_mobile_login(mobile)
     7/校验查询结果并判断密码
     8/缓存用户信息
     session['user_id'] = user.id
@@ -52,15 +57,27 @@ def login():
     # 校验手机号格式
     if not re.match(r'1[3456789]\d{9}$',mobile):
         return jsonify(errno=RET.PARAMERR,errmsg='手机号格式错误')
-    # 查询mysql数据库,确认用户存在
+    # 查询用户的登录信息,手机号未注册时过滤器可以直接确认,密码哈希从mysql读取
     try:
-        user = User.query.filter_by(mobile=mobile).first()
+        user = mobiles.get_mobile_login(mobile)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询用户信息失败')
     # 校验查询结果,以及对密码进行判断
-    if user is None or not user.check_password(password):
-        return jsonify(errno=RET.DATAERR,errmsg='用户名或密码错误')
+    try:
+        if user is None or not verify_password(user.password_hash,password):
+            return jsonify(errno=RET.DATAERR,errmsg='用户名或密码错误')
+    except PasswordPoolBusy:
+        current_app.logger.warn('password pool busy')
+        return jsonify(errno=RET.SERVERERR,errmsg='服务器繁忙,请稍后重试')
+    # 密码的加密算法已过时,使用当前配置的算法重新加密,失败不影响登录
+    if needs_rehash(user.password_hash):
+        try:
+            User.query.filter_by(id=user.id).update({'password_hash':hash_password(password)})
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(e)
+            db.session.rollback()
     # 缓存用户信息到redis中
     session['user_id'] = user.id
     session['name'] = user.name
@@ -75,27 +92,26 @@ def get_user_profile():
     """
     获取用户信息
     1/通过登陆装饰验证器,获取用户身份,user_id = g.user_id
-    2/根据user_id查询mysql数据库
-    user = User.query.filter_by(id=user_id).first()
+    2/根据user_id查询用户资料缓存,缓存中没有时查询mysql数据库
+    profile = profiles.get_user_profile(user_id)
     3/判断查询结果
     4/返回结果
-    data=user.to_dict()
+    data=profiles.profile_to_dict(profile)
     :return:
     """
     # 获取用户身份
     user_id = g.user_id
-    # 查询mysql数据库
+    # 查询用户资料,缓存中没有时查询mysql数据库
     try:
-        # User.query.get(user_id)
-        user = User.query.filter_by(id=user_id).first()
+        profile = profiles.get_user_profile(user_id)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询用户信息失败')
     # 校验查询结果
-    if not user:
+    if not profile:
         return jsonify(errno=RET.NODATA,errmsg='无效操作')
-    # 返回结果,to_dict()方法为模型类中的实例方法;
-    return jsonify(errno=RET.OK,errmsg='OK',data=user.to_dict())
+    # 返回结果,格式与模型类中的to_dict()方法相同
+    return jsonify(errno=RET.OK,errmsg='OK',data=profiles.profile_to_dict(profile))
 
 
 @api.route('/user/name',methods=['PUT'])
@@ -111,7 +127,7 @@ def change_user_profile():
     User.query.filter_by(id=user_id).update({'name':name})
     db.session.commit()
     db.session.rollback()
-    6/更新redis缓存中用户名信息
+    6/更新用户资料缓存与redis缓存中用户名信息
     7/返回结果
 
     :return:
@@ -138,6 +154,13 @@ def change_user_profile():
         # 如果发生异常,需要进行回滚
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='更新用户信息失败')
+    # 更新用户资料缓存,删除手机号对应的登录信息缓存,失败时缓存会在过期后更新
+    try:
+        profiles.update_user_profile(user_id,name=name)
+        mobile = db.session.query(User.mobile).filter_by(id=user_id).scalar()
+        mobiles.discard_mobile_user(mobile)
+    except Exception as e:
+        current_app.logger.error(e)
     # redis缓存数据更新
     session['name'] = name
     # 返回结果
@@ -186,6 +209,11 @@ def set_user_avatar():
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='保存用户头像失败')
+    # 更新用户资料缓存
+    try:
+        profiles.update_user_profile(user_id,avatar_url=image_name)
+    except Exception as e:
+        current_app.logger.error(e)
     # 返回前端用户头像的绝对路径
     image_url = constants.QINIU_DOMIN_PREFIX + image_name
     # 返回结果
@@ -224,13 +252,19 @@ def set_user_auth():
         return jsonify(errno=RET.PARAMERR,errmsg='参数缺失')
     # 操作mysql数据库,保存用户实名信息
     try:
-        User.query.filter_by(id=user_id,real_name=None,id_card=None).update({'real_name':real_name,'id_card':id_card})
+        count = User.query.filter_by(id=user_id,real_name=None,id_card=None).update({'real_name':real_name,'id_card':id_card})
         # 提交数据
         db.session.commit()
     except Exception as e:
         current_app.logger.error(e)
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='保存用户实名信息失败')
+    # 实名信息只能设置一次,保存成功时更新用户资料缓存
+    if count:
+        try:
+            profiles.update_user_profile(user_id,real_name=real_name,id_card=id_card)
+        except Exception as e:
+            current_app.logger.error(e)
     # 返回结果
     return jsonify(errno=RET.OK,errmsg='OK')
 
@@ -240,25 +274,24 @@ def get_user_auth():
     """
     获取用户实名信息
     1/获取用户身份信息,user_id
-    2/查询mysql数据库,获取用户的实名信息
+    2/查询用户资料缓存,缓存中没有时查询mysql数据库,获取用户的实名信息
     3/校验查询结果
-    4/返回结果user.auth_to_dict()
+    4/返回结果profiles.profile_to_auth_dict(profile)
     :return:
     """
     # 获取用户身份
     user_id = g.user_id
-    # 查询mysql数据库
+    # 查询用户资料,缓存中没有时查询mysql数据库
     try:
-        # User.query.get(user_id)
-        user = User.query.filter_by(id=user_id).first()
+        profile = profiles.get_user_profile(user_id)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询用户实名信息失败')
     # 校验查询结果
-    if not user:
+    if not profile:
         return jsonify(errno=RET.NODATA,errmsg='无效操作')
     # 返回实名信息
-    return jsonify(errno=RET.OK,errmsg='OK',data=user.auth_to_dict())
+    return jsonify(errno=RET.OK,errmsg='OK',data=profiles.profile_to_auth_dict(profile))
 
 
 @api.route('/session',methods=['DELETE'])
@@ -286,8 +319,8 @@ def check_login():
     3/否则返回错误信息
     :return:
     """
-    # 从redis数据库中获取用户的缓存信息
-    name = session.get('name')
+    # 获取用户的缓存信息,开启无状态令牌时不需要访问redis
+    name = get_login_user()[1]
     # 判断获取结果
     if name is not None:
         return jsonify(errno=RET.OK,errmsg='true',data={'name':name})
@@ -3,7 +3,7 @@
 # 导入蓝图对象api
 from . import api
 # 导入图片验证码扩展包
-from ihome.utils.captcha.captcha import captcha
+from ihome.utils.captcha.captcha import captcha,CaptchaPool
 # 导入redis数据库实例,常量文件,sqlalchemy实例
 from ihome import redis_store,constants,db
 # 导入flask内置的对象
@@ -14,11 +14,38 @@ from ihome.utils.response_code import RET
 from ihome.models import User
 # 导入云通讯接口,实现发送短信
 from ihome.utils import sms
+# 导入短信验证码校验脚本,已注册手机号的过滤器与登录信息缓存
+from ihome.utils import verify_codes,mobiles
+# 导入限流装饰器
+from ihome.utils.commons import rate_limit
+# 导入密码进程池繁忙的异常
+from ihome.utils.passwords import PasswordPoolBusy
 
 # 导入正则模块
 import re
 # 导入随机数模块
 import random
+# 导入线程模块,保护进程池的创建
+import threading
+
+
+# 图片验证码渲染进程池,每个worker进程第一次使用时创建
+_captcha_pool = None
+_captcha_pool_lock = threading.Lock()
+
+
+def get_captcha_renderer():
+    """返回图片验证码的渲染器,配置了进程池时使用进程池,否则使用进程内的单例"""
+    global _captcha_pool
+    processes = current_app.config.get('CAPTCHA_POOL_PROCESSES')
+    if not processes:
+        return captcha
+    if _captcha_pool is None:
+        with _captcha_pool_lock:
+            if _captcha_pool is None:
+                _captcha_pool = CaptchaPool(processes)
+    return _captcha_pool
+
 
 @api.route('/imagecode/<image_code_id>',methods=['GET'])
 def generate_image_code(image_code_id):
@@ -30,8 +57,12 @@ def generate_image_code(image_code_id):
     :param image_code_id:
     :return:
     """
-    # 调用captcha扩展包,生成图片验证码
-    name,text,image = captcha.generate_captcha()
+    # 调用captcha扩展包,生成图片验证码,每次调用互不影响,可以在多线程中并发执行
+    try:
+        name,text,image = get_captcha_renderer().generate_captcha()
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.SERVERERR,errmsg='生成图片验证码失败')
     # 把图片验证码存入redis数据库中
     try:
         redis_store.setex('ImageCode_' + image_code_id,constants.IMAGE_CODE_REDIS_EXPIRES,text)
@@ -49,22 +80,21 @@ def generate_image_code(image_code_id):
 
 
 @api.route('/smscode/<mobile>',methods=['GET'])
+@rate_limit('sms',constants.SMS_RATE_LIMITS)
 def send_sms_code(mobile):
     """
     发送短信:获取参数/校验参数/业务处理/返回结果
     1/获取参数,mobile,text,id
     2/校验参数的完整性all/any
     3/校验手机号,正则表达式
-    4/校验图片验证码,获取本地存储的真实图片验证码
-    5/判断获取结果
-    6/删除图片验证码
-    7/比较图片验证码是否一致
-    8/判断手机号是否已注册
-    9/构造短信随机数,random.randint()
-    10/发送短信,调用云通讯接口
-    11/需要保存发送结果
-    12/判断发送结果是否成功
-    13/返回结果
+    4/构造短信随机数,random.randint()
+    5/调用redis脚本,一次往返完成以下操作:
+    取出并删除图片验证码,比较图片验证码是否一致,
+    检查发送间隔,根据布隆过滤器判断手机号是否一定未注册,一定未注册时保存短信验证码
+    6/过滤器不能确认时,查询缓存或mysql判断手机号是否已注册,未注册时再保存短信验证码
+    7/发送短信,调用云通讯接口
+    8/判断发送结果是否成功
+    9/返回结果
     :param mobile:
     :return:
     """
@@ -77,46 +107,38 @@ def send_sms_code(mobile):
     # 校验手机号格式
     if not re.match(r'1[3456789]\d{9}$',mobile):
         return jsonify(errno=RET.PARAMERR,errmsg='手机号格式错误')
-
-
-
-    # 校验图片验证码,获取本地真实的图片验证码
-    try:
-        real_image_code = redis_store.get('ImageCode_' + image_code_id)
-    except Exception as e:
-        current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR,errmsg='查询图片验证码失败')
-
-    # 校验获取结果
-    if not real_image_code:
-        return jsonify(errno=RET.NODATA,errmsg='图片验证码过期')
-    # 删除图片验证码,因为图片验证码只允许获取一次,即只能让用户比较一次
-    try:
-        redis_store.delete('ImageCode_' + image_code_id)
-    except Exception as e:
-        current_app.logger.error(e)
-    # 比较图片验证码是否一致,忽略大小写
-    if real_image_code.lower() != image_code.lower():
-        return jsonify(errno=RET.DATAERR,errmsg='图片验证码不一致')
     # 生成短信随机码,格式化输出,确保生成的随机数为六位数
     sms_code = '%06d' % random.randint(1,999999)
-    # 需要保存短信随机数
+    # 校验图片验证码/手机号/发送间隔,并保存短信验证码
     try:
-        redis_store.setex('SMSCode_' + mobile,constants.SMS_CODE_REDIS_EXPIRES,sms_code)
+        result = verify_codes.check_and_save_sms_code(image_code_id,image_code,mobile,sms_code)
     except Exception as e:
         current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR,errmsg='保存短信验证码失败')
-    # 判断手机号是否存在
-    try:
-        # 根据手机号进行查询,并判断查询结果
-        user = User.query.filter_by(mobile=mobile).first()
-    except Exception as e:
-        current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR,errmsg='查询用户信息失败')
-    else:
+        return jsonify(errno=RET.DBERR,errmsg='校验图片验证码失败')
+    if result == verify_codes.IMAGE_CODE_EXPIRED:
+        return jsonify(errno=RET.NODATA,errmsg='图片验证码过期')
+    if result == verify_codes.IMAGE_CODE_MISMATCH:
+        return jsonify(errno=RET.DATAERR,errmsg='图片验证码不一致')
+    if result == verify_codes.SEND_TOO_OFTEN:
+        return jsonify(errno=RET.REQERR,errmsg='发送过于频繁,请稍后重试')
+    # 过滤器不能确认手机号未注册时,查询缓存或mysql判断手机号是否存在,确认未注册后才保存短信验证码
+    if result == verify_codes.SMS_CODE_UNCHECKED:
+        try:
+            # 根据手机号进行查询,并判断查询结果
+            user = mobiles.get_mobile_user(mobile)
+        except Exception as e:
+            current_app.logger.error(e)
+            return jsonify(errno=RET.DBERR,errmsg='查询用户信息失败')
         # 判断用户存在
         if user is not None:
             return jsonify(errno=RET.DATAEXIST,errmsg='手机号已注册')
+        try:
+            result = verify_codes.save_sms_code(mobile,sms_code)
+        except Exception as e:
+            current_app.logger.error(e)
+            return jsonify(errno=RET.DBERR,errmsg='保存短信验证码失败')
+        if result == verify_codes.SEND_TOO_OFTEN:
+            return jsonify(errno=RET.REQERR,errmsg='发送过于频繁,请稍后重试')
     # 调用云通讯接口,发送短信
     try:
         ccp = sms.CCP()
@@ -194,9 +216,9 @@ def register():
         redis_store.delete('SMSCode_' + mobile)
     except Exception as e:
         current_app.logger.error(e)
-    # 判断用户是否已注册
+    # 判断用户是否已注册,过滤器确认未注册时不查询mysql
     try:
-        user = User.query.filter_by(mobile=mobile).first()
+        user = mobiles.get_mobile_user(mobile)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询用户信息失败')
@@ -206,7 +228,11 @@ def register():
     # 保存用户信息
     user = User(name=mobile,mobile=mobile)
     # 调用了模型类中密码加密方法
-    user.password = password
+    try:
+        user.password = password
+    except PasswordPoolBusy:
+        current_app.logger.warn('password pool busy')
+        return jsonify(errno=RET.SERVERERR,errmsg='服务器繁忙,请稍后重试')
     # 提交数据到数据库中
     try:
         db.session.add(user)
@@ -216,6 +242,16 @@ def register():
         # 如果写入数据发生异常,需要进行回滚
         db.session.rollback()
         return jsonify(errno=RET.DBERR,errmsg='保存用户信息失败')
+    # 把手机号加入已注册手机号的过滤器
+    try:
+        mobiles.add_registered_mobile(mobile)
+    except Exception as e:
+        current_app.logger.error(e)
+        # 过滤器中缺少这个手机号会被认为未注册,删除过滤器让查询回到mysql
+        try:
+            mobiles.discard_registered_mobiles()
+        except Exception as e:
+            current_app.logger.error(e)
     # 缓存用户信息到redis数据库中,需要使用请求上下文对象session
     session['user_id'] = user.id
     session['name'] = mobile
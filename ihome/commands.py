@@ -0,0 +1,788 @@
+# -*- coding:utf-8 -*-
+# manage.py的子命令
+import time
+import datetime
+import threading
+from contextlib import contextmanager
+
+from flask import current_app
+from flask_script import Manager
+from ihome.utils.assets import AssetBuilder
+
+
+# 性能测试命令: python manage.py bench <命令>
+bench_manager = Manager(usage=u"性能测试")
+
+# 用户数据命令: python manage.py users <命令>
+users_manager = Manager(usage=u"用户数据维护")
+
+# 订单维护命令: python manage.py orders <命令>
+orders_manager = Manager(usage=u"订单状态批量维护")
+
+# 房屋数据命令: python manage.py houses <命令>
+houses_manager = Manager(usage=u"房屋数据维护")
+
+# 缓存命令: python manage.py cache <命令>
+cache_manager = Manager(usage=u"redis缓存维护")
+
+# 静态资源命令: python manage.py assets <命令>
+assets_manager = Manager(usage=u"静态资源构建")
+
+
+def measure(func, number):
+    """执行func number次，返回每秒执行的次数"""
+    start = time.time()
+    for _ in xrange(number):
+        func()
+    return number / (time.time() - start)
+
+
+def csrf_headers(client):
+    """打开一个页面取得csrf_token cookie，返回POST/PUT请求需要附加的请求头"""
+    client.get("/index.html")
+    for cookie in client.cookie_jar:
+        if cookie.name == "csrf_token":
+            return {"X-CSRFToken": cookie.value}
+    return {}
+
+
+@contextmanager
+def scratch_redis(db):
+    """性能测试期间把redis_store切换到单独的库，测试写入与删除的键不影响线上的缓存与索引"""
+    import redis
+    from ihome import redis_store
+    pool = redis_store.connection_pool
+    redis_store.connection_pool = redis.ConnectionPool(**dict(pool.connection_kwargs, db=db))
+    try:
+        yield redis_store
+    finally:
+        redis_store.connection_pool.disconnect()
+        redis_store.connection_pool = pool
+
+
+def _list_queries(number, seed, area_ids, dated_ratio):
+    """模拟的房屋列表查询：带日期的入住日期集中在近期，热门区域与排序条件占多数"""
+    import random
+    rand = random.Random(seed)
+    today = datetime.date.today()
+    for _ in xrange(number):
+        params = {"aid": area_ids[min(int(rand.expovariate(0.5)), len(area_ids) - 1)],
+                  "sk": rand.choice(("new", "new", "booking", "price-inc", "price-des")),
+                  "p": min(int(rand.expovariate(1.5)) + 1, 5)}
+        if rand.random() < dated_ratio:
+            start = today + datetime.timedelta(days=min(int(rand.expovariate(0.1)), 90))
+            params["sd"] = start.strftime("%Y-%m-%d")
+            params["ed"] = (start + datetime.timedelta(days=rand.randint(1, 7))).strftime("%Y-%m-%d")
+        yield "/api/v1.0/houses?" + "&".join("%s=%s" % item for item in params.items())
+
+
+@users_manager.command
+def rebuild_index():
+    """从ih_user_profile重建已注册手机号的布隆过滤器，可以由cron定期执行"""
+    from ihome.utils.mobiles import rebuild_registered_mobiles
+    print "%d mobiles indexed" % rebuild_registered_mobiles()
+
+
+@orders_manager.option("-H", "--hours", dest="hours", type=int, help=u"下单后多少小时未接单自动取消，默认使用配置")
+@orders_manager.option("-b", "--batch-size", dest="batch_size", type=int, help=u"每批修改的订单数，默认使用配置")
+def expire(hours, batch_size):
+    """取消超时未接单的订单，可以由cron定期执行"""
+    from ihome.utils.order_states import expire_pending_orders
+    hours = hours or current_app.config["ORDER_WAIT_ACCEPT_HOURS"]
+    before = datetime.datetime.now() - datetime.timedelta(hours=hours)
+    print "%d orders canceled" % expire_pending_orders(
+        before, batch_size or current_app.config["ORDER_SCHEDULER_BATCH_SIZE"])
+
+
+@orders_manager.option("-b", "--batch-size", dest="batch_size", type=int, help=u"每批修改的订单数，默认使用配置")
+def complete(batch_size):
+    """离店后仍未评价的订单自动完成，可以由cron定期执行"""
+    from ihome.utils.order_states import complete_past_orders
+    before = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    print "%d orders completed" % complete_past_orders(
+        before, batch_size or current_app.config["ORDER_SCHEDULER_BATCH_SIZE"])
+
+
+@orders_manager.command
+def rebuild_availability():
+    """从mysql重建房屋每天被占用的集合，房屋列表按日期过滤时使用"""
+    from ihome.utils.availability import rebuild
+    print "%d orders indexed" % rebuild()
+
+
+@houses_manager.command
+def rebuild_locations():
+    """从ih_house_info重建房屋位置的GEO集合，附近房屋查询时使用"""
+    from ihome.utils.locations import rebuild
+    print "%d locations indexed" % rebuild()
+
+
+@houses_manager.command
+def rebuild_ranking():
+    """从ih_house_info重建首页房屋排行"""
+    from ihome.utils.ranking import rebuild
+    print "%d houses ranked" % rebuild()
+
+
+@houses_manager.command
+def rebuild_stats():
+    """从ih_house_info重建每个区域的房屋数量与价格统计"""
+    from ihome.utils.house_stats import rebuild
+    print "%d houses counted" % rebuild()
+
+
+@cache_manager.option("-c", "--concurrency", dest="concurrency", type=int, help=u"并发请求数，默认使用配置")
+@cache_manager.option("-n", "--top", dest="top", type=int, help=u"请求详情的房屋数，默认使用配置")
+def warm(concurrency, top):
+    """部署或redis故障切换后重建索引并预热缓存，避免所有请求同时查询mysql"""
+    import json
+    import Queue
+    from ihome import redis_store, db, constants
+    from ihome.models import Area, House
+    from ihome.utils.response_code import RET
+    from ihome.utils import availability, ranking, house_stats, locations, mobiles, list_cache, hot_urls, hot_keys
+    app = current_app._get_current_object()
+    config = app.config
+    concurrency = concurrency or config["CACHE_WARM_CONCURRENCY"]
+    top = top or config["CACHE_WARM_TOP_HOUSES"]
+    begin = time.time()
+
+    # 1.重建redis被清空后不存在的索引，已存在的不重建
+    rebuilds = [
+        ("availability", availability.is_ready, availability.rebuild),
+        ("ranking", lambda: redis_store.exists(ranking.READY_KEY), ranking.rebuild),
+        ("house stats", house_stats.is_ready, house_stats.rebuild),
+        ("locations", lambda: redis_store.exists(locations.LOCATIONS_KEY), locations.rebuild),
+        ("registered mobiles", lambda: redis_store.exists(mobiles.REGISTERED_MOBILES_KEY),
+         mobiles.rebuild_registered_mobiles),
+    ]
+    for name, exists, rebuild in rebuilds:
+        if not exists():
+            start = time.time()
+            print "rebuild %s: %d rows, %.1fs" % (name, rebuild(), time.time() - start)
+    index_time = time.time() - begin
+
+    # 2.需要预热的地址：热点缓存键与热点请求，区域，首页，完成订单数最多的房屋详情，每个区域与排序条件的第一页
+    # redis中有热点记录时保存到文件，没有时说明redis被清空过，从文件读取
+    hot = [hot_keys.key_to_url(key) for key, _ in hot_keys.top(constants.HOT_KEYS_TOP_SIZE)]
+    hot = [url for url in hot if url] + hot_urls.top(config["CACHE_HOT_URLS_MAX"])
+    if hot:
+        hot_urls.save(hot, config["CACHE_HOT_URLS_FILE"])
+    else:
+        hot = hot_urls.load(config["CACHE_HOT_URLS_FILE"])
+    house_ids = [int(house_id) for house_id in redis_store.zrevrange(ranking.RANKING_KEY, 0, top - 1)]
+    if not house_ids:
+        house_ids = [house_id for house_id, in db.session.query(House.id)
+                     .order_by(House.order_count.desc()).limit(top)]
+    area_ids = [""] + [area_id for area_id, in db.session.query(Area.id)]
+    urls = hot + ["/api/v1.0/areas", "/api/v1.0/houses/index"] + \
+        ["/api/v1.0/houses/%d" % house_id for house_id in house_ids] + \
+        ["/api/v1.0/houses?aid=%s&sk=%s&p=1" % (area_id, sort_key)
+         for area_id in area_ids for sort_key in list_cache.SORT_KEYS]
+    tasks = Queue.Queue()
+    seen = set()
+    for url in urls:
+        if url not in seen:
+            seen.add(url)
+            tasks.put(url)
+    failed = []
+
+    # 3.有限的并发请求接口，与正常请求相同的逻辑写入缓存
+    def worker():
+        client = app.test_client()
+        while True:
+            try:
+                url = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            # 带日期的房屋列表需要出现多次才缓存
+            for _ in xrange(constants.HOUSE_LIST_CACHE_ADMIT_HITS if "sd=" in url or "ed=" in url else 1):
+                resp = client.get(url)
+            if resp.status_code != 200 or str(json.loads(resp.data)["errno"]) != RET.OK:
+                failed.append(url)
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for _ in xrange(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for url in failed:
+        print "failed: %s" % url
+    print "indexes %.1fs, %d urls (%d hot) warmed in %.1fs with %d workers, %d failed, total %.1fs" % (
+        index_time, len(seen), len(hot), time.time() - start, concurrency, len(failed), time.time() - begin)
+
+
+@orders_manager.command
+def scheduler():
+    """常驻进程，按配置的间隔取消超时未接单的订单、完成已离店的订单，并定期重建房屋统计"""
+    from ihome import db
+    from ihome.utils import house_stats
+    from ihome.utils.order_states import expire_pending_orders, complete_past_orders
+    config = current_app.config
+    stats_rebuilt = 0
+    while True:
+        start = time.time()
+        if config["HOUSE_STATS_REBUILD_INTERVAL"] and start - stats_rebuilt >= config["HOUSE_STATS_REBUILD_INTERVAL"]:
+            try:
+                count = house_stats.rebuild()
+                current_app.logger.info("orders scheduler: house stats rebuilt, %d houses" % count)
+            except Exception as e:
+                current_app.logger.error(e)
+            finally:
+                # 结束只读的事务，之后的订单处理不使用它的快照
+                db.session.remove()
+            # 失败时也等到下一个间隔再重建，不影响订单的处理
+            stats_rebuilt = start
+        try:
+            now = datetime.datetime.now()
+            canceled = expire_pending_orders(now - datetime.timedelta(hours=config["ORDER_WAIT_ACCEPT_HOURS"]),
+                                             config["ORDER_SCHEDULER_BATCH_SIZE"])
+            completed = complete_past_orders(datetime.datetime.combine(now.date(), datetime.time()),
+                                             config["ORDER_SCHEDULER_BATCH_SIZE"])
+            current_app.logger.info("orders scheduler: %d canceled, %d completed" % (canceled, completed))
+        except Exception as e:
+            # 出错时等下一轮重试，已提交的批次不受影响
+            current_app.logger.error(e)
+        time.sleep(max(0, config["ORDER_SCHEDULER_INTERVAL"] - (time.time() - start)))
+
+
+@assets_manager.command
+def build():
+    """合并、压缩html引用的js/css，生成static/dist与清单文件"""
+    manifest = AssetBuilder(current_app.static_folder).build()
+    sources = set()
+    for url_paths in manifest["bundles"].values():
+        sources.update(url_paths)
+    print "%d个页面，%d个源文件合并为%d个文件" % (len(manifest["html"]), len(sources), len(manifest["bundles"]))
+
+
+@bench_manager.option("-m", "--mobile", dest="mobile", required=True, help=u"已注册的手机号")
+@bench_manager.option("-p", "--password", dest="password", required=True, help=u"密码")
+@bench_manager.option("-n", "--number", dest="number", type=int, default=1000, help=u"请求次数")
+def session(mobile, password, number):
+    """测试check_login与get_user_profile的每秒请求数"""
+    client = current_app.test_client()
+    resp = client.post("/api/v1.0/sessions", content_type="application/json",
+                       data='{"mobile":"%s","password":"%s"}' % (mobile, password), headers=csrf_headers(client))
+    if resp.status_code != 200 or '"errno": "0"' not in resp.data:
+        print "登录失败: %s" % resp.data
+        return
+    for url in ("/api/v1.0/session", "/api/v1.0/user"):
+        print "%s: %.1f requests/sec" % (url, measure(lambda: client.get(url), number))
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=1000, help=u"请求次数")
+def html(number):
+    """测试html页面路由的延迟"""
+    client = current_app.test_client()
+    # 第一次请求生成csrf_token并加载文件缓存
+    client.get("/index.html")
+    headers = [("Accept-Encoding", "gzip")]
+    costs = []
+    for _ in xrange(number):
+        start = time.time()
+        client.get("/index.html", headers=headers)
+        costs.append((time.time() - start) * 1000)
+    costs.sort()
+    print "/index.html: avg %.3fms p50 %.3fms p99 %.3fms" % (
+        sum(costs) / len(costs), costs[len(costs) / 2], costs[int(len(costs) * 0.99)])
+
+
+@bench_manager.option("-m", "--mobile", dest="mobile", required=True, help=u"已注册的手机号")
+@bench_manager.option("-p", "--password", dest="password", required=True, help=u"密码")
+@bench_manager.option("-n", "--number", dest="number", type=int, default=200, help=u"每个线程的登录次数")
+@bench_manager.option("-c", "--concurrency", dest="concurrency", type=int, default=4, help=u"并发线程数")
+def login(mobile, password, number, concurrency):
+    """测试登录接口的吞吐量"""
+    app = current_app._get_current_object()
+    data = '{"mobile":"%s","password":"%s"}' % (mobile, password)
+    results = {"ok": 0, "fail": 0}
+
+    def worker():
+        client = app.test_client()
+        # 每个线程的客户端有自己的session与csrf_token
+        headers = csrf_headers(client)
+        for _ in xrange(number):
+            resp = client.post("/api/v1.0/sessions", content_type="application/json", data=data, headers=headers)
+            results["ok" if '"errno": "0"' in resp.data else "fail"] += 1
+
+    threads = [threading.Thread(target=worker) for _ in xrange(concurrency)]
+    # 同一个手机号的连续登录会被限流，测试期间关闭限流
+    rate_limit_enabled = app.config.get("RATE_LIMIT_ENABLED", True)
+    app.config["RATE_LIMIT_ENABLED"] = False
+    start = time.time()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        app.config["RATE_LIMIT_ENABLED"] = rate_limit_enabled
+    elapsed = time.time() - start
+    print "login: %.1f requests/sec, %d ok, %d failed" % (
+        (results["ok"] + results["fail"]) / elapsed, results["ok"], results["fail"])
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=1000, help=u"请求次数")
+def ratelimit(number):
+    """从同一个ip连续登录，统计被限流的请求数与数据库查询数"""
+    from sqlalchemy import event
+    from ihome import db
+    from ihome import redis_store
+    client = current_app.test_client()
+    headers = csrf_headers(client)
+    counts = {"queries": 0, "limited": 0, "limited_queries": 0}
+    # 清除之前运行留下的测试ip计数，每次运行的结果一致
+    for key in redis_store.scan_iter("RateLimit_login_ip_10.0.0.1:*"):
+        redis_store.delete(key)
+
+    def count_query(*args):
+        counts["queries"] += 1
+
+    event.listen(db.engine, "before_cursor_execute", count_query)
+    try:
+        start = time.time()
+        for i in xrange(number):
+            queries = counts["queries"]
+            resp = client.post("/api/v1.0/sessions", content_type="application/json",
+                               data='{"mobile":"1380000%04d","password":"bench"}' % (i % 10000),
+                               headers=headers, environ_base={"REMOTE_ADDR": "10.0.0.1"})
+            if resp.status_code != 200:
+                print "请求失败: %s %s" % (resp.status_code, resp.data)
+                return
+            if '"errno": "4201"' in resp.data:
+                counts["limited"] += 1
+                counts["limited_queries"] += counts["queries"] - queries
+        elapsed = time.time() - start
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_query)
+    print "%.1f requests/sec, %d limited, %d queries in total, %d queries for limited requests" % (
+        number / elapsed, counts["limited"], counts["queries"], counts["limited_queries"])
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=100, help=u"每种情况的请求次数")
+@bench_manager.option("-r", "--redis-db", dest="redis_db", type=int, default=15, help=u"测试使用的redis库，不能是线上使用的库")
+def sms(number, redis_db):
+    """统计发送短信验证码接口每次调用的redis往返次数(含限流)与mysql查询次数，不会真正发送短信"""
+    from sqlalchemy import event
+    from ihome import db
+    from ihome.utils import sms as sms_module
+    from ihome.utils.mobiles import REGISTERED_MOBILES_KEY, rebuild_registered_mobiles
+    client = current_app.test_client()
+    counts = {"redis": 0, "mysql": 0, "counting": False}
+    send_template_sms = sms_module.CCP.send_template_sms
+
+    def count_query(*args):
+        counts["mysql"] += 1
+
+    # 过滤器的重建与删除、限流计数的清理都只在测试使用的库中进行
+    with scratch_redis(redis_db) as redis_store:
+        execute_command = redis_store.execute_command
+
+        def count_redis(*args, **kwargs):
+            # 只统计接口调用期间的往返，不含测试本身的准备与清理
+            counts["redis"] += counts["counting"]
+            return execute_command(*args, **kwargs)
+
+        redis_store.execute_command = count_redis
+        sms_module.CCP.send_template_sms = lambda *args: 0
+        event.listen(db.engine, "before_cursor_execute", count_query)
+        try:
+            for indexed in (True, False):
+                if indexed:
+                    rebuild_registered_mobiles()
+                else:
+                    redis_store.delete(REGISTERED_MOBILES_KEY)
+                counts.update(redis=0, mysql=0)
+                for i in xrange(number):
+                    # 全局限流不是这里要测的内容，每次请求前清掉全局计数
+                    for key in redis_store.scan_iter("RateLimit_sms_global:*"):
+                        redis_store.delete(key)
+                    redis_store.setex("ImageCode_bench%d" % i, 60, "ABCD")
+                    counts["counting"] = True
+                    client.get("/api/v1.0/smscode/1990000%04d?id=bench%d&text=abcd" % (i, i),
+                               environ_base={"REMOTE_ADDR": "10.1.%d.%d" % (i / 256, i % 256)})
+                    counts["counting"] = False
+                    redis_store.delete("SMSCode_1990000%04d" % i, "SendSMSCode_1990000%04d" % i)
+                print "%s: %.2f redis round trips, %.2f mysql queries per call" % (
+                    "with index" if indexed else "without index",
+                    float(counts["redis"]) / number, float(counts["mysql"]) / number)
+        finally:
+            redis_store.execute_command = execute_command
+            sms_module.CCP.send_template_sms = send_template_sms
+            event.remove(db.engine, "before_cursor_execute", count_query)
+            for pattern in ("RateLimit_*", "ImageCode_bench*", REGISTERED_MOBILES_KEY):
+                for key in redis_store.scan_iter(pattern):
+                    redis_store.delete(key)
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=10000000, help=u"模拟的注册用户数")
+@bench_manager.option("-q", "--queries", dest="queries", type=int, default=100000, help=u"查询未注册手机号的次数")
+def bloom(number, queries):
+    """模拟大量注册用户，统计布隆过滤器的构建时间、内存占用、误判率与查询速度"""
+    from ihome import redis_store, constants
+    from ihome.utils.mobiles import set_bloom_bits, check_registered_mobile
+    key = "RegisteredMobilesBloom_bench"
+    start = time.time()
+    bitmap = bytearray(constants.REGISTERED_MOBILES_BLOOM_BITS / 8)
+    for i in xrange(number):
+        set_bloom_bits(bitmap, "13%09d" % i)
+    redis_store.set(key, bytes(bitmap))
+    print "built for %d mobiles in %.1fs, %.1fMB" % (number, time.time() - start, len(bitmap) / 1024.0 / 1024)
+    try:
+        # 同样的手机号保存为集合时的内存占用，按抽样估算
+        sample = min(number, 100000)
+        redis_store.sadd(key + "_set", *["13%09d" % i for i in xrange(sample)])
+        set_bytes = redis_store.execute_command("MEMORY", "USAGE", key + "_set") * float(number) / sample
+        print "a set of the same mobiles would take about %.1fMB" % (set_bytes / 1024 / 1024)
+    except Exception as e:
+        print "set memory not measured: %s" % e
+    finally:
+        redis_store.delete(key + "_set")
+    try:
+        false_positives = [0]
+        mobiles = iter(xrange(queries))
+
+        def query():
+            if check_registered_mobile("15%09d" % next(mobiles), key):
+                false_positives[0] += 1
+
+        rate = measure(query, queries)
+        print "%d lookups of unregistered mobiles: %.1f lookups/sec, false positive rate %.3f%%" % (
+            queries, rate, false_positives[0] * 100.0 / queries)
+    finally:
+        redis_store.delete(key)
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=1000000, help=u"生成的待接单订单数")
+@bench_manager.option("-b", "--batch-size", dest="batch_size", type=int, default=1000, help=u"每批修改的订单数")
+def orders(number, batch_size):
+    """生成大量超时的待接单订单，测试批量取消的速度，结束后删除生成的数据"""
+    from ihome import db
+    from ihome.models import User, Area, House, Order
+    from ihome.utils.order_states import bulk_transition
+    created = datetime.datetime.now() - datetime.timedelta(days=365)
+    user = User(name="bench_orders", mobile="19900000000", password_hash="-")
+    area = Area.query.first() or Area(name="bench_orders")
+    house = House(user=user, area=area, title="bench_orders")
+    db.session.add(house)
+    db.session.commit()
+    try:
+        start = time.time()
+        for offset in xrange(0, number, 10000):
+            db.session.execute(Order.__table__.insert(), [
+                {"user_id": user.id, "house_id": house.id, "begin_date": created, "end_date": created, "days": 1,
+                 "house_price": 0, "amount": 0, "status": "WAIT_ACCEPT", "create_time": created,
+                 "update_time": created} for _ in xrange(min(10000, number - offset))])
+            db.session.commit()
+        print "inserted %d orders in %.1fs" % (number, time.time() - start)
+        start = time.time()
+        # 与expire_pending_orders相同的批量修改，只取消生成的订单，不影响已有的数据
+        count = bulk_transition("WAIT_ACCEPT", "CANCELED", (Order.house_id == house.id,
+                                                            Order.create_time < created + datetime.timedelta(seconds=1)),
+                                batch_size)
+        elapsed = time.time() - start
+        print "expired %d orders in %.1fs, %.0f orders/sec" % (count, elapsed, count / elapsed)
+    finally:
+        db.session.rollback()
+        Order.query.filter(Order.house_id == house.id).delete(synchronize_session=False)
+        House.query.filter(House.id == house.id).delete(synchronize_session=False)
+        User.query.filter(User.id == user.id).delete(synchronize_session=False)
+        if area.name == "bench_orders":
+            Area.query.filter(Area.id == area.id).delete(synchronize_session=False)
+        db.session.commit()
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=5000, help=u"请求次数")
+@bench_manager.option("-s", "--seed", dest="seed", type=int, default=1, help=u"随机数种子")
+@bench_manager.option("-r", "--redis-db", dest="redis_db", type=int, default=15, help=u"测试使用的redis库，不能是线上使用的库")
+def listcache(number, seed, redis_db):
+    """按模拟的查询分布请求房屋列表，对比不限制与限制缓存键时的命中率与redis内存占用"""
+    from ihome import constants
+    from ihome.models import Area
+    from ihome.utils import list_cache
+    client = current_app.test_client()
+    area_ids = [area.id for area in Area.query.all()] or [1]
+
+    def queries():
+        return _list_queries(number, seed, area_ids, 0.4)
+
+    get_page = list_cache.get_page
+    settings = (constants.HOUSE_LIST_CACHE_MAX_KEYS, constants.HOUSE_LIST_CACHE_ADMIT_HITS)
+    with scratch_redis(redis_db) as redis_store:
+        def clear():
+            # 缓存键、访问记录与出现次数记录以houses_开头，访问频率记录以hot_keys_开头，只在测试使用的库中删除
+            for pattern in ("houses_*", "hot_keys_*"):
+                for key in redis_store.scan_iter(pattern):
+                    redis_store.delete(key)
+
+        try:
+            for name, max_keys, admit_hits in (("unbounded", 10 ** 9, 0), ("bounded", settings[0], settings[1])):
+                constants.HOUSE_LIST_CACHE_MAX_KEYS, constants.HOUSE_LIST_CACHE_ADMIT_HITS = max_keys, admit_hits
+                counts = {"hit": 0, "miss": 0}
+
+                def counting_get_page(redis_key, page):
+                    value, hits = get_page(redis_key, page)
+                    counts["miss" if value is None else "hit"] += 1
+                    return value, hits
+
+                list_cache.get_page = counting_get_page
+                clear()
+                start = time.time()
+                for url in queries():
+                    client.get(url)
+                elapsed = time.time() - start
+                keys, size = list_cache.memory_usage()
+                print "%s: %.1f%% hit rate, %d cached queries, %.1fKB, %.1f requests/sec" % (
+                    name, counts["hit"] * 100.0 / number, keys, size / 1024.0, number / elapsed)
+        finally:
+            list_cache.get_page = get_page
+            constants.HOUSE_LIST_CACHE_MAX_KEYS, constants.HOUSE_LIST_CACHE_ADMIT_HITS = settings
+            clear()
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=5000, help=u"请求次数")
+@bench_manager.option("-s", "--seed", dest="seed", type=int, default=1, help=u"随机数种子")
+@bench_manager.option("-r", "--redis-db", dest="redis_db", type=int, default=15, help=u"测试使用的redis库，不能是线上使用的库")
+def datesearch(number, seed, redis_db):
+    """回放带日期的房屋列表查询，对比只用页面缓存与使用占用集合过滤时的缓存命中率与sql查询数"""
+    from sqlalchemy import event
+    from ihome import db
+    from ihome.models import Area
+    from ihome.utils import list_cache, availability
+    client = current_app.test_client()
+    area_ids = [area.id for area in Area.query.all()] or [1]
+    counts = {}
+    get_page = list_cache.get_page
+    available_page = availability.available_page
+    load_house_ids = availability._load_house_ids
+
+    def counting_get_page(redis_key, page):
+        value, hits = get_page(redis_key, page)
+        counts["page_hits"] += value is not None
+        return value, hits
+
+    def counting_available_page(*args):
+        counts["id_lookups"] += 1
+        return available_page(*args)
+
+    def counting_load_house_ids(*args):
+        counts["id_loads"] += 1
+        return load_house_ids(*args)
+
+    def count_query(*args):
+        counts["queries"] += 1
+
+    with scratch_redis(redis_db) as redis_store:
+        def clear():
+            for pattern in ("houses_*", "house_ids_*", "booked_nights_*"):
+                for key in redis_store.scan_iter(pattern):
+                    redis_store.delete(key)
+
+        list_cache.get_page = counting_get_page
+        availability.available_page = counting_available_page
+        availability._load_house_ids = counting_load_house_ids
+        event.listen(db.engine, "before_cursor_execute", count_query)
+        try:
+            for name, ready in (("page cache only", False), ("availability filter", True)):
+                clear()
+                if ready:
+                    availability.rebuild()
+                counts.update(page_hits=0, id_lookups=0, id_loads=0, queries=0)
+                start = time.time()
+                for url in _list_queries(number, seed, area_ids, 1):
+                    client.get(url)
+                elapsed = time.time() - start
+                # 页面缓存命中，或页面缓存未命中但排好序的房屋编号已在redis中，都不需要执行列表查询
+                hits = counts["page_hits"] + counts["id_lookups"] - counts["id_loads"]
+                print "%s: %.1f%% page cache hits, %.1f%% served from cache, %.2f sql queries per request, " \
+                      "%.1f requests/sec" % (name, counts["page_hits"] * 100.0 / number, hits * 100.0 / number,
+                                             float(counts["queries"]) / number, number / elapsed)
+        finally:
+            list_cache.get_page = get_page
+            availability.available_page = available_page
+            availability._load_house_ids = load_house_ids
+            event.remove(db.engine, "before_cursor_execute", count_query)
+            clear()
+            redis_store.delete(availability.READY_KEY)
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=1000000, help=u"模拟的房屋数")
+@bench_manager.option("-q", "--queries", dest="queries", type=int, default=20, help=u"每种查询的次数")
+def search(number, queries):
+    """在内存中建立模拟房屋的搜索索引，对比索引查询与逐个检查全部房屋的耗时"""
+    import random
+    import resource
+    from ihome import constants
+    from ihome.utils.search import HouseIndex, tokenize
+    rand = random.Random(1)
+    words = [u"阳光", u"花园", u"公寓", u"海景", u"大床房", u"地铁", u"精装", u"温馨", u"复式", u"学区", u"江景",
+             u"别墅", u"民宿", u"商圈", u"整租", u"单间", u"家庭", u"套房", u"loft", u"近地铁口"]
+    districts = [u"朝阳区", u"海淀区", u"东城区", u"西城区", u"丰台区", u"通州区", u"昌平区", u"大兴区"]
+    streets = [u"建国", u"长安", u"中关村", u"望京", u"学院", u"和平", u"光华", u"花园"]
+    created = datetime.datetime(2018, 1, 1)
+
+    def house(house_id):
+        return (house_id, rand.randint(1, 20), u"".join(rand.sample(words, 3)),
+                u"%s%s路%d号" % (rand.choice(districts), rand.choice(streets), rand.randint(1, 300)),
+                rand.randint(50, 2000) * 100, rand.randint(1, 8), rand.randint(1, 5), rand.randint(0, 100),
+                created + datetime.timedelta(minutes=house_id), rand.getrandbits(24) << 1)
+
+    index = HouseIndex()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    for house_id in xrange(1, number + 1):
+        index.add(*house(house_id))
+    print "index %d houses: %.1fs, %d tokens, ~%dMB" % (
+        len(index), time.time() - start, len(index.postings),
+        (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024)
+
+    # 对比：每个房屋逐个检查标题、地址与属性
+    rand.seed(1)
+    houses = [house(house_id) for house_id in xrange(1, number + 1)]
+
+    def scan(query=u"", area_id=None, min_price=None, max_price=None, min_capacity=None, facilities=0,
+             sort_key="new", page=1):
+        tokens = tokenize(query)
+        matched = [row for row in houses
+                   if (not area_id or row[1] == area_id)
+                   and (min_price is None or row[4] >= min_price) and (max_price is None or row[4] <= max_price)
+                   and (not min_capacity or row[5] >= min_capacity) and row[9] & facilities == facilities
+                   and tokens <= tokenize(row[2] + u" " + row[3])]
+        if sort_key == "price-inc":
+            matched.sort(key=lambda row: (row[4], -row[0]))
+        else:
+            matched.sort(key=lambda row: -row[0])
+        capacity = constants.HOUSE_LIST_PAGE_CAPACITY
+        return [row[0] for row in matched[(page - 1) * capacity:page * capacity]], \
+            (len(matched) + capacity - 1) / capacity
+
+    cases = [
+        (u"keyword", dict(query=u"海景别墅")),
+        (u"keyword+area+price", dict(query=u"地铁", area_id=3, min_price=20000, max_price=50000)),
+        (u"facilities+capacity", dict(facilities=0b1110, min_capacity=6, sort_key="price-inc")),
+        (u"area+sort", dict(area_id=7, sort_key="price-inc", page=3)),
+    ]
+    for name, conditions in cases:
+        result = index.search(**conditions)
+        assert result == scan(**conditions), name
+        index_rate = measure(lambda: index.search(**conditions), queries)
+        scan_rate = measure(lambda: scan(**conditions), max(queries / 10, 1))
+        print "%s: %d pages, index %.2fms, scan %.0fms" % (
+            name, result[1], 1000.0 / index_rate, 1000.0 / scan_rate)
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=1000000, help=u"模拟的房屋数")
+@bench_manager.option("-q", "--queries", dest="queries", type=int, default=100, help=u"每种半径的查询次数")
+def nearby(number, queries):
+    """在临时的GEO集合中写入模拟的房屋位置，对比GEORADIUS与逐个计算距离的耗时"""
+    import math
+    import random
+    from ihome import redis_store, constants
+    from ihome.utils import locations
+    key = "bench_house_locations"
+    rand = random.Random(1)
+    # 北京五环内的范围
+    points = [(house_id, rand.uniform(116.20, 116.55), rand.uniform(39.75, 40.03))
+              for house_id in xrange(1, number + 1)]
+    redis_store.delete(key)
+    start = time.time()
+    for i in xrange(0, number, 10000):
+        locations.add_locations(points[i:i + 10000], key)
+    try:
+        size = redis_store.execute_command("MEMORY", "USAGE", key)
+    except Exception:
+        size = 0
+    print "geoadd %d points: %.1fs, %dMB" % (number, time.time() - start, size / 1024 / 1024)
+
+    def distance(lng1, lat1, lng2, lat2):
+        # 与redis相同的球面距离公式
+        lat1, lat2 = math.radians(lat1), math.radians(lat2)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + \
+            math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+        return 2 * 6372797.560856 * math.asin(math.sqrt(a))
+
+    def scan(longitude, latitude, radius, count):
+        found = []
+        for house_id, lng, lat in points:
+            d = distance(longitude, latitude, lng, lat)
+            if d <= radius:
+                found.append((d, house_id))
+        found.sort()
+        return [(house_id, d) for d, house_id in found[:count]]
+
+    try:
+        for radius in (500, 1000, 3000, 10000):
+            centers = [(rand.uniform(116.25, 116.50), rand.uniform(39.80, 39.98)) for _ in xrange(queries)]
+            total = 0
+            start = time.time()
+            for longitude, latitude in centers:
+                total += len(locations.nearby(longitude, latitude, radius, constants.HOUSE_NEARBY_MAX_RESULTS, key))
+            geo_ms = (time.time() - start) * 1000 / queries
+            start = time.time()
+            scan(centers[0][0], centers[0][1], radius, constants.HOUSE_NEARBY_MAX_RESULTS)
+            scan_ms = (time.time() - start) * 1000
+            print "radius %dm: %.0f houses on average, georadius %.2fms, scan %.0fms" % (
+                radius, float(total) / queries, geo_ms, scan_ms)
+    finally:
+        redis_store.delete(key)
+
+
+@bench_manager.option("-n", "--number", dest="number", type=int, default=100000, help=u"模拟缓存的房屋数")
+@bench_manager.option("-s", "--seed", dest="seed", type=int, default=1, help=u"随机数种子")
+def housecache(number, seed):
+    """在redis中写入模拟的房屋详情缓存，对比普通json与紧凑编码的内存占用、数据量与编码解码耗时"""
+    import random
+    from ihome import redis_store, constants
+    from ihome.utils import house_cache
+    rand = random.Random(seed)
+    words = u"房间干净整洁交通方便离地铁站很近房东热情周到设施齐全性价比高下次还会再来阳台采光好安静"
+
+    def text(low, high):
+        return u"".join(rand.choice(words) for _ in xrange(rand.randint(low, high)))
+
+    def house_dict(house_id):
+        # 评论数偏少的房屋占多数，热门房屋达到展示上限
+        comment_count = min(int(rand.expovariate(1.0 / 8)), constants.HOUSE_DETAIL_COMMENT_DISPLAY_COUNTS)
+        return {
+            "hid": house_id, "user_id": rand.randint(1, 100000), "user_name": u"房东%d" % rand.randint(1, 100000),
+            "user_avatar": constants.QINIU_DOMIN_PREFIX + "Fh%026x" % rand.getrandbits(104),
+            "title": text(6, 20), "price": rand.randint(50, 2000) * 100, "address": text(10, 30),
+            "room_count": rand.randint(1, 5), "acreage": rand.randint(20, 200), "unit": u"三室两厅",
+            "capacity": rand.randint(1, 10), "beds": u"双人床2x1.8x1", "deposit": 50000,
+            "min_days": 1, "max_days": 0,
+            "img_urls": [constants.QINIU_DOMIN_PREFIX + "Fh%026x" % rand.getrandbits(104)
+                         for _ in xrange(rand.randint(1, 10))],
+            "facilities": sorted(rand.sample(xrange(1, 24), rand.randint(3, 15))),
+            "comments": [{"comment": text(5, 60), "user_name": u"匿名用户",
+                          "ctime": "2017-%02d-%02d 12:00:00" % (rand.randint(1, 12), rand.randint(1, 28))}
+                         for _ in xrange(comment_count)]
+        }
+
+    houses = [house_dict(house_id) for house_id in xrange(1, number + 1)]
+    sample = houses[:min(number, 2000)]
+    for name, compact in (("plain json", False), ("compact", True)):
+        key = "bench_house_info_%s" % ("compact" if compact else "plain")
+        values = [house_cache.encode(house, compact) for house in houses]
+        markers = {}
+        for value in values:
+            markers[value[:1]] = markers.get(value[:1], 0) + 1
+        before = redis_store.info("memory")["used_memory"]
+        try:
+            for i in xrange(0, number, 10000):
+                pipe = redis_store.pipeline(transaction=False)
+                for house_id, value in zip(xrange(i + 1, i + 10001), values[i:i + 10000]):
+                    pipe.setex("%s_%d" % (key, house_id), 3600, value)
+                pipe.execute()
+            used = redis_store.info("memory")["used_memory"] - before
+        finally:
+            for i in xrange(0, number, 10000):
+                redis_store.delete(*["%s_%d" % (key, house_id) for house_id in xrange(i + 1, min(i + 10001, number + 1))])
+        encode_rate = measure(lambda: [house_cache.encode(house, compact) for house in sample], 5) * len(sample)
+        encoded = [house_cache.encode(house, compact) for house in sample]
+        decode_rate = measure(lambda: [house_cache.decode(value) for value in encoded], 5) * len(sample)
+        print "%s: %.1fMB per 100k houses in redis, %.0f bytes per entry, encode %.1fus, decode %.1fus%s" % (
+            name, used * 100000.0 / number / 1024 / 1024, float(sum(len(value) for value in values)) / number,
+            1000000.0 / encode_rate, 1000000.0 / decode_rate,
+            " (%d compressed)" % markers.get(house_cache.COMPRESSED, 0) if compact else "")
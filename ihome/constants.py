@@ -6,6 +6,21 @@ IMAGE_CODE_REDIS_EXPIRES = 300
 # 短信验证码Redis有效期，单位：秒
 SMS_CODE_REDIS_EXPIRES = 300
 
+# 同一手机号两次发送短信验证码的最小间隔，单位：秒
+SEND_SMS_CODE_INTERVAL = 60
+
+# 已注册手机号布隆过滤器的位数与哈希函数个数，2^27位(16MB)在1000万用户时误判率约0.2%，用户数增长后需要调大
+REGISTERED_MOBILES_BLOOM_BITS = 2 ** 27
+REGISTERED_MOBILES_BLOOM_HASHES = 7
+# 重建过滤器期间新注册手机号记录的有效期，每读取一批用户刷新一次，重建中断后记录自动删除，单位：秒
+REGISTERED_MOBILES_REBUILD_LOG_EXPIRES = 600
+
+# 手机号对应登录信息的redis缓存时间，单位：秒
+MOBILE_USER_REDIS_EXPIRES = 3600
+
+# 用户资料的redis缓存时间，单位：秒
+USER_PROFILE_REDIS_EXPIRES = 86400
+
 # 七牛空间域名
 QINIU_DOMIN_PREFIX = "http://ouwyn64sa.bkt.clouddn.com/"
 
@@ -24,8 +39,87 @@ HOUSE_DETAIL_COMMENT_DISPLAY_COUNTS = 30
 # 房屋详情页面数据Redis缓存时间，单位：秒
 HOUSE_DETAIL_REDIS_EXPIRE_SECOND = 7200
 
+# 房屋详情缓存紧凑编码后超过多少字节时用zlib压缩，与压缩级别
+HOUSE_DETAIL_CACHE_COMPRESS_MIN_BYTES = 512
+HOUSE_DETAIL_CACHE_COMPRESS_LEVEL = 6
+
 # 房屋列表页面每页显示条目数
 HOUSE_LIST_PAGE_CAPACITY = 2
 
-# 房屋列表页面Redis缓存时间，单位：秒
+# 房屋列表页面Redis缓存时间，单位：秒，只在缓存键新建时设置，写入其它页不会延长
 HOUSE_LIST_REDIS_EXPIRES = 7200
+
+# 房屋列表最多缓存的查询条件数，超出时淘汰最久未访问的
+HOUSE_LIST_CACHE_MAX_KEYS = 2000
+
+# 带日期的房屋列表查询出现多少次后才缓存
+HOUSE_LIST_CACHE_ADMIT_HITS = 2
+
+# 房屋列表按日期过滤时，日期范围小于多少天使用redis中的占用集合，更长的范围查询mysql
+HOUSE_LIST_FILTER_MAX_NIGHTS = 90
+
+# 带日期的房屋列表每次从排好序的房屋编号中读取的数量
+HOUSE_LIST_WALK_CHUNK = 500
+
+# 附近房屋查询的默认半径与最大半径，单位：米，GEORADIUS需要检查半径内的全部房屋，房屋密集时半径越大越慢
+HOUSE_NEARBY_DEFAULT_RADIUS = 3000
+HOUSE_NEARBY_MAX_RADIUS = 10000
+
+# 附近房屋查询最多考虑的最近房屋数，超出的房屋不返回
+HOUSE_NEARBY_MAX_RESULTS = 1000
+
+# 附近房屋每页数据容量
+HOUSE_NEARBY_PAGE_CAPACITY = 20
+
+# 房屋设施位图的位数，第i位表示编号为i的设施，数据库中为有符号的BIGINT，设施编号需要小于63
+HOUSE_FACILITY_BITS = 63
+
+# 房屋搜索索引的变化记录最多保留的房屋数，进程的索引落后更多时完整重建
+HOUSE_SEARCH_MAX_CHANGES = 100000
+
+# 房屋搜索关键词的最大长度
+HOUSE_SEARCH_MAX_QUERY_LENGTH = 64
+
+# 房屋价格分布的区间宽度与区间数，单位：分，最后一个区间包含更高的价格
+HOUSE_PRICE_HISTOGRAM_BUCKET = 10000
+HOUSE_PRICE_HISTOGRAM_BUCKETS = 20
+
+# 缓存键访问频率统计的count-min sketch宽度与行数，4行2048列时误差约为总访问次数的0.1%
+HOT_KEYS_SKETCH_WIDTH = 2048
+HOT_KEYS_SKETCH_DEPTH = 4
+
+# 访问频率统计的时间窗口，单位：秒，估计次数为当前与上一个窗口之和
+HOT_KEYS_WINDOW = 3600
+
+# 每个时间窗口记录的热点键数
+HOT_KEYS_TOP_SIZE = 100
+
+# 缓存有效期按访问频率调整：最近访问次数达到HOT的键有效期乘以系数，低于COLD的键除以系数
+# 估计次数不到一次抽样对应的访问次数(1/抽样比例)时无法区分冷键与没被抽到的键，使用原有效期，
+# 因此COLD需要大于1/抽样比例才会缩短
+HOT_KEYS_HOT_ACCESSES = 100
+HOT_KEYS_COLD_ACCESSES = 20
+HOT_KEYS_TTL_FACTOR = 4
+
+# 限流规则：(维度, 时间窗口，单位：秒, 窗口内最多请求数)，维度为ip/mobile/global
+# 登录接口
+LOGIN_RATE_LIMITS = (("ip", 60, 30), ("mobile", 300, 10), ("global", 1, 500))
+
+# 发送短信验证码接口
+SMS_RATE_LIMITS = (("ip", 3600, 20), ("mobile", 86400, 10), ("global", 1, 100))
+
+# 用户订单列表每页数据容量
+USER_ORDERS_PAGE_CAPACITY = 20
+
+# 用户订单列表第一页的redis缓存时间，单位：秒
+USER_ORDERS_REDIS_EXPIRES = 3600
+
+# 房东待接单收件箱保留的订单数与redis缓存时间，单位：秒
+LANDLORD_INBOX_MAX_ORDERS = 100
+LANDLORD_INBOX_REDIS_EXPIRES = 7 * 86400
+
+# 占用房屋日期的订单状态，已取消和已拒单的订单不影响房屋的预订
+ORDER_BLOCKING_STATUSES = ("WAIT_ACCEPT", "WAIT_PAYMENT", "PAID", "WAIT_COMMENT", "COMPLETE")
+
+# 批量预订接口一次最多预订的项数
+ORDER_BATCH_MAX_BOOKINGS = 100
@@ -1,8 +1,8 @@
 # -*- coding:utf-8 -*-
 
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from ihome import constants
+from ihome.utils.passwords import hash_password, verify_password
 from . import db
 
 
@@ -38,11 +38,11 @@ class User(BaseModel, db.Model):
     @password.setter
     def password(self, passwd):
         """设置password属性时被调用，设置密码加密"""
-        self.password_hash = generate_password_hash(passwd)
+        self.password_hash = hash_password(passwd)
 
     def check_password(self, passwd):
         """检查密码的正确性"""
-        return check_password_hash(self.password_hash, passwd)
+        return verify_password(self.password_hash, passwd)
 
     def to_dict(self):
         """将对象转换为字典数据"""
@@ -112,12 +112,20 @@ class House(BaseModel, db.Model):
     max_days = db.Column(db.Integer, default=0)  # 最多入住天数，0表示不限制
     order_count = db.Column(db.Integer, default=0)  # 预订完成的该房屋的订单数
     index_image_url = db.Column(db.String(256), default="")  # 房屋主图片的路径
+    facility_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")  # 房屋设施的位图，与facilities同时保存
+    longitude = db.Column(db.Float)  # 经度，未填写位置的房屋为空
+    latitude = db.Column(db.Float)  # 纬度
     facilities = db.relationship("Facility", secondary=house_facility)  # 房屋的设施
     images = db.relationship("HouseImage")  # 房屋的图片
     orders = db.relationship("Order", backref="house")  # 房屋的订单
 
     def to_basic_dict(self):
         """将基本信息转换为字典数据"""
+        # 房主头像从用户资料缓存中读取，不需要加载房主的完整记录
+        from ihome.utils.profiles import get_user_profile
+        profile = get_user_profile(self.user_id)
+        user_avatar = constants.QINIU_DOMIN_PREFIX + profile["avatar_url"] \
+            if profile and profile.get("avatar_url") else ""
         house_dict = {
             "house_id": self.id,
             "title": self.title,
@@ -127,7 +135,7 @@ class House(BaseModel, db.Model):
             "room_count": self.room_count,
             "order_count": self.order_count,
             "address": self.address,
-            "user_avatar": constants.QINIU_DOMIN_PREFIX + self.user.avatar_url if self.user.avatar_url else "",
+            "user_avatar": user_avatar,
             "ctime": self.create_time.strftime("%Y-%m-%d")
         }
         return house_dict
@@ -158,11 +166,9 @@ class House(BaseModel, db.Model):
             img_urls.append(constants.QINIU_DOMIN_PREFIX + image.url)
         house_dict["img_urls"] = img_urls
 
-        # 房屋设施
-        facilities = []
-        for facility in self.facilities:
-            facilities.append(facility.id)
-        house_dict["facilities"] = facilities
+        # 房屋设施，从位图中读取，不需要查询设施表
+        house_dict["facilities"] = [facility_id for facility_id in xrange(constants.HOUSE_FACILITY_BITS)
+                                    if self.facility_mask >> facility_id & 1]
 
         # 评论信息
         comments = []
@@ -202,6 +208,12 @@ class Order(BaseModel, db.Model):
     """订单"""
 
     __tablename__ = "ih_order_info"
+    __table_args__ = (
+        # 下单时检查某个房屋的日期冲突
+        db.Index("ix_ih_order_info_house_status_dates", "house_id", "status", "begin_date", "end_date"),
+        # 房屋列表按日期过滤时查询有冲突的房屋，索引覆盖查询的字段
+        db.Index("ix_ih_order_info_status_dates", "status", "begin_date", "end_date", "house_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)  # 订单编号
     user_id = db.Column(db.Integer, db.ForeignKey("ih_user_profile.id"), nullable=False)  # 下订单的用户编号
@@ -14,73 +14,141 @@ function getCookie(name) {
     return r ? r[1] : undefined;
 }
 
+// 新订单按编号从大到小插入到列表顶部，已在列表中的订单不重复插入
+function prependOrders(orders) {
+    var fresh = [];
+    for (var i = orders.length - 1; i >= 0; i--) {
+        if (!$(".orders-list>li[order-id=" + orders[i].order_id + "]").length) {
+            fresh.push(orders[i]);
+        }
+    }
+    if (!fresh.length) return;
+    var html = template("orders-list-tmpl", {orders:fresh});
+    if ($(".orders-list>li").length) {
+        $(".orders-list").prepend(html);
+    } else {
+        // 列表为空时显示的是没有订单的提示
+        $(".orders-list").html(html);
+    }
+}
+
+// 长轮询房东的待接单收件箱，收到的新订单直接插入列表，下次从最新的订单之后查询
+// 没有新订单时稍后再查询，后台关闭长轮询(等待时间为0)时也不会连续请求
+function pollInbox(since) {
+    $.get("/api/v1.0/user/orders/inbox?since=" + since, function(resp){
+        if ("0" == resp.errno) {
+            if (resp.data.orders.length) {
+                prependOrders(resp.data.orders);
+                pollInbox(resp.data.since);
+            } else {
+                setTimeout(function(){ pollInbox(resp.data.since); }, 3000);
+            }
+        }
+    }).fail(function(){
+        setTimeout(function(){ pollInbox(since); }, 5000);
+    });
+}
+
+var next_cursor = null;  // 下一页的游标，没有下一页时为null
+var orders_querying = false;   // 是否正在向后台获取数据
+
 $(document).ready(function(){
     $('.modal').on('show.bs.modal', centerModals);      //当模态框出现的时候
     $(window).on('resize', centerModals);
-    // 查询房东的订单
-    $.get("/api/v1.0/user/orders?role=landlord", function(resp){
+    loadOrders(null, function(orders){
+        pollInbox(orders.length ? orders[0].order_id : 0);
+    });
+    // 滚动到底部时加载下一页
+    var windowHeight = $(window).height();
+    $(window).on("scroll", function(){
+        var b = document.documentElement.scrollTop==0? document.body.scrollTop : document.documentElement.scrollTop;
+        var c = document.documentElement.scrollTop==0? document.body.scrollHeight : document.documentElement.scrollHeight;
+        if (c-b < windowHeight+50 && next_cursor && !orders_querying) {
+            loadOrders(next_cursor);
+        }
+    });
+    // 追加的订单也需要响应，在列表上委托处理
+    $(".orders-list").on("click", ".order-accept", function(){
+        var orderId = $(this).parents("li").attr("order-id");
+        $(".modal-accept").attr("order-id", orderId);
+    });
+    // 接单处理
+    $(".modal-accept").on("click", function(){
+        var orderId = $(this).attr("order-id");
+        $.ajax({
+            url:"/api/v1.0/orders/"+orderId+"/status",
+            type:"PUT",
+            data:'{"action":"accept"}',
+            contentType:"application/json",
+            dataType:"json",
+            headers:{
+                "X-CSRFTOKEN":getCookie("csrf_token"),
+            },
+            success:function (resp) {
+                if ("4101" == resp.errno) {
+                    location.href = "/login.html";
+                } else if ("0" == resp.errno) {
+                    $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已接单");
+                    $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
+                    $("#accept-modal").modal("hide");
+                }
+            }
+        })
+    });
+    $(".orders-list").on("click", ".order-reject", function(){
+        var orderId = $(this).parents("li").attr("order-id");
+        $(".modal-reject").attr("order-id", orderId);
+    });
+    // 处理拒单
+    $(".modal-reject").on("click", function(){
+        var orderId = $(this).attr("order-id");
+        var reject_reason = $("#reject-reason").val();
+        if (!reject_reason) return;
+        var data = {
+            action: "reject",
+            reason:reject_reason
+        };
+        $.ajax({
+            url:"/api/v1.0/orders/"+orderId+"/status",
+            type:"PUT",
+            data:JSON.stringify(data),
+            contentType:"application/json",
+            headers: {
+                "X-CSRFTOKEN":getCookie("csrf_token")
+            },
+            dataType:"json",
+            success:function (resp) {
+                if ("4101" == resp.errno) {
+                    location.href = "/login.html";
+                } else if ("0" == resp.errno) {
+                    $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已拒单");
+                    $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
+                    $("#reject-modal").modal("hide");
+                }
+            }
+        });
+    });
+});
+
+// 查询房东的订单，cursor为空时从第一页重新加载，否则追加下一页
+function loadOrders(cursor, callback) {
+    var params = {role:"landlord", limit:20};
+    if (cursor) params.cursor = cursor;
+    orders_querying = true;
+    $.get("/api/v1.0/user/orders", params, function(resp){
+        orders_querying = false;
         if ("0" == resp.errno) {
-            $(".orders-list").html(template("orders-list-tmpl", {orders:resp.data.orders}));
-            $(".order-accept").on("click", function(){
-                var orderId = $(this).parents("li").attr("order-id");
-                $(".modal-accept").attr("order-id", orderId);
-            });
-            // 接单处理
-            $(".modal-accept").on("click", function(){
-                var orderId = $(this).attr("order-id");
-                $.ajax({
-                    url:"/api/v1.0/orders/"+orderId+"/status",
-                    type:"PUT",
-                    data:'{"action":"accept"}',
-                    contentType:"application/json",
-                    dataType:"json",
-                    headers:{
-                        "X-CSRFTOKEN":getCookie("csrf_token"),
-                    },
-                    success:function (resp) {
-                        if ("4101" == resp.errno) {
-                            location.href = "/login.html";
-                        } else if ("0" == resp.errno) {
-                            $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已接单");
-                            $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
-                            $("#accept-modal").modal("hide");
-                        }
-                    }
-                })
-            });
-            $(".order-reject").on("click", function(){
-                var orderId = $(this).parents("li").attr("order-id");
-                $(".modal-reject").attr("order-id", orderId);
-            });
-            // 处理拒单
-            $(".modal-reject").on("click", function(){
-                var orderId = $(this).attr("order-id");
-                var reject_reason = $("#reject-reason").val();
-                if (!reject_reason) return;
-                var data = {
-                    action: "reject",
-                    reason:reject_reason
-                };
-                $.ajax({
-                    url:"/api/v1.0/orders/"+orderId+"/status",
-                    type:"PUT",
-                    data:JSON.stringify(data),
-                    contentType:"application/json",
-                    headers: {
-                        "X-CSRFTOKEN":getCookie("csrf_token")
-                    },
-                    dataType:"json",
-                    success:function (resp) {
-                        if ("4101" == resp.errno) {
-                            location.href = "/login.html";
-                        } else if ("0" == resp.errno) {
-                            $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已拒单");
-                            $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
-                            $("#reject-modal").modal("hide");
-                        }
-                    }
-                });
-            })
+            next_cursor = resp.data.next_cursor;
+            if (!cursor) {
+                $(".orders-list").html(template("orders-list-tmpl", {orders:resp.data.orders}));
+            } else if (resp.data.orders.length) {
+                $(".orders-list").append(template("orders-list-tmpl", {orders:resp.data.orders}));
+            }
+            if (callback) {
+                callback(resp.data.orders);
+            }
         }
+    }).fail(function(){
+        orders_querying = false;
     });
-});
\ No newline at end of file
+}
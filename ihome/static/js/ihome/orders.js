@@ -14,46 +14,75 @@ function getCookie(name) {
     return r ? r[1] : undefined;
 }
 
+var next_cursor = null;  // 下一页的游标，没有下一页时为null
+var orders_querying = false;   // 是否正在向后台获取数据
+
+// 查询房客订单，cursor为空时从第一页重新加载，否则追加下一页
+function loadOrders(cursor) {
+    var params = {role:"custom", limit:20};
+    if (cursor) params.cursor = cursor;
+    orders_querying = true;
+    $.get("/api/v1.0/user/orders", params, function(resp){
+        orders_querying = false;
+        if ("0" == resp.errno) {
+            next_cursor = resp.data.next_cursor;
+            if (!cursor) {
+                $(".orders-list").html(template("orders-list-tmpl", {orders:resp.data.orders}));
+            } else if (resp.data.orders.length) {
+                $(".orders-list").append(template("orders-list-tmpl", {orders:resp.data.orders}));
+            }
+        }
+    }).fail(function(){
+        orders_querying = false;
+    });
+}
+
 $(document).ready(function(){
     $('.modal').on('show.bs.modal', centerModals);      //当模态框出现的时候
     $(window).on('resize', centerModals);
     // 查询房客订单//arttemplate
-    $.get("/api/v1.0/user/orders?role=custom", function(resp){
-        if ("0" == resp.errno) {
-            $(".orders-list").html(template("orders-list-tmpl", {orders:resp.data.orders}));
-            $(".order-comment").on("click", function(){
-                var orderId = $(this).parents("li").attr("order-id");
-                $(".modal-comment").attr("order-id", orderId);
-            });
-            $(".modal-comment").on("click", function(){
-                var orderId = $(this).attr("order-id");
-                var comment = $("#comment").val()
-                if (!comment) return;
-                var data = {
-                    order_id:orderId,
-                    comment:comment
-                };
-                // 处理评论
-                $.ajax({
-                    url:"/api/v1.0/orders/"+orderId+"/comment",
-                    type:"PUT",
-                    data:JSON.stringify(data),
-                    contentType:"application/json",
-                    dataType:"json",
-                    headers:{
-                        "X-CSRFTOKEN":getCookie("csrf_token"),
-                    },
-                    success:function (resp) {
-                        if ("4101" == resp.errno) {
-                            location.href = "/login.html";
-                        } else if ("0" == resp.errno) {
-                            $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已完成");
-                            $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
-                            $("#comment-modal").modal("hide");
-                        }
-                    }
-                });
-            });
+    loadOrders();
+    // 滚动到底部时加载下一页
+    var windowHeight = $(window).height();
+    $(window).on("scroll", function(){
+        var b = document.documentElement.scrollTop==0? document.body.scrollTop : document.documentElement.scrollTop;
+        var c = document.documentElement.scrollTop==0? document.body.scrollHeight : document.documentElement.scrollHeight;
+        if (c-b < windowHeight+50 && next_cursor && !orders_querying) {
+            loadOrders(next_cursor);
         }
     });
-});
\ No newline at end of file
+    // 追加的订单也需要响应，在列表上委托处理
+    $(".orders-list").on("click", ".order-comment", function(){
+        var orderId = $(this).parents("li").attr("order-id");
+        $(".modal-comment").attr("order-id", orderId);
+    });
+    $(".modal-comment").on("click", function(){
+        var orderId = $(this).attr("order-id");
+        var comment = $("#comment").val()
+        if (!comment) return;
+        var data = {
+            order_id:orderId,
+            comment:comment
+        };
+        // 处理评论
+        $.ajax({
+            url:"/api/v1.0/orders/"+orderId+"/comment",
+            type:"PUT",
+            data:JSON.stringify(data),
+            contentType:"application/json",
+            dataType:"json",
+            headers:{
+                "X-CSRFTOKEN":getCookie("csrf_token"),
+            },
+            success:function (resp) {
+                if ("4101" == resp.errno) {
+                    location.href = "/login.html";
+                } else if ("0" == resp.errno) {
+                    $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已完成");
+                    $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
+                    $("#comment-modal").modal("hide");
+                }
+            }
+        });
+    });
+});
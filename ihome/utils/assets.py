@@ -0,0 +1,180 @@
+# -*- coding:utf-8 -*-
+# 静态资源构建：合并、压缩、按内容哈希命名、预压缩js/css，并改写html中的引用
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import posixpath
+
+from ihome.utils.static_cache import gzip_compress, brotli
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+
+# 构建结果的输出目录(相对static目录)与清单文件
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# html中引用本地css/js的标签
+CSS_TAG_RE = re.compile(r'<link href="(/static/[^"?]+\.css)(?:\?[^"]*)?" rel="stylesheet">')
+JS_TAG_RE = re.compile(r'<script src="(/static/[^"?]+\.js)(?:\?[^"]*)?"></script>')
+# css中的url()引用
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+SOURCE_MAP_RE = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+
+
+def minify_css(css):
+    """去掉注释与多余的空白，不改变选择器的含义"""
+    css = CSS_COMMENT_RE.sub("", css)
+    css = re.sub(r'\s+', " ", css)
+    css = re.sub(r'\s*([{};,])\s*', r'\1', css)
+    css = re.sub(r':\s+', ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_js(js, name):
+    """有rjsmin时使用rjsmin，否则只去掉缩进、空行与整行注释"""
+    js = SOURCE_MAP_RE.sub("", js)
+    if name.endswith(".min.js"):
+        return js.strip()
+    if rjsmin is not None:
+        return rjsmin.jsmin(js)
+    lines = []
+    for line in js.splitlines():
+        line = line.strip()
+        if line and not line.startswith("//"):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def is_vendor(url_path):
+    """项目自己的js/css都在ihome子目录下，其余为第三方库"""
+    return not url_path.startswith(("/static/css/ihome/", "/static/js/ihome/"))
+
+
+def absolute_css_urls(css, url_path):
+    """合并后css文件的位置改变了，把相对路径的url()改成绝对路径"""
+    base = posixpath.dirname(url_path)
+
+    def replace(match):
+        url = match.group(2).strip()
+        if url.startswith(("/", "data:", "http:", "https:", "#")):
+            return match.group(0)
+        path, sep, query = url.partition("?")
+        if not sep:
+            path, sep, query = url.partition("#")
+        return "url(%s%s%s)" % (posixpath.normpath(posixpath.join(base, path)), sep, query)
+
+    return CSS_URL_RE.sub(replace, css)
+
+
+class AssetBuilder(object):
+    """构建static目录下html页面引用的css/js
+
+    每个页面中连续引用的css或js合并为一个文件，文件名带内容哈希，可以长期缓存；
+    内容相同的合并文件在页面之间共享。
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.dist_folder = os.path.join(static_folder, DIST_DIR)
+        self.manifest = {"html": {}, "bundles": {}}
+        self._sources = {}
+
+    def read_source(self, url_path, kind):
+        """读取并压缩一个被引用的文件，url_path形如/static/css/reset.css"""
+        if url_path not in self._sources:
+            with open(os.path.join(self.static_folder, url_path[len("/static/"):]), "rb") as f:
+                content = f.read()
+            if kind == "css":
+                content = minify_css(absolute_css_urls(content, url_path))
+            else:
+                content = minify_js(content, url_path)
+            self._sources[url_path] = content
+        return self._sources[url_path]
+
+    def write(self, relative_path, content):
+        """写入dist目录，同时写入预压缩文件"""
+        path = os.path.join(self.dist_folder, relative_path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(content)
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip_compress(content))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(brotli.compress(content))
+
+    def bundle(self, url_paths, kind):
+        """合并一组文件，返回合并文件的url"""
+        separator = "\n" if kind == "css" else ";\n"
+        content = separator.join([self.read_source(url_path, kind) for url_path in url_paths])
+        name = "%s.%s" % (hashlib.md5(content).hexdigest()[:12], kind)
+        url = "/static/%s/%s/%s" % (DIST_DIR, kind, name)
+        if url not in self.manifest["bundles"]:
+            self.write(os.path.join(kind, name), content)
+            self.manifest["bundles"][url] = url_paths
+        return url
+
+    def rewrite_group(self, url_paths, kind, template):
+        """一组相邻的引用按第三方库/项目文件拆成若干个合并文件，第三方库的合并文件在页面间共享"""
+        tags = []
+        run = []
+        for url_path in url_paths:
+            if run and is_vendor(run[-1]) != is_vendor(url_path):
+                tags.append(template % self.bundle(run, kind))
+                run = []
+            run.append(url_path)
+        tags.append(template % self.bundle(run, kind))
+        return "\n    ".join(tags)
+
+    def rewrite_html(self, html):
+        """把连续的css/js引用标签替换为合并文件的引用"""
+        for kind, tag_re, template in (
+                ("css", CSS_TAG_RE, '<link href="%s" rel="stylesheet">'),
+                ("js", JS_TAG_RE, '<script src="%s"></script>')):
+            # 只有空白分隔的相邻标签视为一组
+            group_re = re.compile(r'%s(?:\s*%s)*' % (tag_re.pattern, tag_re.pattern))
+            html = group_re.sub(
+                lambda match: self.rewrite_group(tag_re.findall(match.group(0)), kind, template), html)
+        return html
+
+    def build(self):
+        """构建所有html页面，返回清单"""
+        if os.path.isdir(self.dist_folder):
+            shutil.rmtree(self.dist_folder)
+        html_folder = os.path.join(self.static_folder, "html")
+        for name in sorted(os.listdir(html_folder)):
+            if not name.endswith(".html"):
+                continue
+            with open(os.path.join(html_folder, name), "rb") as f:
+                html = self.rewrite_html(f.read())
+            self.write(os.path.join("html", name), html)
+            self.manifest["html"][name] = "%s/html/%s" % (DIST_DIR, name)
+        with open(os.path.join(self.dist_folder, MANIFEST_NAME), "wb") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        return self.manifest
+
+
+# 已解析的清单(etag, 内容)
+_manifest = (None, None)
+
+
+def load_manifest(static_folder, static_cache):
+    """读取构建清单，清单文件变化后自动重新解析，没有构建过时返回None"""
+    global _manifest
+    static_file = static_cache.get(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME))
+    if static_file is None:
+        return None
+    etag, manifest = _manifest
+    if etag != static_file.etag:
+        manifest = json.loads(static_file.data)
+        _manifest = (static_file.etag, manifest)
+    return manifest
@@ -0,0 +1,172 @@
+# -*- coding:utf-8 -*-
+# 房屋列表的日期过滤：缓存与日期无关的按区域和排序条件排好序的房屋编号，
+# 再用每天被占用的房屋集合过滤，带日期的查询不需要每次都查询mysql
+
+import datetime
+
+from ihome import redis_store, db, constants
+from ihome.models import House, Order
+
+
+# 每天被占用的房屋编号集合，键为booked_nights_日期
+BOOKED_NIGHTS_KEY = "booked_nights_%s"
+# 占用集合从mysql完整建立后才设置，不存在时带日期的查询仍然查询mysql
+READY_KEY = "booked_nights_ready"
+
+
+def nights(begin_date, end_date):
+    """订单占用的每一天，起止日期都包含在内"""
+    return [begin_date + datetime.timedelta(days=i) for i in xrange((end_date - begin_date).days + 1)]
+
+
+def _night_key(night):
+    return BOOKED_NIGHTS_KEY % night.strftime("%Y%m%d")
+
+
+def _expire_at(night):
+    """这一天过去后集合就不再需要了"""
+    return int((night - datetime.datetime(1970, 1, 1)).total_seconds()) + 86400 * 2
+
+
+def add_bookings(bookings):
+    """订单生效后标记占用的日期，bookings为[(房屋编号, 起始日期, 结束日期), ...]"""
+    pipe = redis_store.pipeline(transaction=False)
+    for house_id, begin_date, end_date in bookings:
+        for night in nights(begin_date, end_date):
+            pipe.sadd(_night_key(night), house_id)
+            pipe.expireat(_night_key(night), _expire_at(night))
+    pipe.execute()
+
+
+def remove_bookings(bookings):
+    """订单被取消或拒绝后释放占用的日期，同一房屋同一天只会有一个占用的订单"""
+    pipe = redis_store.pipeline(transaction=False)
+    for house_id, begin_date, end_date in bookings:
+        for night in nights(begin_date, end_date):
+            pipe.srem(_night_key(night), house_id)
+    pipe.execute()
+
+
+def is_ready():
+    return bool(redis_store.exists(READY_KEY))
+
+
+def booked_houses(start_date, end_date):
+    """查询日期范围内有任意一天被占用的房屋编号"""
+    keys = [_night_key(night) for night in nights(start_date, end_date)]
+    return set(int(house_id) for house_id in redis_store.sunion(keys))
+
+
+def rebuild(batch_size=10000):
+    """从mysql中未结束的占用订单重建占用集合，返回订单数"""
+    redis_store.delete(READY_KEY)
+    for key in redis_store.scan_iter(BOOKED_NIGHTS_KEY % "*"):
+        redis_store.delete(key)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Order.id, Order.house_id, Order.begin_date, Order.end_date)\
+            .filter(Order.id > last_id, Order.status.in_(constants.ORDER_BLOCKING_STATUSES),
+                    Order.end_date >= today)\
+            .order_by(Order.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+        # 已经过去的日期不需要标记
+        add_bookings([(house_id, max(begin_date, today), end_date) for _, house_id, begin_date, end_date in rows])
+        count += len(rows)
+        last_id = rows[-1][0]
+    redis_store.set(READY_KEY, 1)
+    return count
+
+
+# 按区域与排序条件排好序的房屋编号列表
+HOUSE_IDS_KEY = "house_ids_%s_%s"
+
+# 在排好序的房屋编号列表中分段读取，跳过任意一天被占用的房屋，凑满一页后停止
+# KEYS[1]: 房屋编号列表, KEYS[2...]: 每天的占用集合; ARGV: 跳过的可预订房屋数, 需要的房屋数, 每段读取的数量
+# 列表不存在(或是之前保存的json字符串)时返回-1，否则返回{跳过的房屋数, 需要的房屋数之后是否还有房屋, 房屋编号...}
+_walk = redis_store.register_script("""
+if redis.call('type', KEYS[1]).ok ~= 'list' then
+    return -1
+end
+local skip, count, chunk = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local skipped, found, start = 0, {}, 0
+while true do
+    local ids = redis.call('lrange', KEYS[1], start, start + chunk - 1)
+    for _, house_id in ipairs(ids) do
+        local booked = false
+        for i = 2, #KEYS do
+            if redis.call('sismember', KEYS[i], house_id) == 1 then
+                booked = true
+                break
+            end
+        end
+        if not booked then
+            if skipped < skip then
+                skipped = skipped + 1
+            elseif #found < count then
+                found[#found + 1] = house_id
+            else
+                return {skipped, 1, unpack(found)}
+            end
+        end
+    end
+    if #ids < chunk then
+        return {skipped, 0, unpack(found)}
+    end
+    start = start + chunk
+end
+""")
+
+
+def _load_house_ids(area_id, sort_key):
+    """从mysql读取排好序的房屋编号写入列表，先写入临时键再替换，返回是否有房屋"""
+    query = db.session.query(House.id)
+    if area_id:
+        query = query.filter(House.area_id == area_id)
+    if 'booking' == sort_key:
+        query = query.order_by(House.order_count.desc())
+    elif 'price-inc' == sort_key:
+        query = query.order_by(House.price.asc())
+    elif 'price-des' == sort_key:
+        query = query.order_by(House.price.desc())
+    else:
+        query = query.order_by(House.create_time.desc())
+    house_ids = [house_id for house_id, in query]
+    if not house_ids:
+        return False
+    redis_key = HOUSE_IDS_KEY % (area_id, sort_key)
+    building_key = redis_key + "_building"
+    pipe = redis_store.pipeline()
+    pipe.delete(building_key)
+    for i in xrange(0, len(house_ids), 10000):
+        pipe.rpush(building_key, *house_ids[i:i + 10000])
+    pipe.rename(building_key, redis_key)
+    pipe.expire(redis_key, constants.HOUSE_LIST_REDIS_EXPIRES)
+    pipe.execute()
+    return True
+
+
+def discard_house_ids(area_id):
+    """发布房屋后删除区域与全部区域的房屋编号列表，下次查询时重新读取"""
+    from ihome.utils.list_cache import SORT_KEYS
+    redis_store.delete(*[HOUSE_IDS_KEY % (area, sort_key) for area in (area_id, "") for sort_key in SORT_KEYS])
+
+
+def available_page(area_id, sort_key, start_date, end_date, page, capacity):
+    """在排好序的房屋编号中跳过被占用的房屋，返回(这一页的房屋编号, 总页数)
+
+    只读取到这一页的下一个可预订房屋为止，总页数不精确：后面还有房屋时为当前页数加1
+    """
+    keys = [HOUSE_IDS_KEY % (area_id, sort_key)] + [_night_key(night) for night in nights(start_date, end_date)]
+    args = [(page - 1) * capacity, capacity, constants.HOUSE_LIST_WALK_CHUNK]
+    result = _walk(keys=keys, args=args)
+    if result == -1:
+        if not _load_house_ids(area_id, sort_key):
+            return [], 0
+        result = _walk(keys=keys, args=args)
+    skipped, has_more, page_ids = result[0], result[1], [int(house_id) for house_id in result[2:]]
+    if has_more:
+        return page_ids, page + 1
+    return page_ids, (skipped + len(page_ids) + capacity - 1) / capacity
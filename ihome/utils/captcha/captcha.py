@@ -6,6 +6,10 @@
 import random
 import string
 import os.path
+import multiprocessing
+import sys
+import threading
+import time
 from cStringIO import StringIO
 
 from PIL import Image
@@ -59,6 +63,11 @@ class Captcha(object):
         self._bezier = Bezier()
         self._dir = os.path.dirname(__file__)
         # self._captcha_path = os.path.join(self._dir, '..', 'static', 'captcha')
+        self.fonts = tuple([os.path.join(self._dir, 'fonts', font) for font in ['Arial.ttf', 'Georgia.ttf', 'actionj.ttf']])
+        # 字体对象与字形位图在进程内只加载/渲染一次，之后只读
+        self._lock = threading.Lock()
+        self._font_cache = {}
+        self._glyph_cache = {}
 
     @staticmethod
     def instance():
@@ -67,13 +76,47 @@ class Captcha(object):
         return Captcha._instance
 
     def initialize(self, width=200, height=75, color=None, text=None, fonts=None):
+        """Return the options of one captcha.
+
+        The instance itself is never modified, so one instance can serve
+        any number of threads at the same time.
+        """
         # self.image = Image.new('RGB', (width, height), (255, 255, 255))
-        self._text = text if text else random.sample(string.uppercase + string.uppercase + '3456789', 4)
-        self.fonts = fonts if fonts else \
-            [os.path.join(self._dir, 'fonts', font) for font in ['Arial.ttf', 'Georgia.ttf', 'actionj.ttf']]
-        self.width = width
-        self.height = height
-        self._color = color if color else self.random_color(0, 200, random.randint(220, 255))
+        return {
+            'text': text if text else random.sample(string.uppercase + string.uppercase + '3456789', 4),
+            'color': color if color else self.random_color(0, 200, random.randint(220, 255)),
+            'fonts': tuple(fonts) if fonts else self.fonts,
+            'width': width,
+            'height': height,
+        }
+
+    def load_fonts(self, fonts, font_sizes=None):
+        """Return the truetype objects for fonts x sizes, loading each only once."""
+        key = (tuple(fonts), tuple(font_sizes or (65, 70, 75)))
+        try:
+            return self._font_cache[key]
+        except KeyError:
+            with self._lock:
+                if key not in self._font_cache:
+                    self._font_cache[key] = tuple([(name, size, truetype(name, size))
+                                                   for name in key[0]
+                                                   for size in key[1]])
+            return self._font_cache[key]
+
+    def glyph(self, c, font):
+        """Return the cropped 'L' mode bitmap of one character, rendered only once."""
+        name, size, truetype_font = font
+        key = (c, name, size)
+        try:
+            return self._glyph_cache[key]
+        except KeyError:
+            c_width, c_height = truetype_font.getsize(c)
+            glyph = Image.new('L', (c_width, c_height), 0)
+            Draw(glyph).text((0, 0), c, font=truetype_font, fill=255)
+            glyph = glyph.crop(glyph.getbbox())
+            with self._lock:
+                self._glyph_cache.setdefault(key, glyph)
+            return self._glyph_cache[key]
 
     @staticmethod
     def random_color(start, end, opacity=None):
@@ -94,59 +137,58 @@ class Captcha(object):
     def smooth(image):
         return image.filter(ImageFilter.SMOOTH)
 
-    def curve(self, image, width=4, number=6, color=None):
+    def curve(self, image, color, width=4, number=6):
         dx, height = image.size
         dx /= number
         path = [(dx * i, random.randint(0, height))
                 for i in xrange(1, number)]
         bcoefs = self._bezier.make_bezier(number - 1)
-        points = []
-        for coefs in bcoefs:
-            points.append(tuple(sum([coef * p for coef, p in zip(coefs, ps)])
-                                for ps in zip(*path)))
-        Draw(image).line(points, fill=color if color else self._color, width=width)
+        xs, ys = zip(*path)
+        points = [(sum([coef * x for coef, x in zip(coefs, xs)]),
+                   sum([coef * y for coef, y in zip(coefs, ys)]))
+                  for coefs in bcoefs]
+        Draw(image).line(points, fill=color[:3], width=width)
         return image
 
-    def noise(self, image, number=50, level=2, color=None):
+    def noise(self, image, color, number=50, level=2):
         width, height = image.size
         dx = width / 10
         width -= dx
         dy = height / 10
         height -= dy
-        draw = Draw(image)
-        for i in xrange(number):
-            x = int(random.uniform(dx, width))
-            y = int(random.uniform(dy, height))
-            draw.line(((x, y), (x + level, y)), fill=color if color else self._color, width=level)
+        # 所有噪点一次性交给PIL绘制，避免逐条调用draw.line
+        half = level // 2
+        points = [(x + i, y + j)
+                  for x, y in [(int(random.uniform(dx, width)), int(random.uniform(dy, height)))
+                               for _ in xrange(number)]
+                  for i in xrange(level + 1)
+                  for j in xrange(-half, level - half)]
+        Draw(image).point(points, fill=color[:3])
         return image
 
-    def text(self, image, fonts, font_sizes=None, drawings=None, squeeze_factor=0.75, color=None):
-        color = color if color else self._color
-        fonts = tuple([truetype(name, size)
-                       for name in fonts
-                       for size in font_sizes or (65, 70, 75)])
-        draw = Draw(image)
+    def text(self, image, text, fonts, color, font_sizes=None, drawings=None, squeeze_factor=0.75):
+        fonts = self.load_fonts(fonts, font_sizes)
         char_images = []
-        for c in self._text:
-            font = random.choice(fonts)
-            c_width, c_height = draw.textsize(c, font=font)
-            char_image = Image.new('RGB', (c_width, c_height), (0, 0, 0))
-            char_draw = Draw(char_image)
-            char_draw.text((0, 0), c, font=font, fill=color)
-            char_image = char_image.crop(char_image.getbbox())
-            for drawing in drawings:
+        for c in text:
+            char_image = self.glyph(c, random.choice(fonts))
+            for drawing in drawings or ():
                 d = getattr(self, drawing)
                 char_image = d(char_image)
             char_images.append(char_image)
+        # 字形位图是白色蒙版，按文字颜色的亮度缩放后作为粘贴蒙版
+        red, green, blue = color[:3]
+        scale = (red * 299 + green * 587 + blue * 114) / 1000.0 / 255 * 1.97
+        table = [min(255, int(i * scale)) for i in range(256)]
         width, height = image.size
         offset = int((width - sum(int(i.size[0] * squeeze_factor)
                                   for i in char_images[:-1]) -
                       char_images[-1].size[0]) / 2)
         for char_image in char_images:
             c_width, c_height = char_image.size
-            mask = char_image.convert('L').point(lambda i: i * 1.97)
-            image.paste(char_image,
-                        (offset, int((height - c_height) / 2)),
+            mask = char_image.point(table)
+            image.paste(color[:3],
+                        (offset, int((height - c_height) / 2),
+                         offset + c_width, int((height - c_height) / 2) + c_height),
                         mask)
             offset += int(c_width * squeeze_factor)
         return image
@@ -161,7 +203,7 @@ class Captcha(object):
         y1 = int(random.uniform(-dy, dy))
         x2 = int(random.uniform(-dx, dx))
         y2 = int(random.uniform(-dy, dy))
-        image2 = Image.new('RGB',
+        image2 = Image.new(image.mode,
                            (width + abs(x1) + abs(x2),
                             height + abs(y1) + abs(y2)))
         image2.paste(image, (abs(x1), abs(y1)))
@@ -178,7 +220,7 @@ class Captcha(object):
         width, height = image.size
         dx = int(random.random() * width * dx_factor)
         dy = int(random.random() * height * dy_factor)
-        image2 = Image.new('RGB', (width + dx, height + dy))
+        image2 = Image.new(image.mode, (width + dx, height + dy))
         image2.paste(image, (dx, dy))
         return image2
 
@@ -187,10 +229,11 @@ class Captcha(object):
         return image.rotate(
             random.uniform(-angle, angle), Image.BILINEAR, expand=1)
 
-    def captcha(self, path=None, fmt='JPEG'):
+    def captcha(self, options, path=None, fmt='JPEG'):
         """Create a captcha.
 
         Args:
+            options: text, color, fonts and size returned by `initialize`.
             path: save path, default None.
             fmt: image format, PNG / JPEG.
         Returns:
@@ -199,25 +242,88 @@ class Captcha(object):
                 ('fXZJN4AFxHGoU5mIlcsdOypa', 'JGW9', '\x89PNG\r\n\x1a\n\x00\x00\x00\r...')
 
         """
-        image = Image.new('RGB', (self.width, self.height), (255, 255, 255))
+        text, color = options['text'], options['color']
+        image = Image.new('RGB', (options['width'], options['height']), (255, 255, 255))
         image = self.background(image)
-        image = self.text(image, self.fonts, drawings=['warp', 'rotate', 'offset'])
-        image = self.curve(image)
-        image = self.noise(image)
+        image = self.text(image, text, options['fonts'], color, drawings=['warp', 'rotate', 'offset'])
+        image = self.curve(image, color)
+        image = self.noise(image, color)
         image = self.smooth(image)
         name = "".join(random.sample(string.lowercase + string.uppercase + '3456789', 24))
-        text = "".join(self._text)
+        text = "".join(text)
         out = StringIO()
         image.save(out, format=fmt)
         if path:
             image.save(os.path.join(path, name), fmt)
         return name, text, out.getvalue()
 
-    def generate_captcha(self):
-        self.initialize()
-        return self.captcha("")
+    def generate_captcha(self, **kwargs):
+        return self.captcha(self.initialize(**kwargs), "")
+
+
+def generate_captcha(**kwargs):
+    """Module level entry point, picklable for `multiprocessing` workers."""
+    return Captcha.instance().generate_captcha(**kwargs)
+
+
+class CaptchaPool(object):
+    """Render captchas in a pool of worker processes.
+
+    Each worker keeps its own font and glyph caches, so the request threads
+    only wait for the encoded image.
+    """
+
+    def __init__(self, processes):
+        self._pool = multiprocessing.Pool(processes)
+
+    def generate_captcha(self, timeout=5, **kwargs):
+        return self._pool.apply_async(generate_captcha, kwds=kwargs).get(timeout)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+def benchmark(seconds=5, processes=0):
+    """Render captchas for `seconds` and return images/sec.
+
+    With `processes` = 0 the images are rendered in this process (one core),
+    otherwise 4 * `processes` threads share a `CaptchaPool`.
+    """
+    if processes:
+        pool = CaptchaPool(processes)
+        render = pool.generate_captcha
+    else:
+        render = Captcha.instance().generate_captcha
+    # 预热字体与字形缓存，不计入测试时间
+    render()
+    counts = []
+
+    def worker():
+        count = 0
+        while time.time() - start < seconds:
+            render()
+            count += 1
+        counts.append(count)
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for _ in xrange(processes * 4 or 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    if processes:
+        pool.close()
+    return sum(counts) / elapsed
+
 
 captcha = Captcha.instance()
 
 if __name__ == '__main__':
-    print captcha.generate_captcha()
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+        processes = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+        print '%.1f images/sec with %s process(es)' % (benchmark(seconds, processes), processes or 1)
+    else:
+        print captcha.generate_captcha()
@@ -2,9 +2,10 @@
 
 import functools
 
-from flask import g, session, jsonify
+from flask import g, session, jsonify, current_app, request
 from werkzeug.routing import BaseConverter
 from ihome.utils.response_code import RET
+from ihome.utils.session import load_auth_token
 
 
 class RegexConverter(BaseConverter):
@@ -14,11 +15,19 @@ class RegexConverter(BaseConverter):
         self.regex = args[0]
 
 
+def get_login_user():
+    """获取当前登录用户的(user_id, name)，优先校验无状态令牌，未登录时user_id为None"""
+    token = load_auth_token(current_app, request)
+    if token is not None:
+        return token.get("user_id"), token.get("name")
+    return session.get("user_id"), session.get("name")
+
+
 def login_required(f):
     """要求用户登录的验证装饰器"""
     @functools.wraps(f)
     def wrapper(*args, **kwargs):
-        user_id = session.get("user_id")
+        user_id = get_login_user()[0]
         if user_id is None:
             return jsonify(errno=RET.SESSIONERR, errmsg="用户未登录")
         else:
@@ -28,3 +37,34 @@ def login_required(f):
     return wrapper
 
 
+
+
+def rate_limit(scope, rules):
+    """限流装饰器，超过rules中任意一条规则时直接拒绝，不执行视图函数
+
+    :param scope: 限流的接口名，不同接口分别计数
+    :param rules: ((维度, 窗口秒数, 窗口内最多请求数), ...)，维度为ip/mobile/global
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get("RATE_LIMIT_ENABLED", True):
+                return f(*args, **kwargs)
+            # ratelimit依赖ihome中的redis实例，在这里导入避免循环导入
+            from ihome.utils.ratelimit import check_rate_limits
+            mobile = kwargs.get("mobile")
+            if mobile is None:
+                data = request.get_json(silent=True)
+                mobile = data.get("mobile") if isinstance(data, dict) else None
+            try:
+                exceeded = check_rate_limits(scope, rules, {"ip": request.remote_addr, "mobile": mobile})
+            except Exception as e:
+                # 限流失败时放行，不影响正常业务
+                current_app.logger.error(e)
+                exceeded = None
+            if exceeded is not None:
+                current_app.logger.warn("rate limit %s exceeded by %s" % (scope, exceeded))
+                return jsonify(errno=RET.REQERR, errmsg="请求过于频繁，请稍后重试")
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
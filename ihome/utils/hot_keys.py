@@ -0,0 +1,175 @@
+# -*- coding:utf-8 -*-
+# 缓存键的访问频率：每个进程用count-min sketch抽样计数，定期合并到redis中当前时间窗口的sketch，
+# 同时记录估计访问次数最多的键；用于按热度调整缓存有效期、缓存预热与查看热点键
+
+import time
+import random
+import struct
+import hashlib
+import threading
+from array import array
+
+from flask import current_app
+
+from ihome import redis_store, constants
+
+
+# 时间窗口的sketch，哈希，字段为"行:列"，值为抽样次数
+SKETCH_KEY = "hot_keys_sketch_%d"
+# 时间窗口内估计次数最多的键，有序集合
+TOP_KEY = "hot_keys_top_%d"
+
+# 合并一个进程的计数，并按合并后的sketch更新候选键的估计次数
+# KEYS: SKETCH_KEY, TOP_KEY; ARGV: 有效期, 保留的键数, sketch行数, 计数个数n, n组(字段, 次数), 候选键与各行的列...
+_merge = redis_store.register_script("""
+local ttl, size, depth, n = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+for i = 5, 4 + n * 2, 2 do
+    redis.call('hincrby', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+for i = 5 + n * 2, #ARGV, depth + 1 do
+    local estimate
+    for row = 0, depth - 1 do
+        local count = tonumber(redis.call('hget', KEYS[1], row .. ':' .. ARGV[i + 1 + row]) or 0)
+        if not estimate or count < estimate then
+            estimate = count
+        end
+    end
+    redis.call('zadd', KEYS[2], estimate, ARGV[i])
+end
+local extra = redis.call('zcard', KEYS[2]) - size
+if extra > 0 then
+    redis.call('zremrangebyrank', KEYS[2], 0, extra - 1)
+end
+redis.call('expire', KEYS[1], ttl)
+redis.call('expire', KEYS[2], ttl)
+return 1
+""")
+
+
+def columns(key):
+    """键在sketch每一行中的列，由md5的两段组合出所需行数的哈希值"""
+    h1, h2 = struct.unpack("<QQ", hashlib.md5(key).digest())
+    width = constants.HOT_KEYS_SKETCH_WIDTH
+    return [(h1 + i * h2) % width for i in xrange(constants.HOT_KEYS_SKETCH_DEPTH)]
+
+
+def _window(offset=0):
+    return int(time.time()) / constants.HOT_KEYS_WINDOW - offset
+
+
+class LocalSketch(object):
+    """一个进程在两次合并之间的抽样计数"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = array("l", [0] * (constants.HOT_KEYS_SKETCH_WIDTH * constants.HOT_KEYS_SKETCH_DEPTH))
+        # 候选键 -> 在各行中的列
+        self.candidates = {}
+        self.started = time.time()
+
+    def add(self, key):
+        cols = self.candidates.get(key)
+        if cols is None:
+            cols = self.candidates[key] = columns(key)
+        width = constants.HOT_KEYS_SKETCH_WIDTH
+        for row, col in enumerate(cols):
+            self.counters[row * width + col] += 1
+
+    def estimate(self, key):
+        width = constants.HOT_KEYS_SKETCH_WIDTH
+        return min(self.counters[row * width + col] for row, col in enumerate(columns(key)))
+
+    def merge_args(self):
+        """合并脚本的参数，候选键只取本进程中次数最多的若干个"""
+        width = constants.HOT_KEYS_SKETCH_WIDTH
+        counts = []
+        for i, count in enumerate(self.counters):
+            if count:
+                counts.extend(["%d:%d" % (i / width, i % width), count])
+        candidates = sorted(self.candidates, key=self.estimate, reverse=True)[:constants.HOT_KEYS_TOP_SIZE]
+        args = [constants.HOT_KEYS_WINDOW * 2, constants.HOT_KEYS_TOP_SIZE, constants.HOT_KEYS_SKETCH_DEPTH,
+                len(counts) / 2] + counts
+        for key in candidates:
+            args.append(key)
+            args.extend(self.candidates[key])
+        return args
+
+
+_local = LocalSketch()
+_lock = threading.Lock()
+
+
+def record(key):
+    """按配置的比例抽样记录一次访问，距上次合并超过配置的间隔时合并到redis"""
+    config = current_app.config
+    if random.random() >= config["HOT_KEYS_SAMPLE_RATE"]:
+        return
+    args = None
+    with _lock:
+        _local.add(key)
+        if time.time() - _local.started >= config["HOT_KEYS_FLUSH_INTERVAL"]:
+            args = _local.merge_args()
+            _local.reset()
+    if args is not None:
+        try:
+            window = _window()
+            _merge(keys=[SKETCH_KEY % window, TOP_KEY % window], args=args)
+        except Exception as e:
+            current_app.logger.error(e)
+
+
+def estimate(key):
+    """键在当前与上一个时间窗口中的估计访问次数"""
+    fields = ["%d:%d" % (row, col) for row, col in enumerate(columns(key))]
+    pipe = redis_store.pipeline(transaction=False)
+    for offset in (0, 1):
+        pipe.hmget(SKETCH_KEY % _window(offset), fields)
+    count = sum(min(int(value or 0) for value in values) for values in pipe.execute())
+    return int(count / current_app.config["HOT_KEYS_SAMPLE_RATE"])
+
+
+def adaptive_ttl(key, base):
+    """按最近的访问频率调整缓存有效期：热点键延长，抽样到过但访问很少的键缩短
+
+    估计次数低于一次抽样对应的访问次数时可能只是还没被抽到或还没合并到redis，使用原有效期
+    """
+    try:
+        count = estimate(key)
+    except Exception as e:
+        current_app.logger.error(e)
+        return base
+    if count >= constants.HOT_KEYS_HOT_ACCESSES:
+        return base * constants.HOT_KEYS_TTL_FACTOR
+    # 与estimate相同的换算，一次抽样对应的估计次数
+    noise_floor = int(1 / current_app.config["HOT_KEYS_SAMPLE_RATE"])
+    if noise_floor <= count < constants.HOT_KEYS_COLD_ACCESSES:
+        return base / constants.HOT_KEYS_TTL_FACTOR
+    return base
+
+
+def top(count):
+    """当前与上一个时间窗口中估计访问次数最多的键，返回[(键, 估计访问次数), ...]"""
+    pipe = redis_store.pipeline(transaction=False)
+    for offset in (0, 1):
+        pipe.zrevrange(TOP_KEY % _window(offset), 0, -1, withscores=True)
+    totals = {}
+    for ranked in pipe.execute():
+        for key, score in ranked:
+            totals[key] = totals.get(key, 0) + score
+    rate = current_app.config["HOT_KEYS_SAMPLE_RATE"]
+    return [(key, int(score / rate)) for key, score in
+            sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]]
+
+
+def key_to_url(key):
+    """缓存键对应的请求地址，用于缓存预热，无法对应时返回None"""
+    if key.startswith("house_info_"):
+        return "/api/v1.0/houses/%s" % key[len("house_info_"):]
+    if key.startswith("houses_"):
+        # 列表缓存键由list_cache.normalize_query生成: houses_区域_开始日期_结束日期_排序条件
+        parts = key[len("houses_"):].split("_")
+        if len(parts) == 4:
+            return "/api/v1.0/houses?aid=%s&sd=%s&ed=%s&sk=%s&p=1" % tuple(parts)
+    return None
@@ -0,0 +1,52 @@
+# -*- coding:utf-8 -*-
+# 热点请求记录：抽样记录会被缓存的GET接口的请求地址，缓存预热时优先请求这些地址；
+# 记录保存在redis中，预热时同时保存到文件，redis被清空后从文件读取
+
+import os
+import random
+
+from flask import current_app
+
+from ihome import redis_store
+
+
+# 请求地址的访问次数，有序集合
+HOT_URLS_KEY = "cache_hot_urls"
+
+# 结果会被缓存的接口
+CACHED_ENDPOINTS = ("api.get_area_info", "api.get_houses_index", "api.get_house_detail", "api.get_houses_list")
+
+
+def maybe_record(url):
+    """按配置的比例抽样记录请求地址，只保留访问次数最多的地址"""
+    config = current_app.config
+    if random.random() >= config["CACHE_HOT_URLS_SAMPLE_RATE"]:
+        return
+    try:
+        pipe = redis_store.pipeline(transaction=False)
+        pipe.zincrby(HOT_URLS_KEY, url, 1)
+        pipe.zremrangebyrank(HOT_URLS_KEY, 0, -config["CACHE_HOT_URLS_MAX"] - 1)
+        pipe.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def top(count):
+    """访问次数最多的请求地址"""
+    return redis_store.zrevrange(HOT_URLS_KEY, 0, count - 1)
+
+
+def save(urls, path):
+    """保存到文件，先写临时文件再替换，不会留下写了一半的文件"""
+    with open(path + ".tmp", "w") as f:
+        for url in urls:
+            f.write(url + "\n")
+    os.rename(path + ".tmp", path)
+
+
+def load(path):
+    """从文件读取，文件不存在时返回空列表"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
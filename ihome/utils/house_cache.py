@@ -0,0 +1,48 @@
+# -*- coding:utf-8 -*-
+# 房屋详情缓存的紧凑编码：json中的七牛域名前缀替换为一个字节，超过一定长度时再用zlib压缩，
+# 评论中重复的字段名与转义后的中文由压缩去掉；读取时只需要解压与替换回前缀，不需要重新解析json，
+# 之前写入的普通json缓存仍然可以直接读取
+
+import json
+import zlib
+
+from flask import current_app
+
+from ihome import constants
+
+
+# 编码后的第一个字节表示格式，普通json以"{"开头
+COMPACT = "c"
+COMPRESSED = "z"
+
+# 代替域名前缀的字节，json.dumps转义全部控制字符，输出中不会出现这个字节，替换可以准确还原
+_PREFIX_MARK = "\x01"
+
+
+def encode(house_dict, compact=None):
+    """房屋详情转换为缓存的内容，compact为None时按配置决定是否使用紧凑编码"""
+    return encode_json(json.dumps(house_dict), compact)
+
+
+def encode_json(value, compact=None):
+    """已经序列化的房屋详情json转换为缓存的内容，响应与缓存共用一次json.dumps"""
+    if compact is None:
+        compact = current_app.config["HOUSE_DETAIL_CACHE_COMPACT"]
+    if not compact:
+        return value
+    value = value.replace(constants.QINIU_DOMIN_PREFIX, _PREFIX_MARK)
+    if len(value) >= constants.HOUSE_DETAIL_CACHE_COMPRESS_MIN_BYTES:
+        return COMPRESSED + zlib.compress(value, constants.HOUSE_DETAIL_CACHE_COMPRESS_LEVEL)
+    return COMPACT + value
+
+
+def decode(value):
+    """缓存的内容还原为房屋详情的json，与json.dumps(house.to_full_dict())相同"""
+    marker = value[:1]
+    if marker == COMPRESSED:
+        value = zlib.decompress(value[1:])
+    elif marker == COMPACT:
+        value = value[1:]
+    else:
+        return value
+    return value.replace(_PREFIX_MARK, constants.QINIU_DOMIN_PREFIX)
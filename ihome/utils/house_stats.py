@@ -0,0 +1,97 @@
+# -*- coding:utf-8 -*-
+# 房屋统计：每个区域与全部房屋的数量、最低价格、最高价格、价格分布，发布房屋时增量更新，
+# 删除房屋或直接修改mysql不会更新统计，由订单定时任务按配置的间隔从mysql重建；
+# 房屋列表不带日期时直接用数量计算总页数，不需要COUNT(*)
+
+from sqlalchemy import func
+
+from ihome import redis_store, db, constants
+from ihome.models import House
+
+
+# 每个区域一个哈希，字段为count/min/max以及价格分布的b<区间序号>，全部房屋的区域编号为all
+STATS_KEY = "house_stats_%s"
+# 统计从mysql完整建立后才设置，不存在时房屋列表仍然使用COUNT(*)
+READY_KEY = "house_stats_ready"
+
+# 新增房屋，同时更新区域与全部房屋的统计
+# KEYS: 区域的统计, 全部房屋的统计; ARGV: 价格, 价格区间字段
+_add = redis_store.register_script("""
+local price = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    redis.call('hincrby', key, 'count', 1)
+    redis.call('hincrby', key, ARGV[2], 1)
+    local low = redis.call('hget', key, 'min')
+    if not low or price < tonumber(low) then
+        redis.call('hset', key, 'min', price)
+    end
+    local high = redis.call('hget', key, 'max')
+    if not high or price > tonumber(high) then
+        redis.call('hset', key, 'max', price)
+    end
+end
+return 1
+""")
+
+
+def _bucket(price):
+    """价格所在的区间序号，超出范围的价格都在最后一个区间"""
+    return min(price / constants.HOUSE_PRICE_HISTOGRAM_BUCKET, constants.HOUSE_PRICE_HISTOGRAM_BUCKETS - 1)
+
+
+def add_house(area_id, price):
+    """房屋发布的事务提交后调用"""
+    _add(keys=[STATS_KEY % area_id, STATS_KEY % "all"], args=[price, "b%d" % _bucket(price)])
+
+
+def is_ready():
+    return bool(redis_store.exists(READY_KEY))
+
+
+def house_count(area_id=None):
+    """区域或全部房屋的数量，统计中没有这个区域(还没有房屋或被redis淘汰)时返回None，由调用方使用COUNT(*)"""
+    count = redis_store.hget(STATS_KEY % (area_id or "all"), "count")
+    return int(count) if count is not None else None
+
+
+def get_summary(area_id=None):
+    """区域或全部房屋的数量、价格范围与价格分布，价格单位为分，区间上限为None表示不限"""
+    stats = redis_store.hgetall(STATS_KEY % (area_id or "all"))
+    bucket = constants.HOUSE_PRICE_HISTOGRAM_BUCKET
+    histogram = []
+    for i in xrange(constants.HOUSE_PRICE_HISTOGRAM_BUCKETS):
+        last = i == constants.HOUSE_PRICE_HISTOGRAM_BUCKETS - 1
+        histogram.append({"from": i * bucket, "to": None if last else (i + 1) * bucket,
+                          "count": int(stats.get("b%d" % i, 0))})
+    return {
+        "count": int(stats.get("count", 0)),
+        "min_price": int(stats["min"]) if "min" in stats else None,
+        "max_price": int(stats["max"]) if "max" in stats else None,
+        "histogram": histogram
+    }
+
+
+def rebuild():
+    """从mysql按区域与价格分组统计后重建，返回房屋数"""
+    stats = {}
+    rows = db.session.query(House.area_id, House.price, func.count(House.id))\
+        .group_by(House.area_id, House.price).all()
+    for area_id, price, count in rows:
+        price = price or 0
+        for key in (STATS_KEY % area_id, STATS_KEY % "all"):
+            fields = stats.setdefault(key, {"count": 0})
+            fields["count"] += count
+            field = "b%d" % _bucket(price)
+            fields[field] = fields.get(field, 0) + count
+            fields["min"] = min(fields.get("min", price), price)
+            fields["max"] = max(fields.get("max", price), price)
+    # 在一个事务中替换全部区域的统计
+    pipe = redis_store.pipeline()
+    for key in redis_store.scan_iter(STATS_KEY % "*"):
+        if key != READY_KEY:
+            pipe.delete(key)
+    for key, fields in stats.items():
+        pipe.hmset(key, fields)
+    pipe.set(READY_KEY, 1)
+    pipe.execute()
+    return stats.get(STATS_KEY % "all", {}).get("count", 0)
@@ -0,0 +1,50 @@
+# -*- coding:utf-8 -*-
+# 房东的待接单订单收件箱：每个房东一个有序集合，分数为订单编号，成员为订单数据；
+# 新订单通过发布订阅通知正在等待的长轮询请求
+
+import json
+import time
+
+from ihome import redis_store, constants
+
+
+def inbox_key(landlord_id):
+    return "landlord_inbox_%s" % landlord_id
+
+
+def push_pending_order(landlord_id, order_dict):
+    """新订单加入房东的收件箱，只保留最近的若干条，并通知等待中的请求"""
+    key = inbox_key(landlord_id)
+    pipe = redis_store.pipeline()
+    pipe.zadd(key, order_dict["order_id"], json.dumps(order_dict))
+    pipe.zremrangebyrank(key, 0, -constants.LANDLORD_INBOX_MAX_ORDERS - 1)
+    pipe.expire(key, constants.LANDLORD_INBOX_REDIS_EXPIRES)
+    pipe.publish(key, order_dict["order_id"])
+    pipe.execute()
+
+
+def remove_pending_order(landlord_id, order_id):
+    """订单已接单或拒单后从收件箱中删除"""
+    redis_store.zremrangebyscore(inbox_key(landlord_id), order_id, order_id)
+
+
+def get_pending_orders(landlord_id, since):
+    """查询编号大于since的待接单订单，按编号升序"""
+    return [json.loads(order) for order in redis_store.zrangebyscore(inbox_key(landlord_id), "(%d" % since, "+inf")]
+
+
+def wait_pending_orders(landlord_id, since, timeout):
+    """长轮询：有新订单时立即返回，否则最多等待timeout秒后返回空列表"""
+    pubsub = redis_store.pubsub(ignore_subscribe_messages=True)
+    # 先订阅再查询，避免查询后、订阅前到达的订单没有被通知
+    pubsub.subscribe(inbox_key(landlord_id))
+    try:
+        deadline = time.time() + timeout
+        while True:
+            orders = get_pending_orders(landlord_id, since)
+            remaining = deadline - time.time()
+            if orders or remaining <= 0:
+                return orders
+            pubsub.get_message(timeout=remaining)
+    finally:
+        pubsub.close()
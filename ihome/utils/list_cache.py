@@ -0,0 +1,102 @@
+# -*- coding:utf-8 -*-
+# 房屋列表缓存：规范化缓存键，带日期的查询多次出现后才缓存，缓存的键数有上限，超出时淘汰最久未访问的键
+
+import time
+
+from ihome import redis_store, constants
+from ihome.utils import hot_keys
+
+
+# 记录缓存键最近访问时间的有序集合，用于淘汰
+LRU_KEY = "houses_cache_lru"
+# 记录未缓存的带日期查询出现次数的有序集合，用于判断是否缓存
+HITS_KEY = "houses_cache_hits"
+
+# 房屋列表支持的排序条件，其它值按默认的new处理
+SORT_KEYS = ("booking", "price-inc", "price-des", "new")
+
+# 读取缓存，命中时更新访问时间，未命中时增加查询的出现次数
+# KEYS: 缓存键, LRU_KEY, HITS_KEY; ARGV: 页数, 当前时间
+# 返回缓存的数据，未命中时返回出现次数
+_read = redis_store.register_script("""
+local value = redis.call('hget', KEYS[1], ARGV[1])
+if value then
+    redis.call('zadd', KEYS[2], ARGV[2], KEYS[1])
+    return value
+end
+return tonumber(redis.call('zincrby', KEYS[3], 1, KEYS[1]))
+""")
+
+# 写入缓存并设置有效期，缓存键超出上限时淘汰最久未访问的键
+# 每次写入都按当前的访问频率设置有效期，缓存键不会因为缺少有效期而一直保留
+# KEYS同上; ARGV: 页数, 数据, 有效期, 当前时间, 缓存键上限, 出现次数记录的上限
+_write = redis_store.register_script("""
+redis.call('hset', KEYS[1], ARGV[1], ARGV[2])
+redis.call('expire', KEYS[1], ARGV[3])
+redis.call('zadd', KEYS[2], ARGV[4], KEYS[1])
+redis.call('zrem', KEYS[3], KEYS[1])
+local overflow = redis.call('zcard', KEYS[2]) - tonumber(ARGV[5])
+if overflow > 0 then
+    local victims = redis.call('zrange', KEYS[2], 0, overflow - 1)
+    for i, victim in ipairs(victims) do
+        redis.call('del', victim)
+    end
+    redis.call('zremrangebyrank', KEYS[2], 0, overflow - 1)
+end
+-- 出现次数只需要保留次数最多的查询
+local extra = redis.call('zcard', KEYS[3]) - tonumber(ARGV[6])
+if extra > 0 then
+    redis.call('zremrangebyrank', KEYS[3], 0, extra - 1)
+end
+return 1
+""")
+
+
+def normalize_query(area_id, start_date, end_date, sort_key):
+    """生成规范化的缓存键，日期为已解析的datetime或None，相同含义的查询对应同一个键"""
+    return "houses_%s_%s_%s_%s" % (
+        area_id,
+        start_date.strftime("%Y-%m-%d") if start_date else "",
+        end_date.strftime("%Y-%m-%d") if end_date else "",
+        sort_key if sort_key in SORT_KEYS else "new")
+
+
+def get_page(redis_key, page):
+    """读取缓存的一页，返回(数据, 出现次数)，命中时出现次数为None"""
+    hot_keys.record(redis_key)
+    result = _read(keys=[redis_key, LRU_KEY, HITS_KEY], args=[page, int(time.time())])
+    if isinstance(result, (int, long)):
+        return None, result
+    return result, None
+
+
+def set_page(redis_key, page, value, dated, hits):
+    """写入缓存的一页，带日期的查询出现次数不足时不缓存，返回是否写入，有效期按访问频率调整"""
+    if dated and (hits or 0) < constants.HOUSE_LIST_CACHE_ADMIT_HITS:
+        return False
+    _write(keys=[redis_key, LRU_KEY, HITS_KEY],
+           args=[page, value, hot_keys.adaptive_ttl(redis_key, constants.HOUSE_LIST_REDIS_EXPIRES), int(time.time()),
+                 constants.HOUSE_LIST_CACHE_MAX_KEYS, constants.HOUSE_LIST_CACHE_MAX_KEYS * 10])
+    return True
+
+
+def memory_usage():
+    """统计列表缓存占用的内存，同时清理已过期的键的访问记录，返回(缓存键数, 字节数)"""
+    keys = redis_store.zrange(LRU_KEY, 0, -1)
+    total = 0
+    count = 0
+    expired = []
+    for key in keys:
+        try:
+            size = redis_store.execute_command("MEMORY", "USAGE", key)
+        except Exception:
+            # redis 4.0以前没有MEMORY命令，只统计数据的长度
+            size = sum(len(value) for value in redis_store.hvals(key)) or None
+        if size is None:
+            expired.append(key)
+            continue
+        total += size
+        count += 1
+    if expired:
+        redis_store.zrem(LRU_KEY, *expired)
+    return count, total
@@ -0,0 +1,56 @@
+# -*- coding:utf-8 -*-
+# 房屋位置：经纬度保存在redis的GEO有序集合中，按半径查询附近的房屋不需要扫描mysql；
+# redis-py 2.10没有GEO命令的方法，使用execute_command，需要redis 3.2以上
+
+from ihome import redis_store, db
+from ihome.models import House
+
+
+# 房屋位置的GEO集合，成员为房屋编号
+LOCATIONS_KEY = "house_locations"
+
+# redis GEO支持的纬度范围，超出范围的坐标无法写入
+MAX_LATITUDE = 85.05112878
+
+
+def valid_location(longitude, latitude):
+    return -180 <= longitude <= 180 and -MAX_LATITUDE <= latitude <= MAX_LATITUDE
+
+
+def add_locations(locations, key=LOCATIONS_KEY):
+    """写入房屋位置，locations为[(房屋编号, 经度, 纬度), ...]"""
+    args = []
+    for house_id, longitude, latitude in locations:
+        args.extend([longitude, latitude, house_id])
+    if args:
+        redis_store.execute_command("GEOADD", key, *args)
+
+
+def nearby(longitude, latitude, radius, count, key=LOCATIONS_KEY):
+    """半径内的房屋，半径单位为米，最多返回最近的count个，返回[(房屋编号, 距离), ...]按距离升序"""
+    result = redis_store.execute_command("GEORADIUS", key, longitude, latitude, radius, "m",
+                                         "WITHDIST", "ASC", "COUNT", count)
+    return [(int(house_id), float(distance)) for house_id, distance in result]
+
+
+def rebuild(batch_size=10000, key=LOCATIONS_KEY):
+    """从mysql重建房屋位置，先写入临时键再替换，重建期间查询不受影响，返回房屋数"""
+    building_key = key + "_building"
+    redis_store.delete(building_key)
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(House.id, House.longitude, House.latitude)\
+            .filter(House.id > last_id, House.longitude != None, House.latitude != None)\
+            .order_by(House.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+        locations = [row for row in rows if valid_location(row[1], row[2])]
+        add_locations(locations, building_key)
+        count += len(locations)
+        last_id = rows[-1][0]
+    if count:
+        redis_store.rename(building_key, key)
+    else:
+        redis_store.delete(key)
+    return count
@@ -0,0 +1,156 @@
+# -*- coding:utf-8 -*-
+# 已注册手机号的索引：布隆过滤器判断手机号一定未注册，不需要查询mysql；
+# 可能已注册的手机号再查询缓存的用户编号与用户名，密码哈希不缓存，登录时从mysql读取
+
+import json
+import struct
+import hashlib
+from collections import namedtuple
+
+from ihome import redis_store, db, constants
+from ihome.models import User
+
+
+# 布隆过滤器，保存为redis中的位图，只有存在时才是完整的
+REGISTERED_MOBILES_KEY = "RegisteredMobilesBloom"
+# 重建过滤器期间新注册的手机号，集合存在表示正在重建，替换过滤器后再加入新的过滤器
+REBUILD_LOG_KEY = "RegisteredMobilesBloom_added"
+
+# 手机号对应的用户，缓存在redis中
+MobileUser = namedtuple("MobileUser", ["id", "name"])
+# 登录时校验密码需要的信息，不缓存
+MobileLogin = namedtuple("MobileLogin", ["id", "password_hash", "name"])
+
+# 正在重建时记录手机号；过滤器存在时才设置，避免在过滤器未建立时生成一个不完整的过滤器
+# KEYS: 过滤器, 重建期间的记录; ARGV: 手机号, 手机号对应的位...
+_add_if_exists = redis_store.register_script("""
+if redis.call('exists', KEYS[2]) == 1 then
+    redis.call('sadd', KEYS[2], ARGV[1])
+end
+if redis.call('exists', KEYS[1]) == 0 then
+    return -1
+end
+for i = 2, #ARGV do
+    redis.call('setbit', KEYS[1], ARGV[i], 1)
+end
+return 1
+""")
+
+# 过滤器不存在时返回-1，手机号对应的位全部为1(可能已注册)时返回1，否则返回0
+_check = redis_store.register_script("""
+if redis.call('exists', KEYS[1]) == 0 then
+    return -1
+end
+for i, offset in ipairs(ARGV) do
+    if redis.call('getbit', KEYS[1], offset) == 0 then
+        return 0
+    end
+end
+return 1
+""")
+
+
+def bloom_offsets(mobile):
+    """手机号在过滤器中对应的位，由md5的两段组合出所需个数的哈希值"""
+    h1, h2 = struct.unpack("<QQ", hashlib.md5(mobile).digest())
+    bits = constants.REGISTERED_MOBILES_BLOOM_BITS
+    return [(h1 + i * h2) % bits for i in xrange(constants.REGISTERED_MOBILES_BLOOM_HASHES)]
+
+
+def set_bloom_bits(bitmap, mobile):
+    """在内存中的位图里设置手机号对应的位，位的顺序与redis的setbit一致(每个字节从高位开始)"""
+    for offset in bloom_offsets(mobile):
+        bitmap[offset >> 3] |= 0x80 >> (offset & 7)
+
+
+def add_registered_mobile(mobile):
+    """注册成功后把手机号加入过滤器"""
+    _add_if_exists(keys=[REGISTERED_MOBILES_KEY, REBUILD_LOG_KEY], args=[mobile] + bloom_offsets(mobile))
+
+
+def discard_registered_mobiles():
+    """手机号没能加入过滤器时删除过滤器，之后的查询都回到mysql，直到重新建立(python manage.py users rebuild_index)"""
+    redis_store.delete(REGISTERED_MOBILES_KEY)
+
+
+def check_registered_mobile(mobile, key=REGISTERED_MOBILES_KEY):
+    """手机号一定未注册时返回False，可能已注册时返回True，过滤器不存在时返回None"""
+    result = _check(keys=[key], args=bloom_offsets(mobile))
+    return None if result == -1 else bool(result)
+
+
+def get_mobile_user(mobile):
+    """查询手机号对应的用户编号与用户名，手机号未注册时返回None
+
+    过滤器确认未注册时不查询mysql，查询到的用户信息缓存在redis中
+    """
+    if check_registered_mobile(mobile) is False:
+        return None
+    try:
+        cached = redis_store.get("MobileUser_" + mobile)
+    except Exception:
+        cached = None
+    if cached:
+        fields = json.loads(cached)
+        # 之前的缓存包含密码哈希，字段数不同时重新查询并覆盖
+        if len(fields) == len(MobileUser._fields):
+            return MobileUser(*fields)
+    row = db.session.query(User.id, User.name).filter(User.mobile == mobile).first()
+    if row is None:
+        return None
+    user = MobileUser(*row)
+    try:
+        redis_store.setex("MobileUser_" + mobile, constants.MOBILE_USER_REDIS_EXPIRES, json.dumps(user))
+    except Exception:
+        pass
+    return user
+
+
+def get_mobile_login(mobile):
+    """查询手机号对应的用户编号、密码哈希与用户名，手机号未注册时返回None
+
+    过滤器确认未注册时不查询mysql，密码哈希只从mysql读取，不写入redis
+    """
+    if check_registered_mobile(mobile) is False:
+        return None
+    row = db.session.query(User.id, User.password_hash, User.name).filter(User.mobile == mobile).first()
+    return MobileLogin(*row) if row is not None else None
+
+
+def discard_mobile_user(mobile):
+    """用户名修改后删除缓存的用户信息"""
+    redis_store.delete("MobileUser_" + mobile)
+
+
+def rebuild_registered_mobiles(batch_size=10000):
+    """从ih_user_profile分批重建过滤器，建好后原子替换旧的过滤器，返回手机号数量
+
+    编号较小的用户可能在读过它所在的批次后才提交，它只会加入旧的过滤器，
+    因此重建期间注册的手机号另外记录下来，替换后再加入新的过滤器
+    """
+    tmp_key = REGISTERED_MOBILES_KEY + "_rebuild"
+    redis_store.sadd(REBUILD_LOG_KEY, "")
+    redis_store.expire(REBUILD_LOG_KEY, constants.REGISTERED_MOBILES_REBUILD_LOG_EXPIRES)
+    bitmap = bytearray(constants.REGISTERED_MOBILES_BLOOM_BITS / 8)
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(User.id, User.mobile).filter(User.id > last_id)\
+            .order_by(User.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+        for _, mobile in rows:
+            set_bloom_bits(bitmap, mobile)
+        count += len(rows)
+        last_id = rows[-1][0]
+        redis_store.expire(REBUILD_LOG_KEY, constants.REGISTERED_MOBILES_REBUILD_LOG_EXPIRES)
+    redis_store.set(tmp_key, bytes(bitmap))
+    redis_store.rename(tmp_key, REGISTERED_MOBILES_KEY)
+    # 替换后注册的手机号直接加入新的过滤器，之前记录的补充一次
+    pipe = redis_store.pipeline()
+    pipe.smembers(REBUILD_LOG_KEY)
+    pipe.delete(REBUILD_LOG_KEY)
+    for mobile in pipe.execute()[0]:
+        if mobile:
+            add_registered_mobile(mobile)
+    return count
@@ -0,0 +1,141 @@
+# -*- coding:utf-8 -*-
+# 订单状态机：所有状态变化都通过带原状态条件的UPDATE完成，不需要先查询再修改，
+# 并发修改同一订单时只有一个请求会成功
+
+from flask import current_app
+
+from ihome import db, redis_store
+from ihome.models import Order, House
+from ihome.utils import inbox, availability, search, ranking
+
+
+# 允许的状态变化：原状态 -> 可以变为的状态
+TRANSITIONS = {
+    "WAIT_ACCEPT": ("WAIT_PAYMENT", "WAIT_COMMENT", "REJECTED", "CANCELED"),
+    "WAIT_PAYMENT": ("PAID", "CANCELED"),
+    "PAID": ("WAIT_COMMENT",),
+    "WAIT_COMMENT": ("COMPLETE",),
+    "COMPLETE": (),
+    "CANCELED": (),
+    "REJECTED": (),
+}
+
+
+class InvalidTransition(Exception):
+    """状态机中不存在的状态变化"""
+    pass
+
+
+def check_transition(from_status, to_status):
+    if to_status not in TRANSITIONS.get(from_status, ()):
+        raise InvalidTransition("%s -> %s" % (from_status, to_status))
+
+
+def transition(order_id, from_status, to_status, conditions=(), **values):
+    """订单处于from_status且满足conditions时改为to_status，同时修改values中的字段
+
+    不提交事务，由调用者与其它修改一起提交；返回订单是否被修改
+    """
+    check_transition(from_status, to_status)
+    values["status"] = to_status
+    count = Order.query.filter(Order.id == order_id, Order.status == from_status, *conditions)\
+        .update(values, synchronize_session=False)
+    return count == 1
+
+
+def bulk_transition(from_status, to_status, conditions=(), batch_size=1000, after_batch=None, after_commit=None,
+                    **values):
+    """分批修改满足条件的订单，每批一个事务，返回修改的订单数
+
+    每批先锁定要修改的订单，after_batch(rows)在同一事务中处理关联的修改，after_commit(rows)在提交后执行，
+    rows为(订单编号, 房客编号, 房屋编号, 房东编号, 起始日期, 结束日期)
+    """
+    check_transition(from_status, to_status)
+    values["status"] = to_status
+    total = 0
+    while True:
+        try:
+            rows = db.session.query(Order.id, Order.user_id, Order.house_id, House.user_id,
+                                    Order.begin_date, Order.end_date)\
+                .join(House, Order.house_id == House.id)\
+                .filter(Order.status == from_status, *conditions)\
+                .order_by(Order.id.asc()).limit(batch_size).with_for_update().all()
+            if not rows:
+                db.session.rollback()
+                break
+            Order.query.filter(Order.id.in_([row[0] for row in rows]), Order.status == from_status)\
+                .update(values, synchronize_session=False)
+            if after_batch is not None:
+                after_batch(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        discard_orders_caches(rows)
+        if after_commit is not None:
+            after_commit(rows)
+        total += len(rows)
+    return total
+
+
+def discard_user_orders_cache(custom_id, landlord_id):
+    """订单新增或状态变化后，删除房客与房东缓存的订单第一页"""
+    try:
+        redis_store.delete("user_orders_custom_%s" % custom_id, "user_orders_landlord_%s" % landlord_id)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def discard_orders_caches(rows):
+    """批量修改后删除订单列表缓存与收件箱中的订单"""
+    try:
+        pipe = redis_store.pipeline(transaction=False)
+        for order_id, custom_id, _, landlord_id, _, _ in rows:
+            pipe.delete("user_orders_custom_%s" % custom_id, "user_orders_landlord_%s" % landlord_id)
+            pipe.zremrangebyscore(inbox.inbox_key(landlord_id), order_id, order_id)
+        pipe.execute()
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def _add_house_order_counts(rows):
+    """订单完成后增加房屋的完成订单数"""
+    counts = {}
+    for _, _, house_id, _, _, _ in rows:
+        counts[house_id] = counts.get(house_id, 0) + 1
+    for house_id, count in counts.items():
+        House.query.filter(House.id == house_id)\
+            .update({"order_count": House.order_count + count}, synchronize_session=False)
+
+
+def _houses_changed(rows):
+    """完成订单数影响搜索结果与首页排行的排序"""
+    counts = {}
+    for _, _, house_id, _, _, _ in rows:
+        counts[house_id] = counts.get(house_id, 0) + 1
+    search.houses_changed(counts.keys())
+    try:
+        ranking.add_order_counts(counts)
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def _release_nights(rows):
+    """订单取消后释放占用的日期"""
+    try:
+        availability.remove_bookings([(house_id, begin_date, end_date)
+                                      for _, _, house_id, _, begin_date, end_date in rows])
+    except Exception as e:
+        current_app.logger.error(e)
+
+
+def expire_pending_orders(before, batch_size=1000):
+    """下单时间早于before仍未接单的订单自动取消"""
+    return bulk_transition("WAIT_ACCEPT", "CANCELED", (Order.create_time < before,), batch_size,
+                           after_commit=_release_nights)
+
+
+def complete_past_orders(before, batch_size=1000):
+    """离店时间早于before仍未评价的订单自动完成"""
+    return bulk_transition("WAIT_COMMENT", "COMPLETE", (Order.end_date < before,), batch_size,
+                           after_batch=_add_house_order_counts, after_commit=_houses_changed)
@@ -0,0 +1,92 @@
+# -*- coding:utf-8 -*-
+# 密码的加密与校验，可以放到独立的进程池中执行，避免占满处理请求的worker
+
+import threading
+import multiprocessing
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+class PasswordPoolBusy(Exception):
+    """进程池中排队的任务已满，或等待超时"""
+    pass
+
+
+class PasswordPool(object):
+    """计算密码哈希的进程池，排队的任务数有上限，超出时立即拒绝而不是无限排队"""
+
+    def __init__(self, processes, max_pending, timeout):
+        self._pool = multiprocessing.Pool(processes)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._timeout = timeout
+
+    def apply(self, func, *args):
+        if not self._slots.acquire(False):
+            raise PasswordPoolBusy()
+        # 任务执行完才释放名额，等待超时的任务仍在排队或执行，继续占用名额
+        try:
+            result = self._pool.apply_async(_call, (func, args), callback=self._release)
+        except Exception:
+            self._slots.release()
+            raise
+        try:
+            succeeded, value = result.get(self._timeout)
+        except multiprocessing.TimeoutError:
+            raise PasswordPoolBusy()
+        if not succeeded:
+            raise value
+        return value
+
+    def _release(self, _):
+        self._slots.release()
+
+
+def _call(func, args):
+    """在进程池中执行，异常作为结果返回：python2的apply_async只在任务成功时调用callback"""
+    try:
+        return True, func(*args)
+    except Exception as e:
+        return False, e
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _run(func, *args):
+    """配置了进程池时在进程池中执行，否则在当前线程中执行"""
+    global _pool
+    processes = current_app.config.get("PASSWORD_POOL_PROCESSES")
+    if not processes:
+        return func(*args)
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordPool(processes, current_app.config["PASSWORD_POOL_MAX_PENDING"],
+                                     current_app.config["PASSWORD_POOL_TIMEOUT"])
+    return _pool.apply(func, *args)
+
+
+def hash_password(password):
+    """使用配置的算法与迭代次数加密密码，算法信息保存在哈希值的前缀中"""
+    return _run(generate_password_hash, password, current_app.config["PASSWORD_HASH_METHOD"])
+
+
+def verify_password(pwhash, password):
+    """校验密码，哈希值中记录了加密时的算法，旧算法的哈希值同样可以校验"""
+    return _run(check_password_hash, pwhash, password)
+
+
+def _parse_method(method):
+    """解析算法，pbkdf2省略迭代次数时使用werkzeug的默认次数，与哈希值前缀中记录的一致"""
+    if method.startswith("pbkdf2:"):
+        args = method[len("pbkdf2:"):].split(":")
+        iterations = int(args[1] or 0) if len(args) > 1 else 0
+        return "pbkdf2", args[0], iterations or DEFAULT_PBKDF2_ITERATIONS
+    return method,
+
+
+def needs_rehash(pwhash):
+    """哈希值使用的算法或迭代次数与当前配置不同时，需要在下次登录时重新加密"""
+    return _parse_method(pwhash.split("$", 1)[0]) != _parse_method(current_app.config["PASSWORD_HASH_METHOD"])
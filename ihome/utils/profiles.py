@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+# 用户资料缓存：每个用户一个redis哈希，修改资料的接口在提交后同步更新缓存，
+# 版本号用来丢弃读取mysql期间资料已被修改时的过期数据
+
+from flask import current_app
+
+from ihome import redis_store, constants
+from ihome.models import User
+
+
+# 缓存的字段，值为None的字段不写入哈希
+PROFILE_FIELDS = ("name", "mobile", "avatar_url", "real_name", "id_card", "create_time")
+
+# 从mysql读取资料后写入缓存，读取前后版本号不一致说明资料在此期间被修改过，不写入
+# KEYS[1]: 资料, KEYS[2]: 版本号; ARGV[1]: 读取mysql前的版本号, ARGV[2]: 有效期, ARGV[3...]: 字段与值
+_fill = redis_store.register_script("""
+if (redis.call('get', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('del', KEYS[1])
+redis.call('hmset', KEYS[1], unpack(ARGV, 3))
+redis.call('expire', KEYS[1], ARGV[2])
+return 1
+""")
+
+# 资料修改后增加版本号，已缓存时同步更新修改的字段，未缓存时等下次读取再写入
+# KEYS同上; ARGV[1]: 有效期, ARGV[2...]: 修改的字段与值
+_write_through = redis_store.register_script("""
+redis.call('incr', KEYS[2])
+redis.call('expire', KEYS[2], ARGV[1])
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('hmset', KEYS[1], unpack(ARGV, 2))
+    return 1
+end
+return 0
+""")
+
+
+def _keys(user_id):
+    return ["UserProfile_%s" % user_id, "UserProfileVersion_%s" % user_id]
+
+
+def _load_profile(user_id):
+    """从mysql读取用户资料，用户不存在时返回None"""
+    user = User.query.get(user_id)
+    if user is None:
+        return None
+    profile = {"user_id": user.id, "create_time": user.create_time.strftime("%Y-%m-%d %H:%M:%S")}
+    for field in PROFILE_FIELDS[:-1]:
+        if getattr(user, field) is not None:
+            profile[field] = getattr(user, field)
+    return profile
+
+
+def get_user_profile(user_id):
+    """读取用户资料，缓存中没有时从mysql读取并写入缓存，用户不存在时返回None"""
+    keys = _keys(user_id)
+    try:
+        profile = redis_store.hgetall(keys[0])
+        if profile:
+            profile["user_id"] = int(user_id)
+            return profile
+        version = redis_store.get(keys[1]) or ""
+    except Exception as e:
+        current_app.logger.error(e)
+        return _load_profile(user_id)
+    profile = _load_profile(user_id)
+    if profile is not None:
+        args = [version, constants.USER_PROFILE_REDIS_EXPIRES]
+        for field in PROFILE_FIELDS:
+            if field in profile:
+                args.extend([field, profile[field]])
+        try:
+            _fill(keys=keys, args=args)
+        except Exception as e:
+            current_app.logger.error(e)
+    return profile
+
+
+def update_user_profile(user_id, **fields):
+    """修改资料的事务提交后调用，同步更新缓存"""
+    args = [constants.USER_PROFILE_REDIS_EXPIRES]
+    for field, value in fields.items():
+        args.extend([field, value])
+    _write_through(keys=_keys(user_id), args=args)
+
+
+def profile_to_dict(profile):
+    """与User.to_dict()相同的格式"""
+    avatar_url = profile.get("avatar_url")
+    return {
+        "user_id": profile["user_id"],
+        "name": profile["name"],
+        "mobile": profile["mobile"],
+        "avatar": constants.QINIU_DOMIN_PREFIX + avatar_url if avatar_url else "",
+        "create_time": profile["create_time"]
+    }
+
+
+def profile_to_auth_dict(profile):
+    """与User.auth_to_dict()相同的格式"""
+    return {
+        "user_id": profile["user_id"],
+        "real_name": profile.get("real_name"),
+        "id_card": profile.get("id_card")
+    }
@@ -0,0 +1,101 @@
+# -*- coding:utf-8 -*-
+# 首页房屋排行：设置了主图片的房屋保存在redis的有序集合中，分数为完成的订单数，
+# 图片上传与订单完成时增量更新，首页只需要读取分数最高的几个房屋，不需要对房屋表排序
+
+import json
+
+from sqlalchemy.orm import joinedload
+
+from ihome import redis_store, db, constants
+from ihome.models import House
+
+
+# 房屋排行，成员为房屋编号，分数为完成的订单数
+RANKING_KEY = "home_ranking"
+# 排行中房屋的基本信息，只缓存首页展示过的房屋，整个哈希一起过期
+HOUSES_KEY = "home_ranking_houses"
+# 排行从mysql完整建立后才设置，不存在时首页仍然查询mysql
+READY_KEY = "home_ranking_ready"
+
+# 只增加已在排行中的房屋的分数，没有主图片的房屋不进入排行
+# KEYS[1]: RANKING_KEY; ARGV: 房屋编号, 增加的订单数, ...
+_incr = redis_store.register_script("""
+for i = 1, #ARGV, 2 do
+    if redis.call('zscore', KEYS[1], ARGV[i]) then
+        redis.call('zincrby', KEYS[1], ARGV[i + 1], ARGV[i])
+    end
+end
+return 1
+""")
+
+
+def add_house(house_id, order_count):
+    """房屋设置主图片后加入排行"""
+    redis_store.zadd(RANKING_KEY, order_count or 0, house_id)
+
+
+def add_order_counts(counts):
+    """订单完成后增加房屋的分数，counts为{房屋编号: 增加的订单数}"""
+    args = []
+    for house_id, count in counts.items():
+        args.extend([house_id, count])
+    if args:
+        _incr(keys=[RANKING_KEY], args=args)
+
+
+def top_houses(count):
+    """分数最高的count个房屋的基本信息，排行还没有建立时返回None"""
+    pipe = redis_store.pipeline(transaction=False)
+    pipe.exists(READY_KEY)
+    pipe.zrevrange(RANKING_KEY, 0, count - 1, withscores=True)
+    ready, ranked = pipe.execute()
+    if not ready:
+        return None
+    house_ids = [int(house_id) for house_id, _ in ranked]
+    cached = redis_store.hmget(HOUSES_KEY, house_ids) if house_ids else []
+    house_dicts = dict((house_id, json.loads(value)) for house_id, value in zip(house_ids, cached) if value)
+    missing = [house_id for house_id in house_ids if house_id not in house_dicts]
+    if missing:
+        pipe = redis_store.pipeline(transaction=False)
+        for house in House.query.options(joinedload(House.area)).filter(House.id.in_(missing)):
+            house_dicts[house.id] = house.to_basic_dict()
+            pipe.hset(HOUSES_KEY, house.id, json.dumps(house_dicts[house.id]))
+        pipe.expire(HOUSES_KEY, constants.HOME_PAGE_DATA_REDIS_EXPIRES)
+        pipe.execute()
+    houses = []
+    for house_id, score in ranked:
+        house_dict = house_dicts.get(int(house_id))
+        if house_dict is not None:
+            # 订单数以排行中的分数为准，缓存的基本信息可能是之前的
+            house_dict["order_count"] = int(score)
+            houses.append(house_dict)
+    return houses
+
+
+def rebuild(batch_size=10000):
+    """从mysql重建排行，先写入临时键再替换，返回房屋数"""
+    building_key = RANKING_KEY + "_building"
+    redis_store.delete(building_key)
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(House.id, House.order_count)\
+            .filter(House.id > last_id, House.index_image_url != "")\
+            .order_by(House.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+        pipe = redis_store.pipeline(transaction=False)
+        for house_id, order_count in rows:
+            pipe.zadd(building_key, order_count or 0, house_id)
+        pipe.execute()
+        count += len(rows)
+        last_id = rows[-1][0]
+    pipe = redis_store.pipeline()
+    if count:
+        pipe.rename(building_key, RANKING_KEY)
+    else:
+        pipe.delete(RANKING_KEY)
+    pipe.delete(HOUSES_KEY)
+    pipe.set(READY_KEY, 1)
+    pipe.execute()
+    return count
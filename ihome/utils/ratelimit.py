@@ -0,0 +1,60 @@
+# -*- coding:utf-8 -*-
+# 基于redis滑动窗口计数的限流，所有规则在一次lua脚本调用中检查并计数
+
+import time
+
+from ihome import redis_store
+
+
+# 滑动窗口计数：当前窗口的计数加上前一个窗口按剩余时间比例折算的计数
+# KEYS[i]: 规则的键前缀; ARGV[1]: 当前时间(毫秒); ARGV[2i], ARGV[2i+1]: 第i条规则的窗口(毫秒)与上限
+# 任意一条规则超限时不计数，返回超限规则的序号；全部通过时计数并返回0
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local counters = {}
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[2 * i])
+    local limit = tonumber(ARGV[2 * i + 1])
+    local current = math.floor(now / window)
+    local previous = tonumber(redis.call('get', key .. ':' .. (current - 1)) or '0')
+    local count = tonumber(redis.call('get', key .. ':' .. current) or '0')
+    if previous * (1 - (now % window) / window) + count >= limit then
+        return i
+    end
+    counters[i] = {key .. ':' .. current, window}
+end
+for i, counter in ipairs(counters) do
+    redis.call('incr', counter[1])
+    redis.call('pexpire', counter[1], counter[2] * 2)
+end
+return 0
+"""
+
+_sliding_window = redis_store.register_script(SLIDING_WINDOW_SCRIPT)
+
+
+def check_rate_limits(scope, rules, values):
+    """检查并计数一次请求
+
+    :param scope: 限流的接口名，如login
+    :param rules: ((维度, 窗口秒数, 窗口内最多请求数), ...)
+    :param values: 维度对应的值，如{"ip": "1.2.3.4", "mobile": "138..."}，global维度不需要值
+    :return: 超限时返回超限的维度，否则返回None
+    """
+    keys = []
+    args = [int(time.time() * 1000)]
+    dimensions = []
+    for dimension, window, limit in rules:
+        if dimension == "global":
+            keys.append("RateLimit_%s_global" % scope)
+        elif values.get(dimension):
+            keys.append("RateLimit_%s_%s_%s" % (scope, dimension, values[dimension]))
+        else:
+            # 请求中没有该维度的值(如缺少手机号)，该规则不适用
+            continue
+        args.extend([window * 1000, limit])
+        dimensions.append(dimension)
+    if not keys:
+        return None
+    index = _sliding_window(keys=keys, args=args)
+    return dimensions[index - 1] if index else None
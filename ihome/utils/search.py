@@ -0,0 +1,356 @@
+# -*- coding:utf-8 -*-
+# 房屋搜索：每个进程在内存中保存标题与地址的倒排索引，以及每个房屋的价格、容纳人数、房间数、设施位图等属性，
+# 房屋数据修改后在redis中记录变化，各进程处理请求前读取变化增量更新自己的索引，
+# 需要完整重建时在后台线程中建立，不阻塞搜索请求
+
+import re
+import uuid
+import heapq
+import calendar
+import threading
+from array import array
+
+from flask import current_app
+
+from ihome import redis_store, db, constants
+from ihome.models import House
+
+
+# 变化记录：有序集合，成员为房屋编号，分数为最近一次变化的序号，同一房屋多次变化只保留最后一次
+CHANGES_KEY = "house_search_changes"
+# 变化序号计数器
+CHANGES_SEQ_KEY = "house_search_changes_seq"
+# 因超出上限被删除的变化中最大的序号，进程的索引落后于它时需要完整重建
+CHANGES_TRIMMED_KEY = "house_search_changes_trimmed"
+# 变化记录的版本，redis被清空或主从切换丢失数据后重新生成，版本变化时进程需要完整重建索引
+CHANGES_EPOCH_KEY = "house_search_changes_epoch"
+
+# 连续的汉字切分为相邻两个字的词，单独的一个汉字作为一个词；字母与数字按单词切分
+_TOKEN_RE = re.compile(u"[一-鿿]+|[a-z0-9]+")
+
+# 记录房屋变化，超出上限时删除最早的变化
+# KEYS: CHANGES_KEY, CHANGES_SEQ_KEY, CHANGES_TRIMMED_KEY; ARGV: 变化记录上限, 房屋编号...
+_record = redis_store.register_script("""
+for i = 2, #ARGV do
+    redis.call('zadd', KEYS[1], redis.call('incr', KEYS[2]), ARGV[i])
+end
+local extra = redis.call('zcard', KEYS[1]) - tonumber(ARGV[1])
+if extra > 0 then
+    local last = redis.call('zrange', KEYS[1], extra - 1, extra - 1, 'withscores')
+    redis.call('set', KEYS[3], last[2])
+    redis.call('zremrangebyrank', KEYS[1], 0, extra - 1)
+end
+return 1
+""")
+
+
+def tokenize(text):
+    """切分标题与地址，返回去重后的词"""
+    if isinstance(text, str):
+        text = text.decode("utf-8")
+    tokens = set()
+    for word in _TOKEN_RE.findall(text.lower()):
+        if u"一" <= word[0] <= u"鿿" and len(word) > 1:
+            tokens.update(word[i:i + 2] for i in xrange(len(word) - 1))
+        else:
+            tokens.add(word)
+    return tokens
+
+
+def facility_mask(facility_ids):
+    """设施编号转换为位图，编号超出范围时抛出ValueError"""
+    mask = 0
+    for facility_id in facility_ids:
+        if not 0 <= facility_id < constants.HOUSE_FACILITY_BITS:
+            raise ValueError("facility id out of range: %s" % facility_id)
+        mask |= 1 << facility_id
+    return mask
+
+
+class HouseIndex(object):
+    """房屋的倒排索引与属性，属性按房屋编号保存在数组中，区域编号为0表示房屋不存在"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # 词 -> 房屋编号数组
+        self.postings = {}
+        # 单个汉字 -> 包含这个字的两字词，用于查询单个汉字
+        self.chars = {}
+        # 区域编号 -> 房屋编号数组，只有区域条件时不需要遍历全部房屋
+        self.areas = {}
+        self.area_ids = array("i")
+        self.prices = array("i")
+        self.capacities = array("i")
+        self.room_counts = array("i")
+        self.order_counts = array("i")
+        self.create_times = array("l")
+        self.facility_masks = array("L")
+        # 标题与地址的哈希，内容变化时才重新切分
+        self.text_hashes = array("l")
+        # 已处理的最大变化序号，None表示还没有建立
+        self.seq = None
+        # 建立索引时变化记录的版本
+        self.epoch = None
+
+    def __len__(self):
+        return len(self.area_ids) - self.area_ids.count(0)
+
+    def _grow(self, house_id):
+        extra = house_id + 1 - len(self.area_ids)
+        if extra > 0:
+            for column in (self.area_ids, self.prices, self.capacities, self.room_counts, self.order_counts,
+                           self.create_times, self.facility_masks, self.text_hashes):
+                column.extend([0] * extra)
+
+    def _add_postings(self, house_id, tokens):
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = array("i")
+                if len(token) == 2 and u"一" <= token[0] <= u"鿿":
+                    for char in token:
+                        self.chars.setdefault(char, set()).add(token)
+            posting.append(house_id)
+
+    def _remove_postings(self, house_id):
+        """删除房屋的所有词，需要遍历全部词，只在标题或地址被修改时发生"""
+        for posting in self.postings.itervalues():
+            if house_id in posting:
+                posting.remove(house_id)
+
+    def add(self, house_id, area_id, title, address, price, capacity, room_count, order_count, create_time,
+            facilities):
+        """加入或更新房屋，create_time为datetime，facilities为设施位图"""
+        self._grow(house_id)
+        text = u"%s %s" % (title, address)
+        text_hash = hash(text)
+        old_area_id = self.area_ids[house_id]
+        if old_area_id == 0 or self.text_hashes[house_id] != text_hash:
+            if old_area_id != 0:
+                self._remove_postings(house_id)
+            self._add_postings(house_id, tokenize(text))
+            self.text_hashes[house_id] = text_hash
+        if old_area_id != area_id:
+            if old_area_id != 0:
+                self.areas[old_area_id].remove(house_id)
+            self.areas.setdefault(area_id, array("i")).append(house_id)
+        self.area_ids[house_id] = area_id
+        self.prices[house_id] = price or 0
+        self.capacities[house_id] = capacity or 0
+        self.room_counts[house_id] = room_count or 0
+        self.order_counts[house_id] = order_count or 0
+        self.create_times[house_id] = calendar.timegm(create_time.timetuple())
+        self.facility_masks[house_id] = facilities
+
+    def remove(self, house_id):
+        """房屋已不存在"""
+        if house_id < len(self.area_ids) and self.area_ids[house_id] != 0:
+            self._remove_postings(house_id)
+            self.areas[self.area_ids[house_id]].remove(house_id)
+            self.area_ids[house_id] = 0
+
+    def _posting(self, token):
+        """词对应的房屋编号集合，单个汉字合并所有包含它的两字词"""
+        posting = set(self.postings.get(token, ()))
+        if len(token) == 1 and token in self.chars:
+            for bigram in self.chars[token]:
+                posting.update(self.postings[bigram])
+        return posting
+
+    def search(self, query=u"", area_id=None, min_price=None, max_price=None, min_capacity=None, min_rooms=None,
+               facilities=0, excluded=(), sort_key="new", page=1, capacity=constants.HOUSE_LIST_PAGE_CAPACITY):
+        """查询同时满足所有条件的房屋，返回(这一页的房屋编号, 总页数)
+
+        query中的每个词都需要出现，价格单位为分，facilities为必须具备的设施位图，excluded为需要排除的房屋编号
+        """
+        # 从最小的候选集合开始，其它条件逐个检查
+        candidates = None
+        tokens = tokenize(query) if query else ()
+        for posting in sorted((self._posting(token) for token in tokens), key=len):
+            candidates = posting if candidates is None else candidates & posting
+            if not candidates:
+                return [], 0
+        if area_id:
+            if candidates is None:
+                candidates = self.areas.get(area_id, ())
+                area_id = None
+        elif candidates is None:
+            candidates = xrange(1, len(self.area_ids))
+
+        # 每个条件过滤一遍，逐个检查比对每个房屋调用多个函数快
+        area_ids, prices, capacities, room_counts, masks = \
+            self.area_ids, self.prices, self.capacities, self.room_counts, self.facility_masks
+        if area_id:
+            matched = [house_id for house_id in candidates if area_ids[house_id] == area_id]
+        else:
+            matched = [house_id for house_id in candidates if area_ids[house_id] != 0]
+        if min_price is not None:
+            matched = [house_id for house_id in matched if prices[house_id] >= min_price]
+        if max_price is not None:
+            matched = [house_id for house_id in matched if prices[house_id] <= max_price]
+        if min_capacity:
+            matched = [house_id for house_id in matched if capacities[house_id] >= min_capacity]
+        if min_rooms:
+            matched = [house_id for house_id in matched if room_counts[house_id] >= min_rooms]
+        if facilities:
+            matched = [house_id for house_id in matched if masks[house_id] & facilities == facilities]
+        if excluded:
+            matched = [house_id for house_id in matched if house_id not in excluded]
+
+        # 与房屋列表相同的排序条件，相同时新发布的在前
+        if 'booking' == sort_key:
+            order_counts = self.order_counts
+            key = lambda house_id: (-order_counts[house_id], -house_id)
+        elif 'price-inc' == sort_key:
+            key = lambda house_id: (prices[house_id], -house_id)
+        elif 'price-des' == sort_key:
+            key = lambda house_id: (-prices[house_id], -house_id)
+        else:
+            create_times = self.create_times
+            key = lambda house_id: (-create_times[house_id], -house_id)
+        total_page = (len(matched) + capacity - 1) / capacity
+        # 只需要排出前几页，不需要排序全部结果
+        top = heapq.nsmallest(page * capacity, matched, key=key)
+        return top[(page - 1) * capacity:], total_page
+
+    def load(self, house_ids=None, batch_size=10000):
+        """从mysql读取房屋加入索引，house_ids为None时读取全部房屋，读取不到的房屋从索引中删除"""
+        query = db.session.query(House.id, House.area_id, House.title, House.address, House.price, House.capacity,
+                                 House.room_count, House.order_count, House.create_time, House.facility_mask)
+        last_id = 0
+        while True:
+            if house_ids is None:
+                rows = query.filter(House.id > last_id).order_by(House.id.asc()).limit(batch_size).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+            else:
+                batch, house_ids = house_ids[:batch_size], house_ids[batch_size:]
+                if not batch:
+                    break
+                rows = query.filter(House.id.in_(batch)).all()
+                for house_id in set(batch) - set(row[0] for row in rows):
+                    self.remove(house_id)
+            for row in rows:
+                self.add(*row)
+
+    def build(self):
+        """从mysql完整建立索引"""
+        # 版本不存在说明redis的数据丢失过，生成新的版本，所有进程都会重建
+        pipe = redis_store.pipeline(transaction=False)
+        pipe.setnx(CHANGES_EPOCH_KEY, uuid.uuid4().hex)
+        pipe.get(CHANGES_EPOCH_KEY)
+        pipe.get(CHANGES_SEQ_KEY)
+        _, epoch, seq = pipe.execute()
+        # 先记下序号再读取mysql，读取期间发生的变化下次同步时会再处理一次
+        self.reset()
+        self.load()
+        self.seq = int(seq or 0)
+        self.epoch = epoch
+
+    def sync(self):
+        """读取上次同步后的变化增量更新索引，变化记录已被删除、版本变化或还没有建立时不修改索引，返回False"""
+        if self.seq is None:
+            return False
+        pipe = redis_store.pipeline(transaction=False)
+        pipe.get(CHANGES_EPOCH_KEY)
+        pipe.get(CHANGES_SEQ_KEY)
+        pipe.get(CHANGES_TRIMMED_KEY)
+        pipe.zrangebyscore(CHANGES_KEY, "(%d" % self.seq, "+inf", withscores=True)
+        epoch, seq, trimmed, changes = pipe.execute()
+        seq, trimmed = int(seq or 0), int(trimmed or 0)
+        if epoch != self.epoch or seq < self.seq or trimmed > self.seq:
+            return False
+        if changes:
+            self.load([int(house_id) for house_id, _ in changes])
+            self.seq = int(changes[-1][1])
+        return True
+
+
+# 本进程当前使用的索引，完整重建时在后台线程中建立新的索引，建立完成后替换
+_index = HouseIndex()
+_lock = threading.Lock()
+_building = False
+
+
+def _build(app):
+    """后台线程中完整建立索引，不持有锁，完成后替换当前的索引"""
+    global _index, _building
+    with app.app_context():
+        try:
+            index = HouseIndex()
+            index.build()
+            with _lock:
+                _index = index
+        except Exception as e:
+            app.logger.error(e)
+        finally:
+            db.session.remove()
+            with _lock:
+                _building = False
+
+
+def _search_mysql(query=u"", area_id=None, min_price=None, max_price=None, min_capacity=None, min_rooms=None,
+                  facilities=0, excluded=(), sort_key="new", page=1, capacity=constants.HOUSE_LIST_PAGE_CAPACITY):
+    """索引还没有建立时直接查询mysql，关键词按空格分开，每个词都需要出现在标题或地址中，返回值与HouseIndex.search相同"""
+    params_filter = []
+    for word in query.split():
+        pattern = u"%%%s%%" % word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params_filter.append(db.or_(House.title.like(pattern, escape="\\"),
+                                    House.address.like(pattern, escape="\\")))
+    if area_id:
+        params_filter.append(House.area_id == area_id)
+    if min_price is not None:
+        params_filter.append(House.price >= min_price)
+    if max_price is not None:
+        params_filter.append(House.price <= max_price)
+    if min_capacity:
+        params_filter.append(House.capacity >= min_capacity)
+    if min_rooms:
+        params_filter.append(House.room_count >= min_rooms)
+    if facilities:
+        params_filter.append(House.facility_mask.op("&")(facilities) == facilities)
+    if excluded:
+        params_filter.append(House.id.notin_(excluded))
+    # 与索引相同的排序条件，相同时新发布的在前
+    if 'booking' == sort_key:
+        order = (House.order_count.desc(), House.id.desc())
+    elif 'price-inc' == sort_key:
+        order = (House.price.asc(), House.id.desc())
+    elif 'price-des' == sort_key:
+        order = (House.price.desc(), House.id.desc())
+    else:
+        order = (House.create_time.desc(), House.id.desc())
+    houses_page = db.session.query(House.id).filter(*params_filter).order_by(*order).paginate(page, capacity, False)
+    return [house_id for house_id, in houses_page.items], houses_page.pages
+
+
+def search_houses(**conditions):
+    """同步本进程的索引后查询，条件见HouseIndex.search
+
+    需要完整重建时启动后台线程建立新的索引，建立期间使用之前的索引查询，
+    进程刚启动还没有任何索引时查询mysql
+    """
+    global _building
+    with _lock:
+        if _index.sync():
+            return _index.search(**conditions)
+        if not _building:
+            _building = True
+            builder = threading.Thread(target=_build, args=(current_app._get_current_object(),))
+            builder.daemon = True
+            builder.start()
+        if _index.seq is not None:
+            return _index.search(**conditions)
+    return _search_mysql(**conditions)
+
+
+def houses_changed(house_ids):
+    """房屋数据修改的事务提交后调用，通知各进程更新索引"""
+    try:
+        _record(keys=[CHANGES_KEY, CHANGES_SEQ_KEY, CHANGES_TRIMMED_KEY],
+                args=[constants.HOUSE_SEARCH_MAX_CHANGES] + list(house_ids))
+    except Exception as e:
+        current_app.logger.error(e)
@@ -0,0 +1,149 @@
+# -*- coding:utf-8 -*-
+
+from flask_session.sessions import RedisSession, RedisSessionInterface, total_seconds
+from itsdangerous import URLSafeTimedSerializer, BadData
+
+
+def _loads_first(name):
+    """包装dict的方法，调用前先从redis加载session数据"""
+    def method(self, *args, **kwargs):
+        self.load()
+        return getattr(super(LazyRedisSession, self), name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+class LazyRedisSession(RedisSession):
+    """第一次读写时才从redis加载数据的session，视图不使用session时不会访问redis"""
+
+    def __init__(self, loader=None, sid=None, permanent=None):
+        self._loader = loader
+        # 数据是否已从redis加载(新建的session不需要加载)
+        self.loaded = loader is None
+        # redis中数据剩余的有效期，None表示新建的session
+        self.ttl = None
+        super(LazyRedisSession, self).__init__(sid=sid, permanent=permanent)
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        data, self.ttl = self._loader()
+        self._loader = None
+        if data:
+            # 直接写入dict，不触发modified标记
+            dict.update(self, data)
+
+    __getitem__ = _loads_first('__getitem__')
+    __contains__ = _loads_first('__contains__')
+    __iter__ = _loads_first('__iter__')
+    __len__ = _loads_first('__len__')
+    get = _loads_first('get')
+    has_key = _loads_first('has_key')
+    keys = _loads_first('keys')
+    values = _loads_first('values')
+    items = _loads_first('items')
+    iterkeys = _loads_first('iterkeys')
+    itervalues = _loads_first('itervalues')
+    iteritems = _loads_first('iteritems')
+    copy = _loads_first('copy')
+    __setitem__ = _loads_first('__setitem__')
+    __delitem__ = _loads_first('__delitem__')
+    setdefault = _loads_first('setdefault')
+    pop = _loads_first('pop')
+    popitem = _loads_first('popitem')
+    update = _loads_first('update')
+    clear = _loads_first('clear')
+
+
+class LazyRedisSessionInterface(RedisSessionInterface):
+    """按需加载、修改后才写回redis的session接口
+
+    可选地在登录后签发无状态的签名令牌(auth cookie)，login_required只校验令牌，
+    已登录用户的只读请求完全不访问redis。
+    """
+
+    session_class = LazyRedisSession
+
+    def __init__(self, redis, key_prefix, use_signer=False, permanent=True,
+                 auth_cookie_name=None):
+        super(LazyRedisSessionInterface, self).__init__(redis, key_prefix, use_signer, permanent)
+        # 为None时不签发无状态令牌
+        self.auth_cookie_name = auth_cookie_name
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if not sid:
+            return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
+        if self.use_signer:
+            signer = self._get_signer(app)
+            if signer is None:
+                return None
+            try:
+                sid = signer.unsign(sid).decode()
+            except BadData:
+                return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
+
+        def loader():
+            # 数据和剩余有效期在一次往返中取回
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.get(self.key_prefix + sid)
+            pipe.ttl(self.key_prefix + sid)
+            val, ttl = pipe.execute()
+            if val is None:
+                return None, None
+            try:
+                return self.serializer.loads(val), ttl
+            except Exception:
+                return None, None
+
+        return self.session_class(loader, sid=sid)
+
+    def save_session(self, app, session, response):
+        # 本次请求没有使用session，或者只读取了session，都不需要写回
+        if not session.loaded:
+            return
+        if not session.modified:
+            # 新建后未写入数据的session不保存
+            if session.ttl is None:
+                return
+            # 只读的session在有效期过半后续期一次，保持原来的滑动过期行为
+            if session.ttl > total_seconds(app.permanent_session_lifetime) / 2:
+                return
+            session.modified = True
+        super(LazyRedisSessionInterface, self).save_session(app, session, response)
+        if self.auth_cookie_name:
+            self.save_auth_cookie(app, session, response)
+
+    def save_auth_cookie(self, app, session, response):
+        """session中的登录信息变化时，同步签发或删除无状态令牌"""
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        user_id = session.get('user_id')
+        if user_id is None:
+            response.delete_cookie(self.auth_cookie_name, domain=domain, path=path)
+            return
+        token = get_auth_serializer(app).dumps({'user_id': user_id, 'name': session.get('name')})
+        response.set_cookie(self.auth_cookie_name, token,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=True, domain=domain, path=path,
+                            secure=self.get_cookie_secure(app))
+
+
+def get_auth_serializer(app):
+    """签发/校验无状态登录令牌的序列化器"""
+    return URLSafeTimedSerializer(app.secret_key, salt='ihome-auth')
+
+
+def load_auth_token(app, request):
+    """校验请求中的无状态登录令牌，返回令牌中的用户信息，无效时返回None"""
+    cookie_name = app.config.get('SESSION_AUTH_COOKIE_NAME')
+    if not app.config.get('SESSION_STATELESS_AUTH') or not cookie_name:
+        return None
+    token = request.cookies.get(cookie_name)
+    if not token:
+        return None
+    try:
+        return get_auth_serializer(app).loads(token, max_age=total_seconds(app.permanent_session_lifetime))
+    except BadData:
+        return None
@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+
+import os
+import stat
+import gzip
+import hashlib
+import mimetypes
+import threading
+from cStringIO import StringIO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class StaticFile(object):
+    """缓存在内存中的一个静态文件，包括预先压缩好的内容"""
+
+    def __init__(self, path, mtime, data, gzip_data=None, brotli_data=None):
+        self.path = path
+        self.mtime = mtime
+        self.data = data
+        self.gzip_data = gzip_data
+        self.brotli_data = brotli_data
+        self.etag = hashlib.md5(data).hexdigest()
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    def encoded(self, accept_encodings):
+        """按客户端支持的压缩格式返回(内容, Content-Encoding)"""
+        if self.brotli_data is not None and accept_encodings["br"]:
+            return self.brotli_data, "br"
+        if self.gzip_data is not None and accept_encodings["gzip"]:
+            return self.gzip_data, "gzip"
+        return self.data, None
+
+    def etag_for(self, encoding):
+        """压缩后的内容不同，每种Content-Encoding使用不同的ETag，未压缩时为内容的md5"""
+        return "%s-%s" % (self.etag, encoding) if encoding else self.etag
+
+
+def gzip_compress(data):
+    out = StringIO()
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class StaticFileCache(object):
+    """进程内的静态文件缓存
+
+    每次访问只做一次os.stat，文件修改时间变化后重新读取；
+    磁盘上存在比源文件新的.gz/.br预压缩文件时直接使用，否则在加载时压缩一次。
+    """
+
+    # 小于该字节数的文件不压缩
+    min_compress_size = 512
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """返回path对应的StaticFile，文件不存在或不是普通文件(如目录)时返回None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        mtime = st.st_mtime
+        cached = self._files.get(path)
+        if cached is not None and cached.mtime == mtime:
+            return cached
+        cached = self.load(path, mtime)
+        with self._lock:
+            self._files[path] = cached
+        return cached
+
+    def load(self, path, mtime):
+        data = _read(path)
+        gzip_data = brotli_data = None
+        if len(data) >= self.min_compress_size:
+            gzip_data = self.precompressed(path + ".gz", mtime)
+            if gzip_data is None:
+                gzip_data = gzip_compress(data)
+            if brotli is not None:
+                brotli_data = self.precompressed(path + ".br", mtime)
+                if brotli_data is None:
+                    brotli_data = brotli.compress(data)
+        return StaticFile(path, mtime, data, gzip_data, brotli_data)
+
+    @staticmethod
+    def precompressed(path, mtime):
+        """读取构建时生成的预压缩文件，不存在或比源文件旧时返回None"""
+        try:
+            if os.stat(path).st_mtime >= mtime:
+                return _read(path)
+        except OSError:
+            pass
+        return None
+
+
+static_cache = StaticFileCache()
@@ -0,0 +1,70 @@
+# -*- coding:utf-8 -*-
+# 发送短信验证码前的校验，在一次lua脚本调用中完成
+
+from ihome import redis_store, constants
+from ihome.utils.mobiles import REGISTERED_MOBILES_KEY, bloom_offsets
+
+
+# 返回值：校验结果
+IMAGE_CODE_EXPIRED = -1  # 图片验证码不存在或已过期
+IMAGE_CODE_MISMATCH = -2  # 图片验证码不一致
+SEND_TOO_OFTEN = -4  # 距离上次发送的时间太短
+SMS_CODE_SAVED = 1  # 已保存短信验证码，手机号一定未注册
+SMS_CODE_UNCHECKED = 0  # 手机号可能已注册或过滤器不存在，没有保存短信验证码，确认未注册后调用save_sms_code保存
+
+# KEYS: 图片验证码, 已注册手机号的布隆过滤器, 短信验证码, 发送间隔标记
+# ARGV: 用户输入的图片验证码(小写), 短信验证码, 短信验证码有效期, 发送间隔, 手机号在过滤器中对应的位...
+_send_sms_code = redis_store.register_script("""
+local real_image_code = redis.call('get', KEYS[1])
+if not real_image_code then
+    return -1
+end
+redis.call('del', KEYS[1])
+if string.lower(real_image_code) ~= ARGV[1] then
+    return -2
+end
+if redis.call('exists', KEYS[4]) == 1 then
+    return -4
+end
+if redis.call('exists', KEYS[2]) == 0 then
+    return 0
+end
+local registered = true
+for i = 5, #ARGV do
+    if redis.call('getbit', KEYS[2], ARGV[i]) == 0 then
+        registered = false
+        break
+    end
+end
+if registered then
+    return 0
+end
+redis.call('setex', KEYS[3], ARGV[3], ARGV[2])
+redis.call('setex', KEYS[4], ARGV[4], 1)
+return 1
+""")
+
+# 确认手机号未注册后保存短信验证码，期间同一手机号的其它请求可能已经保存过
+# KEYS: 短信验证码, 发送间隔标记; ARGV: 短信验证码, 短信验证码有效期, 发送间隔
+_save_sms_code = redis_store.register_script("""
+if redis.call('exists', KEYS[2]) == 1 then
+    return -4
+end
+redis.call('setex', KEYS[1], ARGV[2], ARGV[1])
+redis.call('setex', KEYS[2], ARGV[3], 1)
+return 1
+""")
+
+
+def check_and_save_sms_code(image_code_id, image_code, mobile, sms_code):
+    """取出并删除图片验证码进行比较，检查发送间隔，过滤器确认手机号未注册时保存短信验证码"""
+    return _send_sms_code(
+        keys=['ImageCode_' + image_code_id, REGISTERED_MOBILES_KEY, 'SMSCode_' + mobile, 'SendSMSCode_' + mobile],
+        args=[image_code.lower(), sms_code, constants.SMS_CODE_REDIS_EXPIRES,
+              constants.SEND_SMS_CODE_INTERVAL] + bloom_offsets(mobile))
+
+
+def save_sms_code(mobile, sms_code):
+    """查询mysql确认手机号未注册后保存短信验证码，返回SMS_CODE_SAVED或SEND_TOO_OFTEN"""
+    return _save_sms_code(keys=['SMSCode_' + mobile, 'SendSMSCode_' + mobile],
+                          args=[sms_code, constants.SMS_CODE_REDIS_EXPIRES, constants.SEND_SMS_CODE_INTERVAL])
@@ -1,12 +1,49 @@
 # -*- coding:utf-8 -*-
 
-from flask import Blueprint, current_app, make_response, session
+from flask import Blueprint, current_app, make_response, request, abort, session
+from flask.helpers import safe_join
 from flask_wtf import csrf
+from ihome.utils.static_cache import static_cache
+from ihome.utils.assets import DIST_DIR, load_manifest
 
 
 html = Blueprint("html", __name__)
 
 
+def send_cached_file(file_name, max_age=0):
+    """从进程内缓存返回静态文件，支持gzip/brotli压缩与ETag协商"""
+    static_file = static_cache.get(safe_join(current_app.static_folder, file_name))
+    if static_file is None:
+        abort(404)
+
+    # 先按客户端支持的压缩格式选择内容，再用这种格式的ETag协商
+    data, encoding = static_file.encoded(request.accept_encodings)
+    etag = static_file.etag_for(encoding)
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        response = make_response(data)
+        response.headers["Content-Type"] = static_file.mimetype
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.set_etag(etag)
+    if max_age:
+        response.headers["Cache-Control"] = "public, max-age=%d" % max_age
+    else:
+        # html引用的资源可能变化，每次都需要用ETag向服务器确认
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@html.route("/static/%s/<path:file_name>" % DIST_DIR)
+def dist_file(file_name):
+    """构建后的js/css文件名带有内容哈希，可以永久缓存"""
+    response = send_cached_file(DIST_DIR + "/" + file_name, current_app.config["DIST_FILE_MAX_AGE"])
+    response.headers["Cache-Control"] += ", immutable"
+    return response
+
+
 @html.route("/<regex('.*'):file_name>")
 def html_file(file_name):
 
@@ -14,13 +51,24 @@ def html_file(file_name):
         file_name = "index.html"
 
     if file_name != "favicon.ico":
-        file_name = "html/" + file_name
-
+        # 构建过静态资源时，返回引用了合并文件的html
+        manifest = load_manifest(current_app.static_folder, static_cache) \
+            if current_app.config["ASSETS_USE_MANIFEST"] else None
+        if manifest and file_name in manifest["html"]:
+            file_name = manifest["html"][file_name]
+        else:
+            file_name = "html/" + file_name
+        response = send_cached_file(file_name)
+    else:
+        response = send_cached_file(file_name, current_app.config["STATIC_FILE_MAX_AGE"])
 
-    csrf_token = csrf.generate_csrf()
-    response = make_response(current_app.send_static_file(file_name))
-
-    response.set_cookie("csrf_token", csrf_token)
+    # 客户端还没有csrf_token，或者session中的csrf_token已不存在(session过期或redis数据丢失)时重新生成，
+    # session是延迟加载的，没有session cookie的客户端不会访问redis
+    field_name = current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token")
+    if "csrf_token" not in request.cookies or field_name not in session:
+        csrf_token = csrf.generate_csrf()
+        # 签名的csrf_token有时效，cookie在时效过半时过期，下次打开页面会重新生成
+        time_limit = current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+        response.set_cookie("csrf_token", csrf_token, max_age=time_limit / 2 if time_limit else None)
 
     return response
-
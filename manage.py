@@ -5,12 +5,20 @@ from ihome import create_app, db
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from ihome import models
+from ihome.commands import bench_manager, assets_manager, users_manager, orders_manager, houses_manager, \
+    cache_manager
 
 app = create_app("development")
 
 Migrate(app, db)
 manager = Manager(app)
 manager.add_command("db", MigrateCommand)
+manager.add_command("bench", bench_manager)
+manager.add_command("assets", assets_manager)
+manager.add_command("users", users_manager)
+manager.add_command("orders", orders_manager)
+manager.add_command("houses", houses_manager)
+manager.add_command("cache", cache_manager)
 
 
 if __name__ == '__main__':
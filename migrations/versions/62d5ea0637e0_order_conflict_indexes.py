@@ -0,0 +1,28 @@
+"""order conflict indexes
+
+Revision ID: 62d5ea0637e0
+Revises: 3a8a2b6bb6a0
+Create Date: 2026-10-19 14:05:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '62d5ea0637e0'
+down_revision = '3a8a2b6bb6a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_ih_order_info_house_status_dates', 'ih_order_info',
+                    ['house_id', 'status', 'begin_date', 'end_date'], unique=False)
+    op.create_index('ix_ih_order_info_status_dates', 'ih_order_info',
+                    ['status', 'begin_date', 'end_date', 'house_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ih_order_info_status_dates', table_name='ih_order_info')
+    op.drop_index('ix_ih_order_info_house_status_dates', table_name='ih_order_info')
@@ -0,0 +1,28 @@
+"""house facility mask
+
+Revision ID: 9c4e7b21d5a3
+Revises: 62d5ea0637e0
+Create Date: 2026-10-19 16:20:41.731024
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e7b21d5a3'
+down_revision = '62d5ea0637e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ih_house_info', sa.Column('facility_mask', sa.BigInteger(), server_default='0', nullable=False))
+    # 从ih_house_facility回填已有房屋的设施位图，每个设施只出现一次，求和与按位或相同
+    op.execute("UPDATE ih_house_info SET facility_mask = ("
+               "SELECT COALESCE(SUM(1 << facility_id), 0) FROM ih_house_facility "
+               "WHERE ih_house_facility.house_id = ih_house_info.id AND facility_id < 63)")
+
+
+def downgrade():
+    op.drop_column('ih_house_info', 'facility_mask')
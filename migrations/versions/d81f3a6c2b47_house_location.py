@@ -0,0 +1,26 @@
+"""house location
+
+Revision ID: d81f3a6c2b47
+Revises: 9c4e7b21d5a3
+Create Date: 2026-10-19 17:02:13.508316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f3a6c2b47'
+down_revision = '9c4e7b21d5a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('ih_house_info', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('ih_house_info', sa.Column('latitude', sa.Float(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('ih_house_info', 'latitude')
+    op.drop_column('ih_house_info', 'longitude')
@@ -0,0 +1,108 @@
+# -*- coding:utf-8 -*-
+# 限流的滑动窗口脚本与rate_limit装饰器，需要本地的redis: python -m unittest discover tests
+
+import json
+import unittest
+
+import redis
+
+from ihome import create_app, redis_store
+from ihome.utils import ratelimit
+from ihome.utils.commons import rate_limit
+from ihome.utils.response_code import RET
+
+
+def _redis_available():
+    try:
+        return redis_store.ping()
+    except redis.RedisError:
+        return False
+
+
+@unittest.skipUnless(_redis_available(), "redis is not available")
+class SlidingWindowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.key = "RateLimit_test_sliding"
+        self.clear()
+
+    def tearDown(self):
+        self.clear()
+
+    def clear(self):
+        for key in redis_store.scan_iter("RateLimit_test_*"):
+            redis_store.delete(key)
+
+    def run_script(self, now, rules):
+        """rules: ((键, 窗口毫秒数, 上限), ...)"""
+        args = [now]
+        for _, window, limit in rules:
+            args.extend([window, limit])
+        return ratelimit._sliding_window(keys=[key for key, _, _ in rules], args=args)
+
+    def test_counts_until_limit(self):
+        for _ in xrange(3):
+            self.assertEqual(self.run_script(10500, [(self.key, 1000, 3)]), 0)
+        self.assertEqual(self.run_script(10500, [(self.key, 1000, 3)]), 1)
+        # 超限的请求不计数
+        self.assertEqual(redis_store.get(self.key + ":10"), "3")
+
+    def test_previous_window_is_weighted(self):
+        redis_store.set(self.key + ":9", 4)
+        # 当前窗口过去了一半，前一个窗口折算为2个
+        self.assertEqual(self.run_script(10500, [(self.key, 1000, 3)]), 0)
+        self.assertEqual(self.run_script(10500, [(self.key, 1000, 3)]), 1)
+        # 前一个窗口快结束时折算的计数接近0
+        self.assertEqual(self.run_script(11999, [(self.key, 1000, 3)]), 0)
+
+    def test_exceeded_rule_blocks_all_counters(self):
+        other = "RateLimit_test_other"
+        redis_store.set(other + ":10", 1)
+        self.assertEqual(self.run_script(10500, [(self.key, 1000, 5), (other, 1000, 1)]), 2)
+        self.assertIsNone(redis_store.get(self.key + ":10"))
+
+    def test_counters_expire(self):
+        self.run_script(10500, [(self.key, 1000, 3)])
+        self.assertTrue(0 < redis_store.pttl(self.key + ":10") <= 2000)
+
+    def test_check_rate_limits_returns_dimension(self):
+        rules = (("ip", 60, 2), ("mobile", 60, 5))
+        values = {"ip": "test-ip", "mobile": "13800000000"}
+        scope = "test_scope"
+        self.assertIsNone(ratelimit.check_rate_limits(scope, rules, values))
+        self.assertIsNone(ratelimit.check_rate_limits(scope, rules, values))
+        self.assertEqual(ratelimit.check_rate_limits(scope, rules, values), "ip")
+        # 没有值的维度不适用
+        self.assertIsNone(ratelimit.check_rate_limits(scope, (("mobile", 60, 1),), {"ip": "x"}))
+
+
+@unittest.skipUnless(_redis_available(), "redis is not available")
+class RateLimitDecoratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app("development")
+        self.clear()
+
+    def tearDown(self):
+        self.clear()
+
+    def clear(self):
+        for key in redis_store.scan_iter("RateLimit_test_*"):
+            redis_store.delete(key)
+
+    def test_rejects_with_reqerr_without_calling_view(self):
+        calls = []
+
+        @rate_limit("test_decorator", (("ip", 60, 2),))
+        def view():
+            calls.append(1)
+            return "ok"
+
+        with self.app.test_request_context("/", method="POST", data=json.dumps({"mobile": "13800000000"}),
+                                           content_type="application/json",
+                                           environ_base={"REMOTE_ADDR": "10.0.0.2"}):
+            self.assertEqual(view(), "ok")
+            self.assertEqual(view(), "ok")
+            resp = view()
+        self.assertEqual(json.loads(resp.data)["errno"], RET.REQERR)
+        self.assertEqual(len(calls), 2)